@@ -1,128 +1,114 @@
 """
 Рефакторированный Telegram бот для мерчантов Konvert2pay
+
+Импорт модуля не открывает соединение с MongoDB и не загружает обработчики:
+приложение собирает ``create_app``, экземпляр ``MerchantBot`` создаётся при
+первом обращении (``get_bot``), менеджеры базы и обработчики — при первом
+использовании, а индексы согласуются в ``post_init``.
 """
+from __future__ import annotations
+
+import asyncio
+import functools
 import logging
-from collections.abc import Iterable
-from typing import List, Sequence, Tuple, Union
-
-from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from config import BOT_TOKEN, LOG_LEVEL, LOG_FORMAT
-
-# Импорты новых модулей
-from db_utils import DatabaseManager, UserManager, InfoManager, OrderManager
-from keyboard_manager import KeyboardManager
-from constants import Messages, Buttons, CallbackData
-from states import UserState, StateManager
-from message_handlers import MessageHandlers
-from callback_handlers import CallbackHandlers
-from pymongo import ASCENDING
-
-# Настройка логирования
-logging.basicConfig(
-    format=LOG_FORMAT,
-    level=getattr(logging, LOG_LEVEL)
+import time
+from typing import TYPE_CHECKING, Optional
+
+# Точка отсчёта для измерения времени запуска: берётся до импорта модулей
+# бота, чтобы время их загрузки вошло в bot_startup_seconds (отсюда E402 ниже)
+_PROCESS_STARTED = time.perf_counter()
+
+from config import (  # noqa: E402
+    BOT_TOKEN, BULK_MAX_ROWS, CALLBACK_ENABLED, CALLBACK_HOST, CALLBACK_PORT, INDEX_BOOTSTRAP_MODE,
+    LOOP_MONITOR_ENABLED, METRICS_ENABLED, METRICS_HOST, METRICS_PORT, RECONCILE_ENABLED, STATS_DEFAULT_DAYS,
+    STATS_MAX_DAYS, USER_SEARCH_ENABLED,
 )
+from constants import Messages, Buttons  # noqa: E402
+from states import UserState, StateManager  # noqa: E402
+from deadline import with_deadline  # noqa: E402
+from metrics import Gauge, instrument_handler  # noqa: E402
+from shutdown import coordinator  # noqa: E402
+from tracing import trace_update  # noqa: E402
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import Application, ContextTypes
+    from db_utils import DatabaseManager
+
 logger = logging.getLogger(__name__)
 
+STARTUP_DURATION = Gauge("bot_startup_seconds", "Время от запуска процесса до готовности принимать обновления")
+
 class MerchantBot:
     """Основной класс бота для работы с мерчантами"""
     
-    def __init__(self):
-        # Инициализация менеджеров
-        self.db_manager = DatabaseManager()
-        self.user_manager = UserManager(self.db_manager)
-        self.info_manager = InfoManager(self.db_manager)
-        self.order_manager = OrderManager(self.db_manager)
-        self.keyboard_manager = KeyboardManager()
-        
-        # Инициализация обработчиков
-        self.message_handlers = MessageHandlers(self)
-        self.callback_handlers = CallbackHandlers(self)
-        
-        # Инициализация базы данных
-        self.init_database()
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+        # Соединение с MongoDB открывается при первом обращении к менеджерам
+        self._db_manager = db_manager
+        self.index_report = None
+
+    @functools.cached_property
+    def db_manager(self) -> DatabaseManager:
+        if self._db_manager is None:
+            from db_utils import DatabaseManager
 
-    @staticmethod
-    def _normalize_index_keys(keys: Union[str, Sequence[Union[str, Tuple[str, int]]]]) -> List[Tuple[str, int]]:
-        """Привести формат ключей индекса к списку кортежей."""
+            self._db_manager = DatabaseManager()
+        return self._db_manager
 
-        if isinstance(keys, str):
-            return [(keys, ASCENDING)]
+    @functools.cached_property
+    def user_manager(self):
+        from db_utils import UserManager
 
-        normalized: List[Tuple[str, int]] = []
-        for key in keys:
-            if isinstance(key, str):
-                normalized.append((key, ASCENDING))
-            elif isinstance(key, Iterable):
-                key_tuple = tuple(key)
-                if len(key_tuple) != 2:
-                    raise ValueError(f"Некорректная спецификация индекса: {key!r}")
-                normalized.append((key_tuple[0], key_tuple[1]))
-            else:
-                raise TypeError(f"Некорректный тип ключа индекса: {type(key)!r}")
+        return UserManager(self.db_manager)
 
-        return normalized
+    @functools.cached_property
+    def info_manager(self):
+        from db_utils import InfoManager
 
-    @staticmethod
-    def ensure_index(collection, keys: Union[str, Sequence[Union[str, Tuple[str, int]]]], **kwargs) -> str:
-        """Создать индекс, если эквивалентный ещё не существует."""
+        return InfoManager(self.db_manager)
 
-        normalized_keys = MerchantBot._normalize_index_keys(keys)
-        desired_options = {k: v for k, v in kwargs.items() if k != "name"}
+    @functools.cached_property
+    def order_manager(self):
+        from db_utils import OrderManager
 
-        for index in collection.list_indexes():
-            existing_keys = [(key, direction) for key, direction in index["key"].items()]
-            if existing_keys != normalized_keys:
-                continue
+        return OrderManager(self.db_manager)
 
-            options_match = all(index.get(opt_key) == opt_value for opt_key, opt_value in desired_options.items())
-            if options_match:
-                return index.get("name")
+    @functools.cached_property
+    def user_search(self):
+        from user_search import UserSearchIndex
 
-        create_kwargs = {k: v for k, v in kwargs.items() if v is not None}
-        return collection.create_index(normalized_keys, **create_kwargs)
+        return UserSearchIndex(self.user_manager)
+
+    @functools.cached_property
+    def keyboard_manager(self):
+        from keyboard_manager import KeyboardManager
+
+        return KeyboardManager()
+
+    @functools.cached_property
+    def message_handlers(self):
+        from message_handlers import MessageHandlers
+
+        return MessageHandlers(self)
+
+    @functools.cached_property
+    def callback_handlers(self):
+        from callback_handlers import CallbackHandlers
+
+        return CallbackHandlers(self)
+
+    def close_database(self):
+        """Закрыть соединение с MongoDB, если оно было открыто"""
+        if self._db_manager is not None:
+            self._db_manager.close()
 
     def init_database(self):
-        """Инициализация базы данных"""
-        users = self.db_manager.get_collection("users")
-        merchant_settings = self.db_manager.get_collection("merchant_settings")
-        info_block = self.db_manager.get_collection("info_block")
-        order_counters = self.db_manager.get_collection("order_counters")
-
-        self.ensure_index(
-            users,
-            [("user_id", ASCENDING)],
-            name="users_user_id_unique_idx",
-            unique=True,
-            sparse=True,
-        )
-        self.ensure_index(
-            users,
-            [("username", ASCENDING)],
-            name="users_username_unique_idx",
-            unique=True,
-            sparse=True,
-        )
-        self.ensure_index(
-            merchant_settings,
-            [("user_id", ASCENDING)],
-            name="merchant_settings_user_id_unique_idx",
-            unique=True,
-            sparse=True,
-        )
-        self.ensure_index(
-            info_block,
-            [("_id", ASCENDING)],
-            name="info_block_id_unique_idx",
-            unique=True,
-        )
-        self.ensure_index(
-            order_counters,
-            [("order_id_tag", ASCENDING)],
-            name="order_counters_order_id_tag_unique_idx",
-            unique=True,
-        )
+        """Инициализация базы данных: заполнение username_keys и согласование индексов"""
+        from db_indexes import reconcile_indexes
+
+        self.user_manager.backfill_username_keys()
+        self.index_report = reconcile_indexes(self.db_manager)
+        return self.index_report
     
     # Методы для совместимости с существующим кодом
     def is_merchant(self, user_id: int) -> bool:
@@ -153,6 +139,10 @@ class MerchantBot:
         """Получить настройки мерчанта"""
         return self.user_manager.get_merchant_settings(user_id)
     
+    def get_info(self):
+        """Получить версию и содержимое информационного блока"""
+        return self.info_manager.get_info()
+    
     def get_info_content(self) -> str:
         """Получить содержимое информационного блока"""
         return self.info_manager.get_info_content()
@@ -177,11 +167,32 @@ class MerchantBot:
         """Получить пользователя по username"""
         return self.user_manager.get_user_by_username(username)
 
-# Создаем глобальный экземпляр бота
-bot_instance = MerchantBot()
+_bot: Optional[MerchantBot] = None
+
+def get_bot() -> MerchantBot:
+    """Экземпляр бота; создаётся при первом обращении"""
+    global _bot
+    if _bot is None:
+        _bot = MerchantBot()
+    return _bot
 
+def set_bot(merchant_bot: MerchantBot) -> None:
+    """Использовать заданный экземпляр бота (например, с другой базой данных)"""
+    global _bot
+    _bot = merchant_bot
+
+def __getattr__(name: str):
+    # Совместимость с кодом, обращавшимся к глобальному MerchantBot.bot_instance
+    if name == "bot_instance":
+        return get_bot()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@instrument_handler
+@trace_update
+@coordinator.guard_update
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
+    bot_instance = get_bot()
     user = update.effective_user
     username = user.username
     
@@ -198,8 +209,12 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message = Messages.WELCOME_REGULAR.format(username=username)
         await update.message.reply_text(message)
 
+@instrument_handler
+@trace_update
+@coordinator.guard_update
 async def infoedit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда для редактирования информационного блока (только для админов)"""
+    bot_instance = get_bot()
     user = update.effective_user
     username = user.username
     
@@ -211,8 +226,161 @@ async def infoedit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['current_state'] = UserState.WAITING_FOR_INFO_EDIT.value
     await update.message.reply_text("📝 Введите новое содержимое информационного блока:")
 
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+async def bulk_invoices_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Массовое создание инвойсов из CSV-файла (только для мерчантов)"""
+    bot_instance = get_bot()
+    if not bot_instance.is_merchant(update.effective_user.id):
+        await update.message.reply_text(Messages.ERROR_NOT_MERCHANT)
+        return
+
+    StateManager.clear_all_states(context)
+    context.user_data['current_state'] = UserState.WAITING_FOR_BULK_INVOICE_FILE.value
+    await update.message.reply_text(
+        Messages.BULK_INVOICE_UPLOAD.format(max_rows=BULK_MAX_ROWS),
+        reply_markup=bot_instance.keyboard_manager.get_main_menu_button(),
+    )
+
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+async def bulk_payouts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Массовая выплата из CSV-файла с проверкой и подтверждением (только для мерчантов)"""
+    bot_instance = get_bot()
+    if not bot_instance.is_merchant(update.effective_user.id):
+        await update.message.reply_text(Messages.ERROR_NOT_MERCHANT)
+        return
+
+    StateManager.clear_all_states(context)
+    context.user_data.pop('bulk_payout', None)
+    context.user_data['current_state'] = UserState.WAITING_FOR_BULK_PAYOUT_FILE.value
+    await update.message.reply_text(
+        Messages.BULK_PAYOUT_UPLOAD.format(max_rows=BULK_MAX_ROWS),
+        reply_markup=bot_instance.keyboard_manager.get_main_menu_button(),
+    )
+
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик документов: CSV-файлы массового создания инвойсов и выплат"""
+    await get_bot().message_handlers.handle_document(update, context)
+
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика инвойсов и выплат по магазинам: /stats [shop_id] [дней] (только для админов)"""
+    from stats_rollups import get_stats_rollups, render_shop, render_totals
+
+    bot_instance = get_bot()
+    if not bot_instance.is_admin(update.effective_user.username):
+        await update.message.reply_text(Messages.ERROR_NOT_ADMIN)
+        return
+
+    rollups = get_stats_rollups()
+    if rollups is None:
+        await update.message.reply_text(Messages.ADMIN_STATS_DISABLED)
+        return
+
+    args = list(context.args or [])
+    days = STATS_DEFAULT_DAYS
+    if args and args[-1].isdigit():
+        days = int(args.pop())
+    if len(args) > 1 or not 1 <= days <= STATS_MAX_DAYS:
+        await update.message.reply_text(Messages.ADMIN_STATS_USAGE.format(max_days=STATS_MAX_DAYS))
+        return
+
+    if args:
+        message = render_shop(args[0], rollups.get_shop_stats(args[0], days), days)
+    else:
+        message = render_totals(rollups.get_totals(days), days)
+    await update.message.reply_text(message)
+
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка в CSV: /export users или /export orders [с] [по] (только для админов)"""
+    from exports import ORDER_COLUMNS, USER_COLUMNS, order_rows, parse_period, run_export, user_rows
+
+    bot_instance = get_bot()
+    if not bot_instance.is_admin(update.effective_user.username):
+        await update.message.reply_text(Messages.ERROR_NOT_ADMIN)
+        return
+
+    args = list(context.args or [])
+    db_manager = bot_instance.db_manager
+    if args == ["users"]:
+        job = ("users", lambda: user_rows(db_manager), USER_COLUMNS, "users.csv")
+    elif args[:1] == ["orders"]:
+        try:
+            since, until = parse_period(args[1:])
+        except ValueError:
+            await update.message.reply_text(Messages.EXPORT_USAGE)
+            return
+        job = ("orders", lambda: order_rows(db_manager, since, until), ORDER_COLUMNS, "orders.csv")
+    else:
+        await update.message.reply_text(Messages.EXPORT_USAGE)
+        return
+
+    await update.message.reply_text(Messages.EXPORT_STARTED)
+    # Выгрузка идёт фоновой задачей вне бюджета времени обновления
+    coordinator.spawn(
+        run_export(context.bot, update.effective_chat.id, *job), "export", kind=job[0],
+        admin_chat_id=update.effective_chat.id,
+    )
+
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск пользователей по началу или части username, shop_id и тега: /find <запрос> (только для админов)"""
+    from user_search import normalize_query
+
+    bot_instance = get_bot()
+    if not bot_instance.is_admin(update.effective_user.username):
+        await update.message.reply_text(Messages.ERROR_NOT_ADMIN)
+        return
+    if not USER_SEARCH_ENABLED:
+        await update.message.reply_text(Messages.USER_SEARCH_DISABLED)
+        return
+
+    query = normalize_query(" ".join(context.args or []))
+    if not query:
+        await update.message.reply_text(Messages.USER_SEARCH_USAGE)
+        return
+
+    index = bot_instance.user_search
+    if index.is_stale():
+        refresh_user_search()
+    if index.ready:
+        users = index.search(query)
+    else:
+        # Индекс ещё строится: тот же поиск запросом к базе
+        users = await asyncio.get_running_loop().run_in_executor(None, index.search_database, query)
+
+    if not users:
+        await update.message.reply_text(Messages.USER_SEARCH_EMPTY.format(query=query))
+        return
+    lines = [Messages.USER_SEARCH_TITLE.format(query=query, count=len(users))]
+    for user in users:
+        role = "мерчант" if user["is_merchant"] else "пользователь"
+        line = Messages.USER_SEARCH_ROW.format(username=user["username"], user_id=user["user_id"], role=role)
+        if user["shop_id"] or user["order_id_tag"]:
+            line += Messages.USER_SEARCH_SHOP.format(shop_id=user["shop_id"] or "—", order_id_tag=user["order_id_tag"] or "—")
+        lines.append(line)
+    await update.message.reply_text("\n".join(lines))
+
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+@with_deadline
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик сообщений"""
+    bot_instance = get_bot()
     user = update.effective_user
     message_text = update.message.text
     
@@ -242,24 +410,141 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup = bot_instance.keyboard_manager.get_admin_main_menu()
         await update.message.reply_text("Выберите действие из меню:", reply_markup=reply_markup)
 
+@instrument_handler
+@trace_update
+@coordinator.guard_update
+@with_deadline
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик callback запросов"""
     query = update.callback_query
     await query.answer()
     
     # Обработка через обработчики callback
-    await bot_instance.callback_handlers.handle_callback(update, context)
+    await get_bot().callback_handlers.handle_callback(update, context)
 
-def main():
-    """Основная функция запуска бота"""
-    # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # Добавляем обработчики
+async def bootstrap_indexes_in_background():
+    """Согласовать индексы в пуле потоков, не блокируя цикл событий"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, get_bot().init_database)
+    except Exception:
+        logger.exception("Фоновое согласование индексов завершилось ошибкой")
+
+def refresh_user_search():
+    """Перестроить индекс поиска пользователей в пуле потоков фоновой задачей"""
+    index = get_bot().user_search
+    if index.building:
+        return
+    coordinator.spawn(asyncio.get_running_loop().run_in_executor(None, index.rebuild), "user_search_rebuild")
+
+async def post_init(application: Application):
+    """Подключение к базе и запуск вспомогательных сервисов в цикле событий приложения"""
+    from loop_monitor import LoopMonitor
+    from metrics import start_metrics_server
+    from order_history import configure_order_history
+    from stats_rollups import configure_stats_rollups
+    from tracing import configure_tracing
+
+    configure_tracing()
+    configure_order_history(get_bot().db_manager)
+    configure_stats_rollups(get_bot().db_manager)
+    # Сигналы остановки сначала останавливают получение обновлений и
+    # завершают начатые операции (см. shutdown.py)
+    coordinator.install_signal_handlers(updater=application.updater)
+    if INDEX_BOOTSTRAP_MODE == "background":
+        application.bot_data["index_bootstrap"] = asyncio.create_task(bootstrap_indexes_in_background())
+    else:
+        # Обновления начнут приниматься после согласования индексов,
+        # но цикл событий на время обращения к базе не блокируется
+        await asyncio.get_running_loop().run_in_executor(None, get_bot().init_database)
+    if USER_SEARCH_ENABLED:
+        refresh_user_search()
+    if LOOP_MONITOR_ENABLED:
+        monitor = LoopMonitor()
+        monitor.start()
+        application.bot_data["loop_monitor"] = monitor
+    if METRICS_ENABLED:
+        try:
+            application.bot_data["metrics_runner"] = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as exc:
+            logger.error("Не удалось запустить эндпоинт метрик: %s", exc)
+    if RECONCILE_ENABLED:
+        from reconciliation import Reconciler
+
+        reconciler = Reconciler(get_bot().db_manager, get_bot().user_manager, application.bot)
+        reconciler.start()
+        application.bot_data["reconciler"] = reconciler
+    if CALLBACK_ENABLED:
+        from callback_receiver import CallbackReceiver
+
+        try:
+            receiver = CallbackReceiver(get_bot().db_manager, application.bot)
+            await receiver.start(CALLBACK_HOST, CALLBACK_PORT)
+            application.bot_data["callback_receiver"] = receiver
+        except (OSError, ValueError) as exc:
+            logger.error("Не удалось запустить приём callback Konvert2pay: %s", exc)
+
+    startup = time.perf_counter() - _PROCESS_STARTED
+    STARTUP_DURATION.set(startup)
+    logger.info("Бот готов к приёму обновлений через %.3f с после запуска (индексы: %s)", startup, INDEX_BOOTSTRAP_MODE)
+
+async def post_stop(application: Application):
+    """Дождаться начатых операций, пока соединение с Telegram ещё открыто"""
+    receiver = application.bot_data.pop("callback_receiver", None)
+    if receiver is not None:
+        # Принятые события записываются, уведомления уходят до закрытия соединения с Telegram
+        await receiver.stop()
+    reconciler = application.bot_data.pop("reconciler", None)
+    if reconciler is not None:
+        # Новые проверки статусов не начинаются; прерванные повторятся после запуска
+        await reconciler.stop()
+    await coordinator.drain()
+
+async def post_shutdown(application: Application):
+    """Остановка вспомогательных сервисов и закрытие пулов соединений"""
+    from shutdown import close_resources
+
+    monitor = application.bot_data.pop("loop_monitor", None)
+    if monitor is not None:
+        await monitor.stop()
+    runner = application.bot_data.pop("metrics_runner", None)
+    if runner is not None:
+        await runner.cleanup()
+    await close_resources(_bot)
+
+def create_app(merchant_bot: Optional[MerchantBot] = None, token: str = BOT_TOKEN) -> Application:
+    """Собрать приложение Telegram с обработчиками бота"""
+    from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+
+    if merchant_bot is not None:
+        set_bot(merchant_bot)
+
+    application = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("infoedit", infoedit_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("find", find_command))
+    application.add_handler(CommandHandler("bulk_invoices", bulk_invoices_command))
+    application.add_handler(CommandHandler("bulk_payouts", bulk_payouts_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     application.add_handler(CallbackQueryHandler(button_callback))
+    return application
+
+def main():
+    """Основная функция запуска бота"""
+    from structured_logging import setup_logging
+
+    # Настройка логирования: запись в поток выполняется фоновым потоком
+    setup_logging()
+    application = create_app()
     
     # Запускаем бота
     logger.info("Бот запущен")
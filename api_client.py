@@ -1,16 +1,113 @@
 """
 API клиент для работы с Konvert2pay
 """
+import asyncio
+import time
+from datetime import datetime
 import aiohttp
 import logging
-from config import INVOICE_CREATE_URL, WITHDRAWAL_CREATE_URL
+from config import (
+    INVOICE_CREATE_URL, WITHDRAWAL_CREATE_URL, INVOICE_STATUS_URL, WITHDRAWAL_STATUS_URL,
+    API_CONNECT_TIMEOUT, API_SOCK_READ_TIMEOUT, API_TOTAL_TIMEOUT, API_GLOBAL_CONCURRENCY,
+)
+from api_limiter import api_limiter
+from deadline import DeadlineExceeded, client_timeout
+from metrics import Counter, Histogram
+from money import Money
+from order_history import record_order
+from shutdown import coordinator
+from tracing import inject_headers, span
 from webhook_sender import WebhookSender
 
 logger = logging.getLogger(__name__)
 
+API_REQUEST_LATENCY = Histogram(
+    "konvert2pay_request_duration_seconds",
+    "Длительность запросов к API Konvert2pay",
+    ("endpoint", "outcome"),
+)
+API_RESPONSES = Counter(
+    "konvert2pay_responses_total",
+    "Ответы API Konvert2pay по HTTP-статусам",
+    ("endpoint", "status"),
+)
+
 class Konvert2payAPI:
     """Клиент для работы с API Konvert2pay"""
-    
+
+    _session = None
+
+    @classmethod
+    def get_session(cls):
+        """Общая сессия с пулом соединений к Konvert2pay"""
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(limit=API_GLOBAL_CONCURRENCY)
+            cls._session = aiohttp.ClientSession(connector=connector)
+        return cls._session
+
+    @classmethod
+    async def close(cls):
+        """Закрыть общую сессию"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+
+    @staticmethod
+    async def _post(endpoint, url, data, headers):
+        """Отправить запрос к API с таймаутами и учётом бюджета обновления"""
+        with span(f"konvert2pay {endpoint}", endpoint=endpoint, shop_id=data["shop_id"]) as current:
+            # Остановка бота дождётся ответа или запишет прерванный запрос
+            async with coordinator.track("konvert2pay", endpoint=endpoint, shop_id=data["shop_id"],
+                                         order_id=data.get("order_id")):
+                async with api_limiter.slot(data["shop_id"]):
+                    started = time.monotonic()
+                    outcome = "error"
+                    try:
+                        timeout = client_timeout(API_TOTAL_TIMEOUT, API_CONNECT_TIMEOUT, API_SOCK_READ_TIMEOUT)
+                        session = Konvert2payAPI.get_session()
+                        headers = inject_headers(dict(headers))
+                        async with session.post(url, data=data, headers=headers, timeout=timeout) as response:
+                            API_RESPONSES.inc(endpoint, str(response.status))
+                            current.set_attribute("http.status_code", response.status)
+                            result = await response.json()
+                        outcome = "success" if result.get('Success') else "api_error"
+                        return result
+                    except DeadlineExceeded:
+                        outcome = "deadline"
+                        raise
+                    except asyncio.TimeoutError:
+                        outcome = "timeout"
+                        raise
+                    finally:
+                        API_REQUEST_LATENCY.observe(time.monotonic() - started, endpoint, outcome)
+                        current.set_attribute("outcome", outcome)
+
+    @staticmethod
+    def _error_result(exc):
+        """Сформировать ответ об ошибке в формате API
+
+        Ответ API не получен или не разобран: запрос мог дойти до Konvert2pay,
+        поэтому результат помечается ``Uncertain``.
+        """
+        if isinstance(exc, asyncio.TimeoutError):
+            error = {"Code": 504, "Message": "Превышено время ожидания ответа Konvert2pay"}
+        else:
+            error = {"Code": 500, "Message": str(exc)}
+        return {"Success": False, "Uncertain": True, "Error": error}
+
+    @staticmethod
+    def _amount_field(amount):
+        """Сумма в поле запроса: строка с двумя знаками после запятой ("500.00")"""
+        return str(Money.coerce(amount)) if amount is not None else None
+
+    @staticmethod
+    def _webhook_data(data, amount):
+        """Данные запроса для webhook: сумма числом, как до перехода на копейки, и в копейках"""
+        if amount is None:
+            return data
+        money = Money.coerce(amount)
+        return {**data, "amount": float(money.to_decimal()), "amount_minor": money.minor}
+
     @staticmethod
     async def create_invoice(shop_id, shop_api_key, order_id, client_id, amount, user_info=None):
         """Создание инвойса через API Konvert2pay"""
@@ -19,39 +116,46 @@ class Konvert2payAPI:
             "method": "oneclickpay",
             "order_id": order_id,
             "client_id": client_id,
-            "amount": amount
+            "amount": Konvert2payAPI._amount_field(amount)
         }
-        
+
         headers = {
             "Authorization": shop_api_key,
             "Content-Type": "application/x-www-form-urlencoded"
         }
-        
+
+        webhook_data = Konvert2payAPI._webhook_data(data, amount)
+        created_at = datetime.utcnow()
+        started = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(INVOICE_CREATE_URL, data=data, headers=headers) as response:
-                    result = await response.json()
-                    
-                    # Отправляем webhook
-                    if user_info:
-                        await WebhookSender.send_invoice_webhook(data, result, user_info)
-                    
-                    return result
+            result = await Konvert2payAPI._post("invoice_create", INVOICE_CREATE_URL, data, headers)
+            record_order("invoice", data, result, created_at, time.perf_counter() - started, user_info)
+
+            # Отправляем webhook
+            if user_info:
+                await WebhookSender.send_invoice_webhook(webhook_data, result, user_info)
+
+            return result
         except Exception as e:
-            logger.error(f"Ошибка API запроса инвойса: {e}")
-            error_result = {"Success": False, "Error": {"Code": 500, "Message": str(e)}}
-            
+            logger.error("Ошибка API запроса инвойса: %r", e)
+            error_result = Konvert2payAPI._error_result(e)
+            record_order("invoice", data, error_result, created_at, time.perf_counter() - started, user_info)
+
             # Отправляем webhook с ошибкой
             if user_info:
-                await WebhookSender.send_invoice_webhook(data, error_result, user_info)
-            
+                await WebhookSender.send_invoice_webhook(webhook_data, error_result, user_info)
+
             return error_result
 
     @staticmethod
-    async def create_payout(shop_id, shop_api_key, order_id, client_id, iban_account, iban_inn, 
-                          cardholder_surname, cardholder_name, cardholder_middlename, 
-                          iban_purpose, amount, user_info=None):
-        """Создание выплаты через API Konvert2pay"""
+    async def create_payout(shop_id, shop_api_key, order_id, client_id, iban_account, iban_inn,
+                          cardholder_surname, cardholder_name, cardholder_middlename,
+                          iban_purpose, amount, user_info=None, idempotency_key=None):
+        """Создание выплаты через API Konvert2pay
+
+        ``idempotency_key`` передаётся заголовком ``Idempotency-Key``, чтобы
+        повтор того же запроса не создал вторую выплату.
+        """
         data = {
             "shop_id": shop_id,
             "order_id": f"{order_id} {client_id}",  # Для выплат order_id = ID заявки + ID клиента
@@ -61,30 +165,62 @@ class Konvert2payAPI:
             "cardholderName": cardholder_name,
             "cardholderMiddlename": cardholder_middlename,
             "ibanPurpose": iban_purpose,
-            "amount": amount
+            "amount": Konvert2payAPI._amount_field(amount)
         }
-        
+
         headers = {
             "Authorization": shop_api_key,
             "Content-Type": "application/x-www-form-urlencoded"
         }
-        
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+
+        webhook_data = Konvert2payAPI._webhook_data(data, amount)
+        created_at = datetime.utcnow()
+        started = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(WITHDRAWAL_CREATE_URL, data=data, headers=headers) as response:
-                    result = await response.json()
-                    
-                    # Отправляем webhook
-                    if user_info:
-                        await WebhookSender.send_payout_webhook(data, result, user_info)
-                    
-                    return result
+            result = await Konvert2payAPI._post("withdrawal_create", WITHDRAWAL_CREATE_URL, data, headers)
+            record_order("payout", data, result, created_at, time.perf_counter() - started, user_info)
+
+            # Отправляем webhook
+            if user_info:
+                await WebhookSender.send_payout_webhook(webhook_data, result, user_info)
+
+            return result
         except Exception as e:
-            logger.error(f"Ошибка API запроса выплаты: {e}")
-            error_result = {"Success": False, "Error": {"Code": 500, "Message": str(e)}}
-            
+            logger.error("Ошибка API запроса выплаты: %r", e)
+            error_result = Konvert2payAPI._error_result(e)
+            record_order("payout", data, error_result, created_at, time.perf_counter() - started, user_info)
+
             # Отправляем webhook с ошибкой
             if user_info:
-                await WebhookSender.send_payout_webhook(data, error_result, user_info)
-            
+                await WebhookSender.send_payout_webhook(webhook_data, error_result, user_info)
+
             return error_result
+
+    @staticmethod
+    async def get_statuses(kind, shop_id, shop_api_key, order_ids):
+        """Статусы нескольких инвойсов или выплат магазина одним запросом
+
+        ``kind`` — "invoice" или "payout". В ``Data`` ответа — список
+        ``{"order_id": ..., "status": ...}``.
+        """
+        if kind == "invoice":
+            endpoint, url = "invoice_status", INVOICE_STATUS_URL
+        else:
+            endpoint, url = "withdrawal_status", WITHDRAWAL_STATUS_URL
+        data = {
+            "shop_id": shop_id,
+            "order_ids": ",".join(order_ids)
+        }
+
+        headers = {
+            "Authorization": shop_api_key,
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        try:
+            return await Konvert2payAPI._post(endpoint, url, data, headers)
+        except Exception as e:
+            logger.error("Ошибка API запроса статусов (%s): %r", endpoint, e)
+            return Konvert2payAPI._error_result(e)
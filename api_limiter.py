@@ -0,0 +1,180 @@
+"""Ограничение параллельности, справедливая очередь и бюджет частоты запросов к Konvert2pay."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from config import API_GLOBAL_CONCURRENCY, API_PER_SHOP_CONCURRENCY, API_SHOP_WEIGHTS
+from deadline import DeadlineExceeded, remaining
+from metrics import Gauge, Histogram
+
+QUEUE_WAIT = Histogram(
+    "konvert2pay_queue_wait_seconds",
+    "Время ожидания слота для запроса к Konvert2pay по магазинам",
+    ("shop_id",),
+)
+
+
+class FairLimiter:
+    """Глобальный и помагазинный лимит с взвешенной справедливой очередью (WFQ).
+
+    Каждой заявке назначается виртуальное время завершения
+    ``max(V, finish[shop]) + 1 / weight[shop]``; освободившийся слот получает
+    заявка с наименьшим временем среди магазинов, не упёршихся в свой лимит.
+    Поэтому магазин с сотней ожидающих запросов не вытесняет остальных.
+    """
+
+    def __init__(
+        self,
+        global_limit: int = API_GLOBAL_CONCURRENCY,
+        per_shop_limit: int = API_PER_SHOP_CONCURRENCY,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        self.global_limit = global_limit
+        self.per_shop_limit = per_shop_limit
+        self.weights = dict(API_SHOP_WEIGHTS if weights is None else weights)
+        self._active = 0
+        self._shop_active: Dict[str, int] = defaultdict(int)
+        self._shop_finish: Dict[str, float] = defaultdict(float)
+        self._virtual_time = 0.0
+        self._heap: List[Tuple[float, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def active(self) -> int:
+        """Количество выполняющихся запросов."""
+
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Количество заявок в очереди (включая отменённые, ещё не вычищенные)."""
+
+        return len(self._heap)
+
+    def _can_run(self, shop_id: str) -> bool:
+        return self._active < self.global_limit and self._shop_active[shop_id] < self.per_shop_limit
+
+    def _grant(self, shop_id: str) -> None:
+        self._active += 1
+        self._shop_active[shop_id] += 1
+
+    def _release(self, shop_id: str) -> None:
+        self._active -= 1
+        self._shop_active[shop_id] -= 1
+        if not self._shop_active[shop_id]:
+            del self._shop_active[shop_id]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Раздать освободившиеся слоты заявкам с наименьшим виртуальным временем."""
+
+        skipped: List[Tuple[float, int, str, asyncio.Future]] = []
+        while self._heap and self._active < self.global_limit:
+            entry = heapq.heappop(self._heap)
+            finish, _, shop_id, future = entry
+            if future.done():
+                continue
+            if self._shop_active[shop_id] >= self.per_shop_limit:
+                skipped.append(entry)
+                continue
+            self._virtual_time = max(self._virtual_time, finish)
+            self._grant(shop_id)
+            future.set_result(None)
+
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+    async def acquire(self, shop_id: str) -> None:
+        """Дождаться слота для запроса магазина с учётом бюджета обновления."""
+
+        if not self._heap and self._can_run(shop_id):
+            self._grant(shop_id)
+            return
+
+        weight = self.weights.get(shop_id, 1.0)
+        start = max(self._virtual_time, self._shop_finish[shop_id])
+        finish = start + 1.0 / weight
+        self._shop_finish[shop_id] = finish
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (finish, next(self._seq), shop_id, future))
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), remaining())
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self._release(shop_id)
+            future.cancel()
+            raise DeadlineExceeded("Бюджет времени исчерпан в очереди к Konvert2pay") from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(shop_id)
+            future.cancel()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, shop_id) -> AsyncIterator[None]:
+        """Контекстный менеджер слота; время ожидания пишется в метрику по магазину."""
+
+        shop_key = str(shop_id)
+        started = time.monotonic()
+        try:
+            await self.acquire(shop_key)
+        finally:
+            QUEUE_WAIT.observe(time.monotonic() - started, shop_key)
+        try:
+            yield
+        finally:
+            self._release(shop_key)
+
+
+class RateBudget:
+    """Бюджет частоты запросов (token bucket): не больше ``rate`` в секунду в среднем.
+
+    В отличие от ``FairLimiter``, ограничивает не число одновременных
+    запросов, а их частоту — для фоновой работы, которая не должна занимать
+    у API больше заданной доли.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Дождаться токена на один запрос."""
+
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+# Общий ограничитель для всех исходящих запросов к Konvert2pay
+api_limiter = FairLimiter()
+
+API_ACTIVE_REQUESTS = Gauge(
+    "konvert2pay_active_requests",
+    "Выполняющиеся запросы к Konvert2pay",
+    function=lambda: api_limiter.active,
+)
+API_QUEUED_REQUESTS = Gauge(
+    "konvert2pay_queued_requests",
+    "Запросы к Konvert2pay, ожидающие слота",
+    function=lambda: api_limiter.queued,
+)
@@ -0,0 +1,7 @@
+"""Точка входа ``python -m benchmarks``."""
+
+import sys
+
+from benchmarks.runner import main
+
+sys.exit(main())
@@ -0,0 +1,112 @@
+"""Приём callback Konvert2pay: обработчик запроса, пакетная запись и HTTP целиком.
+
+``accept`` — проверка подписи, разбор JSON, отбрасывание повторов и
+постановка в очередь для 1000 событий; это вся работа цикла событий на
+один запрос сверх aiohttp. ``write`` — запись пачки из 500 событий в
+``orders`` с 20k заказов: один ``find`` с ``$in`` и один ``bulk_write``.
+``http`` — 1000 подписанных POST через aiohttp (64 одновременных соединения)
+на запущенный приёмник, включая его запуск и остановку с записью очереди;
+клиент и сервер делят одно ядро, так что оценка пессимистичная.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime
+
+import aiohttp
+
+from benchmarks.fixtures import make_database
+from benchmarks.runner import benchmark
+from callback_receiver import SIGNATURE_HEADER, CallbackReceiver, SeenEvents, sign
+from config import CALLBACK_PATH
+from db_indexes import reconcile_indexes
+
+_SECRET = "bench-secret"
+_ORDERS = 20_000
+_EVENTS = 1000
+_BATCH = 500
+_CONCURRENCY = 64
+
+
+class _SilentBot:
+    async def send_message(self, chat_id, text):
+        return None
+
+
+def _database():
+    db_manager = make_database()
+    reconcile_indexes(db_manager)
+    now = datetime.utcnow()
+    db_manager.get_collection("orders").insert_many([
+        {
+            "kind": "invoice", "shop_id": f"shop-{index % 50}", "order_id": f"O-{index}", "user_id": index % 50,
+            "amount_minor": 10_000, "status": "success", "payment_status": "pending", "next_check_at": now,
+            "created_at": now,
+        }
+        for index in range(_ORDERS)
+    ])
+    return db_manager
+
+
+def _event(index: int, status: str = "processing") -> bytes:
+    order = index % _ORDERS
+    return json.dumps({
+        "event_id": f"evt-{index}", "type": "invoice", "shop_id": f"shop-{order % 50}",
+        "order_id": f"O-{order}", "status": status,
+    }).encode()
+
+
+@benchmark(f"callbacks.accept[{_EVENTS}]")
+def bench_accept():
+    receiver = CallbackReceiver(_database(), _SilentBot(), secret=_SECRET)
+    signed = [(body, sign(body, _SECRET)) for body in map(_event, range(_EVENTS))]
+
+    def run():
+        receiver.seen = SeenEvents()
+        for body, signature in signed:
+            receiver.accept(body, signature)
+        while not receiver._queue.empty():
+            receiver._queue.get_nowait()
+
+    return run
+
+
+@benchmark(f"callbacks.write[{_BATCH}]")
+def bench_write():
+    receiver = CallbackReceiver(_database(), _SilentBot(), secret=_SECRET)
+    # Статусы чередуются, чтобы каждый прогон менял все заказы пачки
+    batches = [
+        [json.loads(_event(index * 37, status)) for index in range(_BATCH)]
+        for status in ("processing", "pending")
+    ]
+    runs = iter(range(1 << 62))
+
+    def run():
+        receiver._write(batches[next(runs) % 2])
+
+    return run
+
+
+@benchmark(f"callbacks.http[{_EVENTS}]")
+def bench_http():
+    db_manager = _database()
+    signed = [(body, sign(body, _SECRET)) for body in map(_event, range(_EVENTS))]
+    ports = iter(range(18600, 18600 + 1_000_000))
+
+    async def run():
+        receiver = CallbackReceiver(db_manager, _SilentBot(), secret=_SECRET)
+        port = next(ports) % 1000 + 18600
+        await receiver.start("127.0.0.1", port)
+        url = f"http://127.0.0.1:{port}{CALLBACK_PATH}"
+        pending = iter(signed)
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=_CONCURRENCY)) as session:
+            async def sender():
+                for body, signature in pending:
+                    async with session.post(url, data=body, headers={SIGNATURE_HEADER: signature}) as response:
+                        assert response.status == 200
+            await asyncio.gather(*(sender() for _ in range(_CONCURRENCY)))
+        await receiver.stop()
+
+    return run
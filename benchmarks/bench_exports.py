@@ -0,0 +1,61 @@
+"""Выгрузка заказов в CSV: чтение курсора и запись во временный файл.
+
+100k заказов за 30 дней. ``csv`` — ``build_export`` всей коллекции: проекция,
+форматирование строк и запись в ``SpooledTemporaryFile`` (файл около 9 МБ,
+больше ``EXPORT_SPOOL_SIZE``, поэтому уходит на диск). ``zip`` — та же
+выгрузка с порогом размера 4 МБ, то есть с потоковым сжатием в ZIP.
+"""
+
+from __future__ import annotations
+
+import functools
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import make_database
+from benchmarks.runner import benchmark
+from db_indexes import reconcile_indexes
+from exports import ORDER_COLUMNS, build_export, order_rows
+from money import Money
+from order_history import build_order_document
+
+ORDERS = 100_000
+
+
+@functools.lru_cache(maxsize=None)
+def _database():
+    db_manager = make_database()
+    reconcile_indexes(db_manager)
+    rng = random.Random(48)
+    now = datetime.utcnow()
+    db_manager.get_collection("orders").insert_many([
+        build_order_document(
+            "invoice" if rng.random() < 0.7 else "payout",
+            {"shop_id": f"shop-{rng.randrange(200)}", "order_id": f"O-{index}",
+             "amount": Money(rng.randrange(100_00, 50_000_00))},
+            {"Success": rng.random() < 0.9}, now - timedelta(minutes=rng.randrange(30 * 24 * 60)), 0.1,
+            {"user_id": index % 500, "username": f"merchant_{index % 500}"},
+        )
+        for index in range(ORDERS)
+    ])
+    return db_manager
+
+
+def _export(max_size: int):
+    db_manager = _database()
+
+    def run():
+        output, _, _ = build_export(order_rows(db_manager), ORDER_COLUMNS, "orders.csv", max_size=max_size)
+        output.close()
+
+    return run
+
+
+@benchmark(f"exports.orders[{ORDERS},csv]")
+def bench_orders_csv():
+    return _export(50 * 1024 * 1024)
+
+
+@benchmark(f"exports.orders[{ORDERS},zip]")
+def bench_orders_zip():
+    return _export(4 * 1024 * 1024)
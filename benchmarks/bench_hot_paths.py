@@ -0,0 +1,101 @@
+"""Бенчмарки горячих путей обработки обновлений."""
+
+from __future__ import annotations
+
+import json
+
+from benchmarks.fixtures import (
+    ADMIN_USERNAME, make_bot_stub, make_context, make_database, make_update_factory, make_user_rows,
+)
+from benchmarks.runner import benchmark
+from db_utils import UserManager
+from handlers.admin_commands import ShowUsersCommand
+from keyboard_manager import KeyboardManager
+from message_handlers import MessageHandlers
+from money import Money
+from states import StateManager, UserState
+from webhook_sender import WebhookSender
+
+
+@benchmark("message_handlers.handle_message[unmatched]")
+def bench_dispatch_unmatched():
+    handlers = MessageHandlers(make_bot_stub())
+    update = make_update_factory().message("произвольный текст")
+    context = make_context()
+
+    async def run():
+        await handlers.handle_message(update, context)
+
+    return run
+
+
+@benchmark("message_handlers.handle_message[invoice_id_step]")
+def bench_dispatch_invoice_step():
+    handlers = MessageHandlers(make_bot_stub())
+    update = make_update_factory().message("INV-1")
+    context = make_context()
+
+    async def run():
+        context.user_data["current_state"] = UserState.WAITING_FOR_INVOICE_ID.value
+        context.user_data[UserState.WAITING_FOR_INVOICE_ID.value] = True
+        await handlers.handle_message(update, context)
+
+    return run
+
+
+@benchmark("state_manager.clear_all_states")
+def bench_clear_all_states():
+    context = make_context()
+    populated = {state.value: True for state in UserState}
+    populated.update(current_state=UserState.WAITING_FOR_AMOUNT.value, invoice_order_id="INV-1", payout_amount=Money(1000))
+
+    def run():
+        context.user_data.update(populated)
+        StateManager.clear_all_states(context)
+
+    return run
+
+
+@benchmark("keyboard_manager.merchant_main_menu")
+def bench_merchant_main_menu():
+    return KeyboardManager.get_merchant_main_menu
+
+
+@benchmark("keyboard_manager.invoice_method_selection")
+def bench_invoice_method_selection():
+    return KeyboardManager.get_invoice_method_selection
+
+
+def _register_get_all_users(size: int) -> None:
+    @benchmark(f"user_manager.get_all_users[{size}]")
+    def setup():
+        return UserManager(make_database(size)).get_all_users
+
+
+for _size in (10_000, 100_000):
+    _register_get_all_users(_size)
+
+
+def _register_show_users(size: int) -> None:
+    @benchmark(f"show_users_command.render[{size}]")
+    def setup():
+        command = ShowUsersCommand(make_bot_stub(make_user_rows(size)))
+        update = make_update_factory(ADMIN_USERNAME).message("👤 Пользователи")
+        context = make_context()
+
+        async def run():
+            await command.handle(update, context)
+
+        return run
+
+
+for _size in (100, 10_000):
+    _register_show_users(_size)
+
+
+@benchmark("webhook_sender.build_invoice_payload")
+def bench_invoice_payload():
+    invoice = {"shop_id": "shop-1", "method": "oneclickpay", "order_id": "INV-1", "client_id": "client-1", "amount": "500.75"}
+    result = {"Success": True, "Data": {"invoice_id": 100001, "pay_url": "https://pay.example/100001", "currency": "UAH"}}
+    user_info = {"user_id": 1, "username": "bench_merchant", "shop_id": "shop-1"}
+    return lambda: json.dumps(WebhookSender.build_invoice_payload(invoice, result, user_info))
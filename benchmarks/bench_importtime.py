@@ -0,0 +1,66 @@
+"""Время импорта модулей бота по данным ``python -X importtime``.
+
+Каждый замер запускает отдельный интерпретатор, поэтому кеш ``sys.modules``
+текущего процесса на результат не влияет. Разбивку по самым дорогим
+модулям печатает::
+
+    python -m benchmarks.bench_importtime MerchantBot --top 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+from benchmarks.runner import benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("MerchantBot", "db_utils", "message_handlers")
+
+
+def import_times(module: str) -> List[Dict[str, object]]:
+    """Собственное и накопленное время импорта (мкс) каждого модуля, загруженного при импорте ``module``."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip())) // 2,
+                     "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return rows
+
+
+def _register(module: str) -> None:
+    @benchmark(f"importtime.{module}")
+    def setup():
+        return lambda: import_times(module)
+
+
+for _module in MODULES:
+    _register(_module)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Разбивка времени импорта по модулям")
+    parser.add_argument("module", nargs="?", default="MerchantBot")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total = next(row for row in reversed(rows) if row["module"] == args.module)
+    print(f"{args.module}: {total['cumulative_us'] / 1000:.1f} мс, модулей загружено: {len(rows)}")
+    print(f"{'накопл. мс':>12}{'собств. мс':>12}  модуль")
+    for row in sorted(rows, key=lambda row: row["cumulative_us"], reverse=True)[:args.top]:
+        print(f"{row['cumulative_us'] / 1000:>12.1f}{row['self_us'] / 1000:>12.1f}  {row['module']}")
+
+
+if __name__ == "__main__":
+    main()
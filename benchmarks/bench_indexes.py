@@ -0,0 +1,99 @@
+"""Запросы к пользователям на 100k документов до и после плана индексов.
+
+``before`` — база без индексов, кроме ``_id_``, и прежние формы запросов:
+``$or`` по ``_id``/``username`` и ``$sort`` после ``$lookup``. ``after`` —
+база после ``backfill_username_keys`` и ``reconcile_indexes`` с текущими
+методами ``UserManager``/``OrderManager``. FakeMongoClient ускоряет только
+поиск по равенству через индекс; выигрыш от сортировки по индексу
+в ``get_all_users`` виден в плане ``explain``, а не во времени.
+"""
+
+from __future__ import annotations
+
+import functools
+
+from benchmarks.fixtures import make_database
+from benchmarks.runner import benchmark
+from db_indexes import reconcile_indexes
+from db_utils import USERS_WITH_SETTINGS_PIPELINE, DatabaseManager, OrderManager, UserManager
+
+USERS = 100_000
+# Пользователь из середины коллекции, мерчант
+USERNAME = f"user_{USERS // 2:06d}"
+USER_ID = 100_000 + USERS // 2
+
+_LEGACY_USERS_PIPELINE = [
+    {"$lookup": {"from": "merchant_settings", "localField": "_id", "foreignField": "_id", "as": "settings"}},
+    {"$unwind": {"path": "$settings", "preserveNullAndEmptyArrays": True}},
+    {"$sort": {"created_at": -1, "username": 1}},
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _database(indexed: bool) -> DatabaseManager:
+    db_manager = make_database(USERS)
+    if indexed:
+        UserManager(db_manager).backfill_username_keys()
+        reconcile_indexes(db_manager)
+    return db_manager
+
+
+@benchmark(f"indexes.lookup_username[{USERS},before]")
+def bench_lookup_before():
+    users = UserManager(_database(False)).users
+
+    def run():
+        return users.find_one({"$or": [{"_id": USERNAME}, {"username": USERNAME}]})
+
+    return run
+
+
+@benchmark(f"indexes.lookup_username[{USERS},after]")
+def bench_lookup_after():
+    manager = UserManager(_database(True))
+    manager.legacy_username_lookup = False
+
+    def run():
+        return manager.get_user_by_username(f"@{USERNAME.upper()}")
+
+    return run
+
+
+@benchmark(f"indexes.settings_by_user_id[{USERS},before]")
+def bench_settings_before():
+    settings = OrderManager(_database(False)).merchant_settings
+
+    def run():
+        return settings.find_one({"user_id": USER_ID})
+
+    return run
+
+
+@benchmark(f"indexes.settings_by_user_id[{USERS},after]")
+def bench_settings_after():
+    settings = OrderManager(_database(True)).merchant_settings
+
+    def run():
+        return settings.find_one({"user_id": USER_ID})
+
+    return run
+
+
+@benchmark(f"indexes.get_all_users[{USERS},before]")
+def bench_all_users_before():
+    users = UserManager(_database(False)).users
+
+    def run():
+        return list(users.aggregate(_LEGACY_USERS_PIPELINE))
+
+    return run
+
+
+@benchmark(f"indexes.get_all_users[{USERS},after]")
+def bench_all_users_after():
+    users = UserManager(_database(True)).users
+
+    def run():
+        return list(users.aggregate(USERS_WITH_SETTINGS_PIPELINE))
+
+    return run
@@ -0,0 +1,94 @@
+"""Бенчмарки стоимости логирования и задержки обработчика с логированием и без."""
+
+from __future__ import annotations
+
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Callable, Dict, Tuple
+
+from benchmarks.fixtures import make_bot_stub, make_context, make_update_factory
+from benchmarks.runner import benchmark
+from message_handlers import MessageHandlers
+from states import UserState
+from structured_logging import JsonFormatter, LazyQueueHandler, SamplingFilter
+
+
+def _attach_queue_logging(name: str, level: int, rates: Dict[str, float]) -> Tuple[logging.Logger, Callable[[], None]]:
+    """Направить логгер через очередь в JSON на /dev/null; вернуть логгер и функцию восстановления."""
+
+    target = logging.getLogger(name)
+    saved = (target.level, target.propagate, list(target.handlers))
+
+    devnull = open(os.devnull, "w")
+    output = logging.StreamHandler(devnull)
+    output.setFormatter(JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(rates))
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+
+    target.handlers = [handler]
+    target.propagate = False
+    target.setLevel(level)
+
+    def teardown() -> None:
+        listener.stop()
+        devnull.close()
+        target.setLevel(saved[0])
+        target.propagate = saved[1]
+        target.handlers = saved[2]
+
+    return target, teardown
+
+
+@benchmark("logging.debug[disabled]")
+def bench_debug_disabled():
+    target, teardown = _attach_queue_logging("bench.logging", logging.INFO, {})
+
+    def run():
+        target.debug("Шаг создания инвойса: %s", "waiting_for_amount", extra={"event": "invoice.state", "user_id": 1})
+
+    return run, teardown
+
+
+@benchmark("logging.debug[queue_json]")
+def bench_debug_enabled():
+    target, teardown = _attach_queue_logging("bench.logging", logging.DEBUG, {})
+
+    def run():
+        target.debug("Шаг создания инвойса: %s", "waiting_for_amount", extra={"event": "invoice.state", "user_id": 1})
+
+    return run, teardown
+
+
+@benchmark("logging.debug[queue_json,sampled_10pct]")
+def bench_debug_sampled():
+    target, teardown = _attach_queue_logging("bench.logging", logging.DEBUG, {"invoice.state": 0.1})
+
+    def run():
+        target.debug("Шаг создания инвойса: %s", "waiting_for_amount", extra={"event": "invoice.state", "user_id": 1})
+
+    return run, teardown
+
+
+def _register_invoice_step(enabled: bool) -> None:
+    @benchmark(f"message_handlers.handle_message[invoice_id_step,logging={'on' if enabled else 'off'}]")
+    def setup():
+        _, teardown = _attach_queue_logging("message_handlers", logging.DEBUG if enabled else logging.INFO, {})
+        handlers = MessageHandlers(make_bot_stub())
+        update = make_update_factory().message("INV-1")
+        context = make_context()
+
+        async def run():
+            context.user_data["current_state"] = UserState.WAITING_FOR_INVOICE_ID.value
+            context.user_data[UserState.WAITING_FOR_INVOICE_ID.value] = True
+            await handlers.handle_message(update, context)
+
+        return run, teardown
+
+
+for _enabled in (False, True):
+    _register_invoice_step(_enabled)
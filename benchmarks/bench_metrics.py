@@ -0,0 +1,49 @@
+"""Бенчмарки накладных расходов записи метрик на горячем пути."""
+
+from __future__ import annotations
+
+from benchmarks.fixtures import make_context, make_update_factory
+from benchmarks.runner import benchmark
+from metrics import Counter, Histogram, instrument_handler, render_metrics
+
+_COUNTER = Counter("bench_counter_total", "Счётчик для бенчмарка", ("type", "handler"))
+_HISTOGRAM = Histogram("bench_duration_seconds", "Гистограмма для бенчмарка", ("handler",))
+
+
+@benchmark("metrics.counter_inc")
+def bench_counter_inc():
+    return lambda: _COUNTER.inc("message", "handle_message")
+
+
+@benchmark("metrics.histogram_observe")
+def bench_histogram_observe():
+    return lambda: _HISTOGRAM.observe(0.042, "handle_message")
+
+
+@benchmark("metrics.histogram_time")
+def bench_histogram_time():
+    def run():
+        with _HISTOGRAM.time("handle_message"):
+            pass
+
+    return run
+
+
+@benchmark("metrics.instrument_handler")
+def bench_instrument_handler():
+    async def handler(update, context):
+        return None
+
+    instrumented = instrument_handler(handler)
+    update = make_update_factory().message("текст")
+    context = make_context()
+
+    async def run():
+        await instrumented(update, context)
+
+    return run
+
+
+@benchmark("metrics.render")
+def bench_render():
+    return render_metrics
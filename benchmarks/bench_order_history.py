@@ -0,0 +1,86 @@
+"""Подтверждение инвойса мерчантом с записью истории заказов и без неё.
+
+Ответ Konvert2pay и отправка webhook подменены мгновенными заглушками, чтобы
+в замер попадала только работа бота. В ``history=on`` вызов ``record_order``
+ставит документ в очередь, а фоновый поток ``OrderHistory`` пишет пачки в
+коллекцию, которая ведёт себя как сетевой MongoDB: кодирует документы в BSON,
+как pymongo, и ждёт ответа сервера без GIL. FakeMongoClient здесь не подходит:
+его ``insert_one`` копирует документ в Python (~30 мкс под GIL), а на потоке
+подтверждений в десятки тысяч в секунду эта работа сервера отнимала бы время
+у измеряемого цикла событий. Медианы двух вариантов должны совпадать
+в пределах шума.
+"""
+
+from __future__ import annotations
+
+import time
+from types import SimpleNamespace
+
+import bson
+
+import order_history
+from api_client import Konvert2payAPI
+from benchmarks.fixtures import make_bot_stub, make_context, make_update_factory
+from benchmarks.runner import benchmark
+from callback_handlers import CallbackHandlers
+from money import Money
+from webhook_sender import WebhookSender
+
+# Время ответа MongoDB на insert_many, с
+_MONGO_ROUND_TRIP = 0.001
+
+_RESULT = {"Success": True, "Data": {"invoice_id": 100001, "pay_url": "https://pay.example/100001", "currency": "UAH"}}
+
+
+async def _instant_post(endpoint, url, data, headers):
+    return _RESULT
+
+
+async def _skip_webhook(*args, **kwargs):
+    return True
+
+
+class _NetworkCollection:
+    """Коллекция ``orders``: BSON-кодирование на стороне клиента и ожидание ответа сервера."""
+
+    def __init__(self):
+        self.written = 0
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            bson.encode(document)
+        time.sleep(_MONGO_ROUND_TRIP)
+        self.written += len(documents)
+
+
+def _confirm_invoice(history: bool):
+    originals = (Konvert2payAPI._post, WebhookSender.send_invoice_webhook)
+    Konvert2payAPI._post = staticmethod(_instant_post)
+    WebhookSender.send_invoice_webhook = staticmethod(_skip_webhook)
+    if history:
+        orders = _NetworkCollection()
+        order_history.configure_order_history(SimpleNamespace(get_collection=lambda name: orders))
+
+    handlers = CallbackHandlers(make_bot_stub())
+    query = make_update_factory().callback("confirm_invoice").callback_query
+    context = make_context()
+
+    async def run():
+        context.user_data.update(invoice_order_id="INV-1", invoice_client_id="client-1", invoice_amount=Money(50075))
+        await handlers._confirm_invoice(query, context)
+
+    def teardown():
+        order_history.shutdown_order_history()
+        Konvert2payAPI._post, WebhookSender.send_invoice_webhook = (staticmethod(original) for original in originals)
+
+    return run, teardown
+
+
+@benchmark("order_history.confirm_invoice[history=off]")
+def bench_confirm_without_history():
+    return _confirm_invoice(history=False)
+
+
+@benchmark("order_history.confirm_invoice[history=on]")
+def bench_confirm_with_history():
+    return _confirm_invoice(history=True)
@@ -0,0 +1,79 @@
+"""Экран статистики: агрегация истории заказов против чтения сводных счётчиков.
+
+100k заказов 200 магазинов за 30 дней. ``orders`` — ``$match`` по дате и
+``$group`` по магазину, типу и статусу по коллекции ``orders``: время растёт
+с числом заказов. ``rollups`` — ``StatsRollups.get_totals`` по суточным
+документам: по одному на магазин за день, сколько бы заказов ни было.
+"""
+
+from __future__ import annotations
+
+import functools
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import make_database
+from benchmarks.runner import benchmark
+from db_indexes import reconcile_indexes
+from money import Money
+from order_history import build_order_document
+from stats_rollups import StatsRollups
+
+ORDERS = 100_000
+SHOPS = 200
+DAYS = 7
+
+
+@functools.lru_cache(maxsize=None)
+def _rollups() -> StatsRollups:
+    db_manager = make_database()
+    reconcile_indexes(db_manager)
+    orders = db_manager.get_collection("orders")
+    rollups = StatsRollups(db_manager, interval=3600)
+    rng = random.Random(41)
+    now = datetime.utcnow()
+
+    batch = []
+    for index in range(ORDERS):
+        kind = "invoice" if rng.random() < 0.7 else "payout"
+        shop_id = f"shop-{rng.randrange(SHOPS)}"
+        amount = Money(rng.randrange(100_00, 50_000_00))
+        success = rng.random() < 0.9
+        created_at = now - timedelta(minutes=rng.randrange(30 * 24 * 60))
+        response = {"Success": success}
+        batch.append(build_order_document(
+            kind, {"shop_id": shop_id, "order_id": f"O-{index}", "amount": amount}, response, created_at, 0.1,
+        ))
+        rollups.record(kind, shop_id, amount, success, moment=created_at)
+    orders.insert_many(batch)
+    rollups.close()
+    return rollups
+
+
+@benchmark(f"stats.totals[{ORDERS},orders]")
+def bench_totals_from_orders():
+    orders = _rollups().collection.database["orders"]
+    since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=DAYS - 1)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {
+            "_id": {"shop_id": "$shop_id", "kind": "$kind", "status": "$status"},
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount_minor"},
+        }},
+    ]
+
+    def run():
+        return list(orders.aggregate(pipeline))
+
+    return run
+
+
+@benchmark(f"stats.totals[{ORDERS},rollups]")
+def bench_totals_from_rollups():
+    rollups = _rollups()
+
+    def run():
+        return rollups.get_totals(DAYS)
+
+    return run
@@ -0,0 +1,70 @@
+"""Поиск пользователей админом (``/find``) по 100k пользователям.
+
+Каждый прогон — ``_QUERIES`` запросов, так что время прогона делённое на
+``_QUERIES`` — время одного ответа. ``prefix`` — начало shop_id (десятки
+совпадений, ответ обрезается по ``USER_SEARCH_LIMIT``), ``substring`` — часть
+username, которая не совпадает с началом ни одного поля, ``miss`` — запрос
+без совпадений (полный проход ``str.find`` по всем трём полям).
+``database`` — тот же поиск запросом ``$regex`` к базе, которым бот отвечает,
+пока индекс не построен; ``rebuild`` — построение индекса.
+"""
+
+from __future__ import annotations
+
+import functools
+
+from benchmarks.fixtures import make_database
+from benchmarks.runner import benchmark
+from db_utils import UserManager
+from user_search import UserSearchIndex
+
+USERS = 100_000
+_QUERIES = 100
+
+
+@functools.lru_cache(maxsize=None)
+def _index() -> UserSearchIndex:
+    user_manager = UserManager(make_database(USERS))
+    user_manager.backfill_username_keys()
+    user_manager.legacy_username_lookup = False
+    index = UserSearchIndex(user_manager)
+    index.rebuild()
+    return index
+
+
+def _search(queries, database: bool = False):
+    index = _index()
+    search = index.search_database if database else index.search
+    queries = (queries * _QUERIES)[:_QUERIES]
+
+    def run():
+        for query in queries:
+            search(query)
+
+    return run
+
+
+@benchmark(f"user_search.prefix[{USERS},{_QUERIES}]")
+def bench_prefix():
+    return _search(["shop-12", "@USER_0421", "tag99"])
+
+
+@benchmark(f"user_search.substring[{USERS},{_QUERIES}]")
+def bench_substring():
+    return _search(["_04217", "9999", "r_0000"])
+
+
+@benchmark(f"user_search.miss[{USERS},{_QUERIES}]")
+def bench_miss():
+    return _search(["nobody", "zz-top"])
+
+
+@benchmark(f"user_search.database[{USERS},1]")
+def bench_database():
+    index = _index()
+    return lambda: index.search_database("_04217")
+
+
+@benchmark(f"user_search.rebuild[{USERS}]")
+def bench_rebuild():
+    return _index().rebuild
@@ -0,0 +1,88 @@
+"""Пропускная способность локальных правил проверки полей выплаты.
+
+Каждый прогон проверяет ``_VALUES`` значений, так что время прогона делённое
+на ``_VALUES`` — стоимость одной проверки. ``bad_checksum`` идёт по тому же
+пути, что и корректный IBAN, но заканчивается исключением; ``payout_row`` —
+полная проверка строки файла массовых выплат (9 полей).
+"""
+
+from __future__ import annotations
+
+import random
+
+from benchmarks.runner import benchmark
+from validators import (
+    PAYOUT_ROW_RULES, ValidationError, validate_amount, validate_iban, validate_inn, validate_row,
+)
+
+_VALUES = 10_000
+
+
+def _iban(rng: random.Random) -> str:
+    bban = "".join(rng.choice("0123456789") for _ in range(25))
+    check = 98 - int(bban + "301000") % 97
+    return f"UA{check:02d}{bban}"
+
+
+def _inn(rng: random.Random) -> str:
+    digits = [rng.randrange(10) for _ in range(9)]
+    check = sum(weight * digit for weight, digit in zip((-1, 5, 7, 9, 4, 6, 10, 5, 7), digits)) % 11 % 10
+    return "".join(map(str, digits)) + str(check)
+
+
+def _ibans(rng: random.Random):
+    return [_iban(rng) for _ in range(_VALUES)]
+
+
+def _validate_all(rule, values):
+    def run():
+        for value in values:
+            try:
+                rule(value)
+            except ValidationError:
+                pass
+
+    return run
+
+
+@benchmark(f"validators.iban[valid,{_VALUES}]")
+def bench_iban_valid():
+    return _validate_all(validate_iban, _ibans(random.Random(1)))
+
+
+@benchmark(f"validators.iban[bad_checksum,{_VALUES}]")
+def bench_iban_bad_checksum():
+    ibans = [iban[:4] + iban[5:] + str((int(iban[4]) + 1) % 10) for iban in _ibans(random.Random(2))]
+    return _validate_all(validate_iban, ibans)
+
+
+@benchmark(f"validators.inn[{_VALUES}]")
+def bench_inn():
+    rng = random.Random(3)
+    return _validate_all(validate_inn, [_inn(rng) for _ in range(_VALUES)])
+
+
+@benchmark(f"validators.amount[{_VALUES}]")
+def bench_amount():
+    rng = random.Random(4)
+    amounts = [f"{rng.randrange(1, 100_000)}{rng.choice(['', '.5', ',75', '.05'])}" for _ in range(_VALUES)]
+    return _validate_all(validate_amount, amounts)
+
+
+@benchmark(f"validators.payout_row[{_VALUES}]")
+def bench_payout_row():
+    rng = random.Random(5)
+    rows = [
+        {
+            "order_id": f"P-{index}", "client_id": f"client-{index}", "iban": _iban(rng), "inn": _inn(rng),
+            "surname": "Шевченко", "name": "Тарас", "middlename": "Григорович", "purpose": "Переказ коштів",
+            "amount": f"{rng.randrange(1, 100_000)}.{rng.randrange(100):02d}",
+        }
+        for index in range(_VALUES)
+    ]
+
+    def run():
+        for row in rows:
+            validate_row(row, PAYOUT_ROW_RULES)
+
+    return run
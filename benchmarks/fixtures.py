@@ -0,0 +1,88 @@
+"""Общие данные и заглушки для бенчмарков."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from db_utils import DatabaseManager
+from query_profiler import QueryProfiler
+from tools.fake_mongo import FakeMongoClient
+from tools.load_generator import RecordingBot, UpdateFactory
+
+ADMIN_USERNAME = "bench_admin"
+
+
+def make_database(users: int = 0) -> DatabaseManager:
+    """In-memory база с ``users`` пользователями, половина из которых — мерчанты.
+
+    Коллекции профилируются как в рабочем режиме, но без журнала медленных
+    запросов: полные сканирования in-memory базы медленнее MongoDB с
+    индексами, и предупреждения о них только засоряли бы вывод.
+    """
+
+    profiler = QueryProfiler(threshold_ms=float("inf"), log_path=None)
+    db_manager = DatabaseManager(client=FakeMongoClient(), profiler=profiler)
+    users_collection = db_manager.get_collection("users")
+    settings_collection = db_manager.get_collection("merchant_settings")
+    created = datetime(2024, 1, 1)
+
+    for index in range(users):
+        username = f"user_{index:06d}"
+        is_merchant = index % 2 == 0
+        users_collection.insert_one(
+            {
+                "_id": username,
+                "user_id": 100_000 + index,
+                "username": username,
+                "is_merchant": is_merchant,
+                "created_at": created + timedelta(minutes=index),
+            }
+        )
+        if is_merchant:
+            settings_collection.insert_one(
+                {
+                    "_id": username,
+                    "user_id": 100_000 + index,
+                    "shop_id": f"shop-{index}",
+                    "shop_api_key": f"key-{index:032d}",
+                    "order_id_tag": f"TAG{index}",
+                }
+            )
+    return db_manager
+
+
+def make_user_rows(count: int) -> List[Dict[str, Any]]:
+    """Строки в формате UserManager.get_all_users без обращения к базе."""
+
+    return [
+        {
+            "user_id": 100_000 + index,
+            "username": f"user_{index:06d}",
+            "is_merchant": index % 2 == 0,
+            "shop_id": f"shop-{index}" if index % 2 == 0 else None,
+            "shop_api_key": f"key-{index:032d}" if index % 2 == 0 else None,
+            "order_id_tag": f"TAG{index}" if index % 4 == 0 else None,
+        }
+        for index in range(count)
+    ]
+
+
+def make_bot_stub(users: List[Dict[str, Any]] = ()) -> SimpleNamespace:
+    """Заглушка MerchantBot с ответами без обращения к базе."""
+
+    return SimpleNamespace(
+        is_admin=lambda username: username == ADMIN_USERNAME,
+        is_merchant=lambda user_id: True,
+        get_all_users=lambda: list(users),
+        get_merchant_settings=lambda user_id: {"shop_id": "shop-1", "shop_api_key": "key-1", "order_id_tag": "TAG1"},
+    )
+
+
+def make_update_factory(username: str = "bench_merchant", user_id: int = 1) -> UpdateFactory:
+    return UpdateFactory(RecordingBot(), user_id, username)
+
+
+def make_context() -> SimpleNamespace:
+    return SimpleNamespace(user_data={}, bot=RecordingBot())
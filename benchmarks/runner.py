@@ -0,0 +1,188 @@
+"""Запуск микробенчмарков, сохранение результатов в JSON и сравнение с базовой линией.
+
+Использование::
+
+    python -m benchmarks run --output benchmarks/baseline.json
+    python -m benchmarks run --output current.json
+    python -m benchmarks compare benchmarks/baseline.json current.json --threshold 0.15
+
+Бенчмарк — функция подготовки, зарегистрированная декоратором ``@benchmark``.
+Она выполняет подготовку данных (не входит в замер) и возвращает измеряемый
+вызываемый объект: обычную функцию или корутинную функцию без аргументов.
+Если бенчмарк меняет глобальное состояние (например, настройки логгеров),
+подготовка может вернуть пару ``(func, teardown)``; ``teardown`` вызывается
+после замера.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import pkgutil
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+_REGISTRY: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str) -> Callable:
+    """Зарегистрировать функцию подготовки бенчмарка под указанным именем."""
+
+    def decorator(setup: Callable[[], Callable[[], Any]]) -> Callable[[], Callable[[], Any]]:
+        if name in _REGISTRY:
+            raise ValueError(f"Бенчмарк {name!r} уже зарегистрирован")
+        _REGISTRY[name] = setup
+        return setup
+
+    return decorator
+
+
+def discover() -> Dict[str, Callable[[], Callable[[], Any]]]:
+    """Импортировать все модули benchmarks.bench_* и вернуть реестр."""
+
+    package_dir = os.path.dirname(__file__)
+    for module in pkgutil.iter_modules([package_dir]):
+        if module.name.startswith("bench_"):
+            importlib.import_module(f"{__package__}.{module.name}")
+    return _REGISTRY
+
+
+def _timer(func: Callable[[], Any], loop: Optional[asyncio.AbstractEventLoop]) -> Callable[[int], float]:
+    """Вернуть функцию, измеряющую ``number`` последовательных вызовов."""
+
+    if loop is None:
+        def run(number: int) -> float:
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            return time.perf_counter() - started
+
+        return run
+
+    async def batch(number: int) -> float:
+        started = time.perf_counter()
+        for _ in range(number):
+            await func()
+        return time.perf_counter() - started
+
+    return lambda number: loop.run_until_complete(batch(number))
+
+
+def measure(func: Callable[[], Any], min_time: float = 0.2, repeats: int = 5) -> Dict[str, float]:
+    """Замерить время одного вызова: калибровка числа повторов и ``repeats`` прогонов."""
+
+    is_async = asyncio.iscoroutinefunction(func)
+    if not is_async and asyncio.iscoroutine(probe := func()):
+        probe.close()
+        raise TypeError("Асинхронный бенчмарк должен возвращать корутинную функцию (async def)")
+
+    loop = asyncio.new_event_loop() if is_async else None
+    try:
+        run = _timer(func, loop)
+        number = 1
+        while True:
+            elapsed = run(number)
+            if elapsed >= min_time or number >= 1_000_000:
+                break
+            number *= 10 if elapsed < min_time / 10 else 2
+
+        samples = [run(number) / number for _ in range(repeats)]
+    finally:
+        if loop is not None:
+            loop.close()
+
+    return {
+        "median_us": statistics.median(samples) * 1e6,
+        "min_us": min(samples) * 1e6,
+        "max_us": max(samples) * 1e6,
+        "number": number,
+        "repeats": repeats,
+    }
+
+
+def run_benchmarks(pattern: Optional[str] = None, min_time: float = 0.2, repeats: int = 5) -> Dict[str, Any]:
+    registry = discover()
+    results: Dict[str, Dict[str, float]] = {}
+    for name in sorted(registry):
+        if pattern and pattern not in name:
+            continue
+        prepared = registry[name]()
+        func, teardown = prepared if isinstance(prepared, tuple) else (prepared, None)
+        try:
+            results[name] = measure(func, min_time=min_time, repeats=repeats)
+        finally:
+            if teardown is not None:
+                teardown()
+        print(f"{name:<55} {results[name]['median_us']:>12.2f} мкс", flush=True)
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Сравнить медианы и вернуть список бенчмарков с регрессией выше порога."""
+
+    regressions = []
+    print(f"{'Бенчмарк':<55}{'база, мкс':>12}{'сейчас, мкс':>14}{'изм.':>9}")
+    for name, stats in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<55}{'—':>12}{stats['median_us']:>14.2f}{'new':>9}")
+            continue
+        change = stats["median_us"] / base["median_us"] - 1 if base["median_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  ⚠️ регрессия"
+        print(f"{name:<55}{base['median_us']:>12.2f}{stats['median_us']:>14.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Микробенчмарки горячих путей бота")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="выполнить бенчмарки")
+    run_parser.add_argument("--filter", help="запускать только бенчмарки, содержащие подстроку")
+    run_parser.add_argument("--output", help="сохранить результаты в JSON (например, базовую линию)")
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="минимальная длительность одного прогона, с")
+    run_parser.add_argument("--repeats", type=int, default=5)
+
+    compare_parser = subparsers.add_parser("compare", help="сравнить результаты с базовой линией")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.15, help="допустимое замедление (0.15 = 15%%)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmarks(args.filter, args.min_time, args.repeats)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    with open(args.current, encoding="utf-8") as fh:
+        current = json.load(fh)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\nРегрессии выше {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""Массовое создание инвойсов и выплат из CSV-файла.
+
+Мерчант отправляет команду ``/bulk_invoices`` или ``/bulk_payouts``, а затем
+CSV-документ. Обработка идёт фоновой задачей (``coordinator.spawn``):
+
+* файл читается построчно, строки не собираются в список;
+* одновременно обрабатывается до ``BULK_CONCURRENCY`` строк, результаты
+  записываются в выходной CSV в порядке строк исходного файла;
+* пустой ``order_id`` заполняется из блока ID, выделенного одним обновлением
+  счётчика ``order_counters`` (``OrderManager.allocate_order_ids``);
+* прогресс показывается в одном сообщении, которое редактируется не чаще
+  раза в ``BULK_PROGRESS_INTERVAL`` секунд.
+
+По завершении мерчант получает CSV с результатом каждой строки. Если
+обработку прервала остановка бота, приходит файл с уже обработанными строками.
+
+Инвойсы создаются сразу по мере чтения файла. Выплаты сначала целиком
+проверяются локально (``validators.PAYOUT_ROW_RULES``: IBAN с контрольной
+суммой, ИНН, сумма), мерчант подтверждает общую сводку, и только после этого
+уходят запросы к API. Каждая выплата получает ключ идемпотентности, который
+занимается вставкой в коллекцию ``payout_idempotency`` до запроса: повторная
+отправка того же файла или строки с тем же ``order_id`` не создаст выплату
+второй раз.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import csv
+import hashlib
+import io
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple,
+)
+
+from pymongo.errors import DuplicateKeyError
+
+from api_client import Konvert2payAPI
+from config import BULK_CONCURRENCY, BULK_MAX_ROWS, BULK_ORDER_ID_BLOCK, BULK_PROGRESS_INTERVAL
+from constants import Messages
+from metrics import Counter
+from stats_rollups import record_outcome
+from validators import INVOICE_ROW_RULES, PAYOUT_ROW_RULES, validate_row
+
+logger = logging.getLogger(__name__)
+
+BULK_ROWS = Counter(
+    "bulk_rows_total",
+    "Строки массовой обработки по типу заказа и результату",
+    ("kind", "status"),
+)
+
+INVOICE_REQUIRED_COLUMNS = ("client_id", "amount")
+INVOICE_RESULT_COLUMNS = (
+    "row", "order_id", "client_id", "amount", "status", "invoice_id", "pay_url", "error_code", "error_message",
+)
+
+PAYOUT_REQUIRED_COLUMNS = ("client_id", "iban", "inn", "surname", "name", "purpose", "amount")
+PAYOUT_RESULT_COLUMNS = (
+    "row", "order_id", "client_id", "iban", "amount", "status", "withdrawal_id", "error_code", "error_message",
+)
+
+Row = Tuple[int, Dict[str, str]]
+# Номер строки, исходные значения, нормализованные значения и ошибки проверки
+CheckedRow = Tuple[int, Dict[str, str], Dict[str, Any], List[str]]
+
+
+class BulkFileError(ValueError):
+    """Файл нельзя обработать: пустой, без нужных колонок или не в UTF-8."""
+
+
+def read_csv_rows(stream: io.BufferedIOBase, required: Sequence[str]) -> Iterator[Row]:
+    """Строки CSV с номером строки в файле; разделитель — запятая, точка с запятой или табуляция.
+
+    Имена колонок приводятся к нижнему регистру, значения очищаются от
+    пробелов, пустые строки пропускаются.
+    """
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        header = text.readline()
+    except UnicodeDecodeError:
+        raise BulkFileError("файл должен быть в кодировке UTF-8")
+    if not header.strip():
+        raise BulkFileError("файл пуст")
+    try:
+        dialect = csv.Sniffer().sniff(header, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    columns = [name.strip().lower() for name in next(csv.reader([header], dialect))]
+    missing = [column for column in required if column not in columns]
+    if missing:
+        raise BulkFileError(f"нет колонок: {', '.join(missing)}")
+
+    reader = csv.DictReader(text, fieldnames=columns, dialect=dialect)
+    try:
+        for row in reader:
+            values = {key: (value or "").strip() for key, value in row.items() if isinstance(key, str)}
+            if any(values.values()):
+                # line_num не учитывает заголовок, прочитанный до создания reader
+                yield reader.line_num + 1, values
+    except UnicodeDecodeError:
+        raise BulkFileError("файл должен быть в кодировке UTF-8")
+
+
+async def run_ordered(items: Iterable[Any], worker: Callable[..., Awaitable[Dict[str, Any]]],
+                      concurrency: int = BULK_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """Обработать элементы параллельно (не более ``concurrency``) и отдавать результаты по порядку."""
+
+    pending: Deque[asyncio.Future] = deque()
+    try:
+        for item in items:
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+            pending.append(asyncio.ensure_future(worker(*item)))
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class OrderIdAllocator:
+    """ID заказов из блоков, выделяемых одним обновлением счётчика.
+
+    Невостребованные номера последнего блока пропускаются — в нумерации
+    остаётся разрыв, но номера не повторяются.
+    """
+
+    def __init__(self, order_manager, user_id: int, block: int = BULK_ORDER_ID_BLOCK):
+        self.order_manager = order_manager
+        self.user_id = user_id
+        self.block = block
+        self._ids: Deque[str] = deque()
+        self._lock = asyncio.Lock()
+
+    async def next(self) -> str:
+        async with self._lock:
+            if not self._ids:
+                loop = asyncio.get_running_loop()
+                self._ids.extend(await loop.run_in_executor(
+                    None, self.order_manager.allocate_order_ids, self.user_id, self.block,
+                ))
+            return self._ids.popleft()
+
+
+class ProgressMessage:
+    """Сообщение с прогрессом, которое редактируется не чаще раза в ``interval`` секунд."""
+
+    def __init__(self, bot, chat_id: int, message_id: int, interval: float = BULK_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self._text: Optional[str] = None
+        self._edited = 0.0
+
+    async def update(self, text: str, force: bool = False) -> None:
+        now = time.monotonic()
+        if text == self._text or (not force and now - self._edited < self.interval):
+            return
+        self._text, self._edited = text, now
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+        except Exception as exc:
+            # Прогресс вспомогательный: ошибка редактирования не прерывает обработку
+            logger.warning("Не удалось обновить прогресс: %s", exc)
+
+
+class InvoiceBatch:
+    """Создание инвойсов по строкам файла от имени одного мерчанта."""
+
+    kind = "invoice"
+    required_columns = INVOICE_REQUIRED_COLUMNS
+    result_columns = INVOICE_RESULT_COLUMNS
+    result_filename = "invoices_result.csv"
+    statuses = ("created", "error", "invalid")
+
+    def __init__(self, settings: Dict[str, Any], user_info: Dict[str, Any], allocator: OrderIdAllocator):
+        self.shop_id = settings.get("shop_id")
+        self.shop_api_key = settings.get("shop_api_key")
+        self.user_info = user_info
+        self.allocator = allocator
+
+    async def process(self, number: int, row: Dict[str, str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"row": number, "order_id": row.get("order_id", ""),
+                                  "client_id": row.get("client_id", ""), "amount": row.get("amount", "")}
+        values, errors = validate_row(row, INVOICE_ROW_RULES)
+        if errors:
+            result.update(status="invalid", error_message="; ".join(errors))
+            return result
+
+        try:
+            await self._send(result, values)
+        except Exception as exc:
+            # Ошибка одной строки не должна отменять соседние: их инвойсы могли быть уже созданы
+            logger.exception("Ошибка обработки строки %s файла инвойсов", number)
+            if "status" not in result:
+                result.update(status="error", error_message=str(exc) or repr(exc))
+        return result
+
+    async def _send(self, result: Dict[str, Any], values: Dict[str, Any]) -> None:
+        if not result["order_id"]:
+            result["order_id"] = await self.allocator.next()
+        amount = values["amount"]
+        response = await Konvert2payAPI.create_invoice(
+            self.shop_id, self.shop_api_key, result["order_id"], values["client_id"], amount, self.user_info,
+        )
+        success = bool(response.get("Success"))
+        if success:
+            data = response.get("Data") or {}
+            result.update(status="created", invoice_id=data.get("invoice_id"), pay_url=data.get("pay_url"))
+        else:
+            error = response.get("Error") or {}
+            result.update(status="error", error_code=error.get("Code"), error_message=error.get("Message"))
+        record_outcome(self.kind, self.shop_id, amount, success)
+
+
+def payout_idempotency_key(shop_id: str, reference: str) -> str:
+    """Ключ идемпотентности выплаты магазина по ``order_id`` или месту строки в файле."""
+
+    return hashlib.sha256(f"{shop_id}|{reference}".encode()).hexdigest()[:32]
+
+
+class PayoutClaims:
+    """Ключи идемпотентности выплат в коллекции ``payout_idempotency``.
+
+    Ключ занимается вставкой документа с ``_id`` = ключ до запроса к API,
+    поэтому из двух одновременных попыток выплату отправит только одна.
+    Методы синхронные и вызываются через ``run_in_executor``.
+    """
+
+    def __init__(self, db_manager):
+        self.collection = db_manager.get_collection("payout_idempotency")
+
+    def claim(self, key: str, document: Dict[str, Any]) -> bool:
+        try:
+            self.collection.insert_one({"_id": key, "status": "pending", "created_at": datetime.utcnow(), **document})
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def complete(self, key: str, status: str, withdrawal_id: Any = None) -> None:
+        self.collection.update_one(
+            {"_id": key}, {"$set": {"status": status, "withdrawal_id": withdrawal_id, "updated_at": datetime.utcnow()}},
+        )
+
+    def release(self, key: str) -> None:
+        """Освободить ключ: API отказал, выплату можно отправить заново."""
+
+        self.collection.delete_one({"_id": key})
+
+
+def check_payout_rows(stream: io.BufferedIOBase, max_rows: int = BULK_MAX_ROWS) -> List[CheckedRow]:
+    """Прочитать и проверить все строки файла выплат до обращения к API.
+
+    Файл длиннее ``max_rows`` строк отклоняется целиком: выплаты не
+    отправляются частично.
+    """
+
+    checked: List[CheckedRow] = []
+    for number, row in read_csv_rows(stream, PAYOUT_REQUIRED_COLUMNS):
+        if len(checked) >= max_rows:
+            raise BulkFileError(f"больше {max_rows} строк")
+        values, errors = validate_row(row, PAYOUT_ROW_RULES)
+        checked.append((number, row, values, errors))
+    if not checked:
+        raise BulkFileError("нет строк с данными")
+    return checked
+
+
+def payout_errors_csv(checked: Sequence[CheckedRow]) -> bytes:
+    """CSV со строками, не прошедшими проверку, и причинами."""
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(("row", "order_id", "client_id", "errors"))
+    for number, row, _, errors in checked:
+        if errors:
+            writer.writerow((number, row.get("order_id", ""), row.get("client_id", ""), "; ".join(errors)))
+    return output.getvalue().encode("utf-8-sig")
+
+
+class PayoutBatch:
+    """Отправка проверенных выплат по строкам файла от имени одного мерчанта."""
+
+    kind = "payout"
+    required_columns = PAYOUT_REQUIRED_COLUMNS
+    result_columns = PAYOUT_RESULT_COLUMNS
+    result_filename = "payouts_result.csv"
+    statuses = ("created", "error", "unknown", "duplicate", "invalid")
+
+    def __init__(self, settings: Dict[str, Any], user_info: Dict[str, Any], allocator: OrderIdAllocator,
+                 claims: PayoutClaims, file_key: str):
+        self.shop_id = settings.get("shop_id")
+        self.shop_api_key = settings.get("shop_api_key")
+        self.user_info = user_info
+        self.allocator = allocator
+        self.claims = claims
+        self.file_key = file_key
+
+    async def process(self, number: int, row: Dict[str, str], values: Dict[str, Any],
+                      errors: List[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"row": number, "order_id": row.get("order_id", ""),
+                                  "client_id": row.get("client_id", ""), "iban": row.get("iban", ""),
+                                  "amount": row.get("amount", "")}
+        if errors:
+            result.update(status="invalid", error_message="; ".join(errors))
+            return result
+
+        # Явный order_id защищает и от повторной загрузки в другом файле,
+        # без него — от повторной отправки того же файла
+        key = payout_idempotency_key(self.shop_id, values["order_id"] or f"{self.file_key}:{number}")
+        claimed = False
+        try:
+            loop = asyncio.get_running_loop()
+            claimed = await loop.run_in_executor(None, self.claims.claim, key, {
+                "shop_id": self.shop_id, "user_id": self.user_info.get("user_id"), "row": number,
+            })
+            if not claimed:
+                result.update(status="duplicate", error_message="выплата уже отправлялась")
+                return result
+            await self._send(result, values, key)
+        except Exception as exc:
+            logger.exception("Ошибка обработки строки %s файла выплат", number)
+            if "status" not in result:
+                # Ключ уже занят — выплата могла уйти, повторная отправка его не освободит
+                result.update(status="unknown" if claimed else "error", error_message=str(exc) or repr(exc))
+        return result
+
+    async def _send(self, result: Dict[str, Any], values: Dict[str, Any], key: str) -> None:
+        loop = asyncio.get_running_loop()
+        if not result["order_id"]:
+            result["order_id"] = await self.allocator.next()
+        amount = values["amount"]
+        response = await Konvert2payAPI.create_payout(
+            self.shop_id, self.shop_api_key, result["order_id"], values["client_id"], values["iban"],
+            values["inn"], values["surname"], values["name"], values["middlename"], values["purpose"],
+            amount, self.user_info, idempotency_key=key,
+        )
+        success = bool(response.get("Success"))
+        record_outcome(self.kind, self.shop_id, amount, success)
+        error = response.get("Error") or {}
+        if success:
+            data = response.get("Data") or {}
+            result.update(status="created", withdrawal_id=data.get("withdrawal_id"))
+            await loop.run_in_executor(None, self.claims.complete, key, "created", data.get("withdrawal_id"))
+        elif response.get("Uncertain"):
+            # Ответ API не получен: неизвестно, создана ли выплата, поэтому ключ
+            # идемпотентности остаётся занятым и повторная отправка не удвоит её
+            result.update(status="unknown", error_code=error.get("Code"), error_message=error.get("Message"))
+            await loop.run_in_executor(None, self.claims.complete, key, "unknown")
+        else:
+            result.update(status="error", error_code=error.get("Code"), error_message=error.get("Message"))
+            await loop.run_in_executor(None, self.claims.release, key)
+
+
+def _progress_text(batch, counts: Dict[str, int], done: bool = False) -> str:
+    template = Messages.BULK_DONE if done else Messages.BULK_PROGRESS
+    lines = [template.format(processed=sum(counts.values()))]
+    lines.extend(f"• {Messages.BULK_STATUS_LABELS[status]}: {counts[status]}" for status in batch.statuses)
+    return "\n".join(lines)
+
+
+async def download_document(bot, file_id: str) -> io.BytesIO:
+    """Содержимое документа Telegram в памяти (размер ограничен ``BULK_MAX_FILE_SIZE``)."""
+
+    telegram_file = await bot.get_file(file_id)
+    buffer = io.BytesIO()
+    await telegram_file.download_to_memory(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+async def process_rows(bot, chat_id: int, rows: Callable[[], Iterable[Any]], batch,
+                       notes: Sequence[str] = ()) -> Dict[str, int]:
+    """Обработать строки ``batch.process`` и отправить мерчанту CSV с результатом.
+
+    ``rows`` вызывается уже внутри задачи, чтобы ошибки чтения файла
+    показывались в сообщении прогресса. ``notes`` дописываются к подписи
+    итогового файла после обработки.
+    """
+
+    status = await bot.send_message(chat_id=chat_id, text=Messages.BULK_STARTED)
+    progress = ProgressMessage(bot, chat_id, status.message_id)
+    counts = dict.fromkeys(batch.statuses, 0)
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=batch.result_columns, extrasaction="ignore")
+    writer.writeheader()
+
+    async def send_result(caption: str) -> None:
+        document = output.getvalue().encode("utf-8-sig")
+        await bot.send_document(chat_id=chat_id, document=document, filename=batch.result_filename, caption=caption)
+
+    try:
+        # aclosing отменяет строки в работе сразу, а не при сборке мусора генератора
+        async with contextlib.aclosing(run_ordered(rows(), batch.process)) as results:
+            async for result in results:
+                counts[result["status"]] += 1
+                BULK_ROWS.inc(batch.kind, result["status"])
+                writer.writerow(result)
+                await progress.update(_progress_text(batch, counts))
+    except BulkFileError as exc:
+        await progress.update(Messages.BULK_FILE_ERROR.format(error=exc), force=True)
+        return counts
+    except asyncio.CancelledError:
+        interrupted = Messages.BULK_INTERRUPTED.format(processed=sum(counts.values()))
+        try:
+            await progress.update(interrupted, force=True)
+            await send_result(interrupted)
+        except Exception as exc:
+            logger.error("Не удалось отправить частичный результат массовой обработки: %s", exc)
+        raise
+    except Exception:
+        logger.exception("Массовая обработка (%s) прервана ошибкой: %s", batch.kind, counts)
+        failed = Messages.BULK_FAILED.format(processed=sum(counts.values()))
+        try:
+            await progress.update(failed, force=True)
+            await send_result(failed)
+        except Exception as exc:
+            logger.error("Не удалось отправить частичный результат массовой обработки: %s", exc)
+        return counts
+
+    caption = _progress_text(batch, counts, done=True)
+    await progress.update(caption, force=True)
+    await send_result("\n".join([caption, *notes]))
+    logger.info("Массовая обработка (%s) завершена: %s", batch.kind, counts)
+    return counts
+
+
+async def run_batch(bot, chat_id: int, file_id: str, batch) -> Dict[str, int]:
+    """Скачать файл и обработать строки по мере чтения (массовые инвойсы)."""
+
+    notes: List[str] = []
+
+    def limited() -> Iterator[Row]:
+        for index, item in enumerate(read_csv_rows(buffer, batch.required_columns)):
+            if index >= BULK_MAX_ROWS:
+                notes.append(Messages.BULK_TRUNCATED.format(limit=BULK_MAX_ROWS))
+                return
+            yield item
+
+    buffer = await download_document(bot, file_id)
+    return await process_rows(bot, chat_id, limited, batch, notes)
+
+
+async def run_payouts(bot, chat_id: int, checked: Sequence[CheckedRow], batch: PayoutBatch) -> Dict[str, int]:
+    """Отправить подтверждённые мерчантом выплаты; строки с ошибками попадают в результат как ``invalid``."""
+
+    return await process_rows(bot, chat_id, lambda: iter(checked), batch)
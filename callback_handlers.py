@@ -5,6 +5,9 @@ from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboard
 from telegram.ext import ContextTypes
 from states import UserState, StateManager
 from api_client import Konvert2payAPI
+from constants import Messages
+from shutdown import coordinator
+from stats_rollups import record_outcome
 import logging
 
 logger = logging.getLogger(__name__)
@@ -41,6 +44,10 @@ class CallbackHandlers:
         elif data in ["confirm_payout", "cancel_payout"]:
             return await self._handle_payout_confirmation(query, context, data)
         
+        # Обработка кнопок подтверждения/отмены массовой выплаты
+        elif data in ["bulk_payout_confirm", "bulk_payout_cancel"]:
+            return await self._handle_bulk_payout_confirmation(query, context, data)
+        
         # Обработка кнопки пропуска order_id_tag
         elif data == "skip_order_id_tag":
             return await self._handle_skip_order_id_tag(query, context)
@@ -65,9 +72,8 @@ class CallbackHandlers:
         context.user_data['current_state'] = UserState.WAITING_FOR_INVOICE_ID.value
         context.user_data[UserState.WAITING_FOR_INVOICE_ID.value] = True
         
-        # Отладочная информация
-        print(f"DEBUG: Setting WAITING_FOR_INVOICE_ID state")
-        print(f"DEBUG: context.user_data after setting: {context.user_data}")
+        logger.debug("Выбран метод инвойса: %s", data,
+                     extra={"event": "invoice.method_selected", "user_id": user_id, "method": data})
         
         message = "🎰 Укажите ID инвойса"
         keyboard = [[KeyboardButton("◀️ Главное меню")]]
@@ -143,8 +149,8 @@ class CallbackHandlers:
             await query.edit_message_text("❌ Ошибка: Настройки мерчанта не найдены.")
             return True
             
-        shop_id = settings[1]
-        shop_api_key = settings[2]
+        shop_id = settings.get("shop_id")
+        shop_api_key = settings.get("shop_api_key")
         invoice_order_id = context.user_data.get('invoice_order_id')
         client_id = context.user_data.get('invoice_client_id')
         amount = context.user_data.get('invoice_amount')
@@ -158,6 +164,7 @@ class CallbackHandlers:
         
         # Создаем инвойс через API
         result = await Konvert2payAPI.create_invoice(shop_id, shop_api_key, invoice_order_id, client_id, amount, user_info)
+        record_outcome("invoice", shop_id, amount, bool(result.get('Success')))
         
         if result.get('Success'):
             # Успешное создание инвойса
@@ -223,8 +230,8 @@ class CallbackHandlers:
             await query.edit_message_text("❌ Ошибка: Настройки мерчанта не найдены.")
             return True
             
-        shop_id = settings[1]
-        shop_api_key = settings[2]
+        shop_id = settings.get("shop_id")
+        shop_api_key = settings.get("shop_api_key")
         payout_order_id = context.user_data.get('payout_order_id')
         client_id = context.user_data.get('payout_client_id')
         iban_account = context.user_data.get('payout_iban_account')
@@ -246,6 +253,7 @@ class CallbackHandlers:
         result = await Konvert2payAPI.create_payout(shop_id, shop_api_key, payout_order_id, client_id, 
                                                    iban_account, iban_inn, surname, name, middlename, 
                                                    purpose, amount, user_info)
+        record_outcome("payout", shop_id, amount, bool(result.get('Success')))
         
         if result.get('Success'):
             # Успешное создание выплаты
@@ -301,6 +309,43 @@ class CallbackHandlers:
         StateManager.clear_payout_states(context)
         return True
     
+    async def _handle_bulk_payout_confirmation(self, query, context: ContextTypes.DEFAULT_TYPE, data: str):
+        """Подтверждение/отмена массовой выплаты из файла"""
+        from bulk_orders import OrderIdAllocator, PayoutBatch, PayoutClaims, run_payouts
+
+        plan = context.user_data.pop('bulk_payout', None)
+        if plan is None:
+            await query.edit_message_text(Messages.BULK_PAYOUT_EXPIRED)
+            return True
+        if data == "bulk_payout_cancel":
+            await query.edit_message_text(Messages.BULK_PAYOUT_CANCELLED)
+            return True
+
+        user_id = query.from_user.id
+        job = context.user_data.get('bulk_job')
+        if job is not None and not job.done():
+            context.user_data['bulk_payout'] = plan
+            await query.message.reply_text(Messages.BULK_ALREADY_RUNNING)
+            return True
+        settings = self.bot.get_merchant_settings(user_id)
+        if not settings:
+            await query.edit_message_text("❌ Ошибка: Настройки мерчанта не найдены.")
+            return True
+
+        await query.edit_message_text(Messages.BULK_PAYOUT_CONFIRMED.format(valid=plan["valid"], total=plan["total"]))
+        user_info = {
+            "user_id": user_id,
+            "username": query.from_user.username,
+            "shop_id": settings.get("shop_id")
+        }
+        batch = PayoutBatch(settings, user_info, OrderIdAllocator(self.bot.order_manager, user_id),
+                            PayoutClaims(self.bot.db_manager), plan["file_key"])
+        context.user_data['bulk_job'] = coordinator.spawn(
+            run_payouts(context.bot, query.message.chat_id, plan["checked"], batch),
+            "bulk_payouts", user_id=user_id, file_name=plan["file_name"],
+        )
+        return True
+    
     async def _handle_skip_order_id_tag(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Обработка пропуска order_id_tag"""
         username = context.user_data.get('temp_username', 'Не указан')
@@ -0,0 +1,237 @@
+"""Приём callback-уведомлений Konvert2pay о статусах инвойсов и выплат.
+
+Konvert2pay отправляет ``POST`` на ``CALLBACK_PATH`` с JSON-телом::
+
+    {"event_id": "...", "type": "invoice", "shop_id": "...", "order_id": "...", "status": "paid"}
+
+и подписью ``X-Signature`` — HMAC-SHA256 тела с ``CALLBACK_SECRET`` в hex.
+``type`` — ``invoice`` или ``payout``: ``order_id`` выплаты задаёт мерчант,
+поэтому он может совпасть с ``order_id`` инвойса того же магазина, и заказ
+находится по ``(type, shop_id, order_id)``.
+Обработчик запроса делает только дешёвую работу — сверяет подпись, разбирает
+JSON, отбрасывает повторы по ``event_id`` (последние ``CALLBACK_DEDUP_SIZE``
+событий) и ставит событие в очередь — и сразу отвечает 200. Фоновая задача
+забирает из очереди до ``CALLBACK_BATCH_SIZE`` событий и записывает их одним
+обращением к базе в пуле потоков: заказы находятся одним ``find`` с ``$in``
+по индексу ``orders_order_id_idx`` (из документа берётся ``user_id``
+мерчанта), новые статусы пишутся одним ``bulk_write``. Поэтому всплеск в
+тысячи уведомлений в секунду не создаёт тысячи обращений к MongoDB и не
+блокирует цикл событий.
+
+Статус, уже записанный сверкой (``reconciliation.py``) или предыдущим
+callback, повторно не применяется и не дублирует уведомление. Если запись в
+базу не удалась, события забываются в наборе повторов, а заказы остаются на
+сверке и получат статус опросом.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from config import (
+    CALLBACK_BATCH_SIZE, CALLBACK_DEDUP_SIZE, CALLBACK_NOTIFY_CONCURRENCY, CALLBACK_PATH, CALLBACK_SECRET,
+)
+from metrics import Counter
+from reconciliation import FINAL_STATUSES, notify_status_change
+
+logger = logging.getLogger(__name__)
+
+CALLBACKS = Counter(
+    "konvert2pay_callbacks_total",
+    "Callback-уведомления Konvert2pay по результату обработки",
+    ("outcome",),
+)
+
+SIGNATURE_HEADER = "X-Signature"
+
+_REQUIRED_FIELDS = ("event_id", "type", "shop_id", "order_id", "status")
+_PROJECTION = {
+    "kind": 1, "shop_id": 1, "order_id": 1, "user_id": 1, "amount": 1, "amount_minor": 1, "payment_status": 1,
+}
+
+
+def sign(body: bytes, secret: str) -> str:
+    """Подпись тела callback (HMAC-SHA256, hex)."""
+
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class SeenEvents:
+    """Последние ``maxsize`` идентификаторов событий; самые давние вытесняются первыми."""
+
+    def __init__(self, maxsize: int = CALLBACK_DEDUP_SIZE):
+        self.maxsize = maxsize
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, event_id: str) -> bool:
+        """Запомнить событие; ``False``, если оно уже встречалось."""
+
+        if event_id in self._seen:
+            self._seen.move_to_end(event_id)
+            return False
+        self._seen[event_id] = None
+        if len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+        return True
+
+    def discard(self, event_id: str) -> None:
+        self._seen.pop(event_id, None)
+
+
+class CallbackReceiver:
+    """HTTP-эндпоинт callback и пакетная запись статусов в ``orders``."""
+
+    def __init__(self, db_manager, bot, secret: str = CALLBACK_SECRET, dedup_size: int = CALLBACK_DEDUP_SIZE,
+                 batch_size: int = CALLBACK_BATCH_SIZE, notify_concurrency: int = CALLBACK_NOTIFY_CONCURRENCY):
+        if not secret:
+            raise ValueError("Не задан секрет подписи callback (MERCHANT_BOT_CALLBACK_SECRET)")
+        self.orders = db_manager.get_collection("orders")
+        self.bot = bot
+        self.secret = secret.encode()
+        self.seen = SeenEvents(dedup_size)
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._notify_slots = asyncio.Semaphore(notify_concurrency)
+        self._notifications: Set[asyncio.Task] = set()
+        self._writer: Optional[asyncio.Task] = None
+        self._runner = None
+
+    def accept(self, body: bytes, signature: str) -> int:
+        """Проверить и поставить в очередь одно событие; возвращает HTTP-статус ответа."""
+
+        expected = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            CALLBACKS.inc("bad_signature")
+            return 401
+        try:
+            event = json.loads(body)
+            if not all(event.get(field) and isinstance(event[field], str) for field in _REQUIRED_FIELDS):
+                raise ValueError("нет обязательных полей или они не строки")
+        except (ValueError, AttributeError):
+            CALLBACKS.inc("invalid")
+            return 400
+        if not self.seen.add(str(event["event_id"])):
+            CALLBACKS.inc("duplicate")
+            return 200
+        CALLBACKS.inc("accepted")
+        self._queue.put_nowait(event)
+        return 200
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        body = await request.read()
+        return web.Response(status=self.accept(body, request.headers.get(SIGNATURE_HEADER, "")))
+
+    def _write(self, events: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], str]]:
+        """Записать новые статусы пачки событий; возвращает изменённые заказы."""
+
+        order_ids = list({event["order_id"] for event in events})
+        tracked: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        for order in self.orders.find({"order_id": {"$in": order_ids}}, _PROJECTION):
+            # Неудачные попытки создания с тем же order_id статуса оплаты не имеют
+            if "payment_status" in order:
+                tracked[(order["kind"], order["shop_id"], order["order_id"])] = order
+
+        requests, changed = [], []
+        for event in events:
+            order = tracked.get((event["type"], event["shop_id"], event["order_id"]))
+            status = event["status"]
+            if order is None:
+                CALLBACKS.inc("unknown_order")
+                continue
+            if order["payment_status"] in FINAL_STATUSES or order["payment_status"] == status:
+                continue
+            update: Dict[str, Any] = {"$set": {"payment_status": status, "callback_event_id": event["event_id"]}}
+            if status in FINAL_STATUSES:
+                update["$unset"] = {"next_check_at": ""}
+            requests.append(UpdateOne({"_id": order["_id"]}, update))
+            # Следующее событие того же заказа в пачке сравнивается с новым статусом
+            order["payment_status"] = status
+            changed.append((order, status))
+        if requests:
+            self.orders.bulk_write(requests, ordered=False)
+        return changed
+
+    def _drain(self, first: Dict[str, Any]) -> List[Dict[str, Any]]:
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                event = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if event is None:
+                # Признак остановки остаётся в очереди для _run
+                self._queue.put_nowait(None)
+                break
+            batch.append(event)
+        return batch
+
+    async def _apply(self, batch: List[Dict[str, Any]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            changed = await loop.run_in_executor(None, self._write, batch)
+        except PyMongoError as exc:
+            CALLBACKS.inc("write_error", amount=len(batch))
+            logger.error("Не удалось записать статусы из %s callback: %s", len(batch), exc)
+            for event in batch:
+                self.seen.discard(str(event["event_id"]))
+            return
+        for order, status in changed:
+            task = asyncio.ensure_future(self._notify(order, status))
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+
+    async def _notify(self, order: Dict[str, Any], status: str) -> None:
+        async with self._notify_slots:
+            await notify_status_change(self.bot, order, status)
+
+    async def _run(self) -> None:
+        while (event := await self._queue.get()) is not None:
+            batch = self._drain(event)
+            try:
+                await self._apply(batch)
+            except Exception:
+                # Одна неудачная пачка не должна останавливать запись остальных
+                CALLBACKS.inc("write_error", amount=len(batch))
+                logger.exception("Ошибка записи статусов из %s callback", len(batch))
+                for item in batch:
+                    self.seen.discard(str(item["event_id"]))
+
+    async def start(self, host: str, port: int) -> None:
+        """Поднять HTTP-эндпоинт и запустить запись событий."""
+
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post(CALLBACK_PATH, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._writer = asyncio.get_running_loop().create_task(self._run())
+        logger.info("Приём callback Konvert2pay: http://%s:%s%s", host, port, CALLBACK_PATH)
+
+    async def stop(self) -> None:
+        """Перестать принимать callback, записать очередь и дождаться уведомлений."""
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            await self._writer
+            self._writer = None
+        if self._notifications:
+            await asyncio.gather(*self._notifications, return_exceptions=True)
@@ -1,6 +1,8 @@
 # Конфигурация бота
 # Замените YOUR_BOT_TOKEN_HERE на ваш токен от BotFather
 
+import os
+
 BOT_TOKEN = "7608770565:AAGZCjP2IVBgAU4Jaiah7ZomxnZMuRYQb28"
 ADMIN_USERNAME = "vv_vega"
 
@@ -8,14 +10,151 @@ ADMIN_USERNAME = "vv_vega"
 MONGO_URI = "mongodb://localhost:27017"
 MONGO_DB_NAME = "merchant_bot"
 
-# API URLs для Konvert2pay
-API_BASE_URL = "https://konvert2pay.me/api/v1"
+# API URLs для Konvert2pay (переменная окружения позволяет направить бота
+# на локальную заглушку tools/fake_konvert2pay.py)
+API_BASE_URL = os.getenv("KONVERT2PAY_API_BASE_URL", "https://konvert2pay.me/api/v1")
 INVOICE_CREATE_URL = f"{API_BASE_URL}/invoice_create.ashx"
 WITHDRAWAL_CREATE_URL = f"{API_BASE_URL}/withdrawal_create.ashx"
+INVOICE_STATUS_URL = f"{API_BASE_URL}/invoice_status.ashx"
+WITHDRAWAL_STATUS_URL = f"{API_BASE_URL}/withdrawal_status.ashx"
+
+# Таймауты запросов к Konvert2pay (в секундах)
+API_CONNECT_TIMEOUT = 5
+API_SOCK_READ_TIMEOUT = 15
+API_TOTAL_TIMEOUT = 20
+
+# Ограничение параллельных запросов к Konvert2pay: общий лимит (он же размер
+# пула соединений), лимит на один shop_id и веса магазинов в справедливой
+# очереди (shop_id -> вес, по умолчанию 1)
+API_GLOBAL_CONCURRENCY = 20
+API_PER_SHOP_CONCURRENCY = 4
+API_SHOP_WEIGHTS = {}
+
+# Массовое создание заказов из CSV: размер файла (в байтах) и число строк,
+# сколько строк обрабатывается одновременно (запросы сверх лимита магазина
+# всё равно ждут в очереди), сколько ID заказов выделяется за одно обращение
+# к счётчику и как часто обновляется сообщение с прогрессом (в секундах)
+BULK_MAX_FILE_SIZE = 1024 * 1024
+BULK_MAX_ROWS = 1000
+BULK_CONCURRENCY = API_PER_SHOP_CONCURRENCY
+BULK_ORDER_ID_BLOCK = 100
+BULK_PROGRESS_INTERVAL = 2.0
+
+# Выгрузка пользователей и заказов в CSV (/export): файл до EXPORT_SPOOL_SIZE
+# байт держится в памяти, больший пишется во временный файл на диске; курсор
+# MongoDB читается пачками по EXPORT_BATCH_SIZE документов. Telegram принимает
+# от бота документы до EXPORT_MAX_FILE_SIZE байт, больший CSV сжимается в ZIP
+EXPORT_SPOOL_SIZE = 4 * 1024 * 1024
+EXPORT_BATCH_SIZE = 2000
+EXPORT_MAX_FILE_SIZE = 50 * 1024 * 1024
 
 # Webhook URL для отправки уведомлений
-WEBHOOK_URL = "http://webhook-paytoday.online/webhook"
+WEBHOOK_URL = os.getenv("MERCHANT_BOT_WEBHOOK_URL", "http://webhook-paytoday.online/webhook")
+WEBHOOK_TIMEOUT = 10
+
+# Бюджет времени на обработку одного обновления Telegram (в секундах).
+# Исходящие запросы не выходят за пределы оставшегося бюджета.
+UPDATE_DEADLINE = 30
+
+# Плавная остановка: сколько ждать завершения начатых обработок обновлений,
+# запросов к Konvert2pay, webhook и рассылок, прежде чем прервать их (в секундах)
+SHUTDOWN_TIMEOUT = float(os.getenv("MERCHANT_BOT_SHUTDOWN_TIMEOUT", "25"))
+
+# Контроль цикла событий: период пульса и порог, после которого сторожевой
+# поток считает цикл заблокированным и снимает стек (в секундах)
+LOOP_MONITOR_ENABLED = True
+LOOP_MONITOR_INTERVAL = 0.1
+LOOP_BLOCK_THRESHOLD = 0.25
+
+# Согласование индексов MongoDB при запуске: "sync" — до начала работы,
+# "background" — в пуле потоков после запуска приложения
+INDEX_BOOTSTRAP_MODE = os.getenv("MERCHANT_BOT_INDEX_BOOTSTRAP", "sync")
+
+# История инвойсов и выплат (коллекция orders): запись в фоновом потоке
+# пачками до ORDER_HISTORY_BATCH_SIZE документов
+ORDER_HISTORY_ENABLED = os.getenv("MERCHANT_BOT_ORDER_HISTORY_ENABLED", "1") == "1"
+ORDER_HISTORY_BATCH_SIZE = 100
+ORDER_HISTORY_FLUSH_INTERVAL = 1.0
+
+# Сверка статусов созданных инвойсов и выплат: паузы между проверками одного
+# заказа (растут с числом проверок, последняя повторяется), сколько заказов
+# магазина проверяется одним запросом, общий бюджет запросов статуса в
+# секунду, через сколько секунд заказ перестаёт отслеживаться и как часто
+# ищутся заказы, которые пора проверить (в секундах)
+RECONCILE_ENABLED = os.getenv("MERCHANT_BOT_RECONCILE_ENABLED", "1") == "1"
+RECONCILE_INTERVALS = (30, 60, 120, 300, 600, 1800, 3600)
+RECONCILE_BATCH_SIZE = 50
+RECONCILE_RATE = float(os.getenv("MERCHANT_BOT_RECONCILE_RATE", "2"))
+RECONCILE_MAX_AGE = 3 * 24 * 3600
+RECONCILE_TICK = 5.0
+
+# Приём callback-уведомлений Konvert2pay о статусах: адрес встроенного
+# HTTP-эндпоинта, секрет подписи HMAC-SHA256, сколько последних event_id
+# помнить для отбрасывания повторов, сколько событий записывать в базу одной
+# пачкой и сколько уведомлений мерчантам отправлять одновременно
+CALLBACK_ENABLED = os.getenv("MERCHANT_BOT_CALLBACK_ENABLED", "0") == "1"
+CALLBACK_HOST = os.getenv("MERCHANT_BOT_CALLBACK_HOST", "0.0.0.0")
+CALLBACK_PORT = int(os.getenv("MERCHANT_BOT_CALLBACK_PORT", "8090"))
+CALLBACK_PATH = "/konvert2pay/callback"
+CALLBACK_SECRET = os.getenv("MERCHANT_BOT_CALLBACK_SECRET", "")
+CALLBACK_DEDUP_SIZE = 100_000
+CALLBACK_BATCH_SIZE = 500
+CALLBACK_NOTIFY_CONCURRENCY = 20
+
+# Информационный блок держится в памяти; версия в базе сверяется не чаще
+# раза в INFO_CACHE_CHECK_INTERVAL секунд (правки из других процессов бота)
+INFO_CACHE_CHECK_INTERVAL = float(os.getenv("MERCHANT_BOT_INFO_CACHE_CHECK_INTERVAL", "30"))
+
+# Поиск пользователей админом (/find): индекс username, shop_id и
+# order_id_tag в памяти, полная перестройка раз в USER_SEARCH_REFRESH секунд
+# (изменения из других процессов бота), число строк в ответе
+USER_SEARCH_ENABLED = os.getenv("MERCHANT_BOT_USER_SEARCH_ENABLED", "1") == "1"
+USER_SEARCH_REFRESH = float(os.getenv("MERCHANT_BOT_USER_SEARCH_REFRESH", "300"))
+USER_SEARCH_LIMIT = 20
+
+# Сводная статистика по магазинам (коллекция stats_rollups): счётчики
+# копятся в памяти и записываются раз в STATS_FLUSH_INTERVAL секунд
+STATS_ROLLUPS_ENABLED = os.getenv("MERCHANT_BOT_STATS_ROLLUPS_ENABLED", "1") == "1"
+STATS_FLUSH_INTERVAL = float(os.getenv("MERCHANT_BOT_STATS_FLUSH_INTERVAL", "10"))
+STATS_DEFAULT_DAYS = 7
+# Наибольший период /stats в днях
+STATS_MAX_DAYS = 366
+# Сколько магазинов с наибольшим оборотом показывать на экране статистики
+STATS_TOP_SHOPS = 30
+
+# Журнал медленных запросов MongoDB: порог (в мс), файл журнала (без него
+# медленные запросы только пишутся в лог) и минимальный интервал между
+# explain для одной формы запроса (в секундах)
+QUERY_PROFILING_ENABLED = os.getenv("MERCHANT_BOT_QUERY_PROFILING_ENABLED", "1") == "1"
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = os.getenv("MERCHANT_BOT_SLOW_QUERY_LOG")
+SLOW_QUERY_EXPLAIN_INTERVAL = 300
+
+# Трассировка обработки обновлений (по умолчанию выключена): доля выбранных
+# трасс и экспорт спанов ("file" — JSON Lines в TRACE_FILE, только если путь
+# задан, "otlp" — OTLP/HTTP коллектор, "none")
+TRACING_ENABLED = os.getenv("MERCHANT_BOT_TRACING_ENABLED", "0") == "1"
+TRACE_SAMPLE_RATE = float(os.getenv("MERCHANT_BOT_TRACE_SAMPLE_RATE", "0.1"))
+TRACE_EXPORTER = os.getenv("MERCHANT_BOT_TRACE_EXPORTER", "file")
+TRACE_FILE = os.getenv("MERCHANT_BOT_TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("MERCHANT_BOT_TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SERVICE_NAME = "merchant_bot"
+TRACE_EXPORT_BATCH_SIZE = 256
+TRACE_EXPORT_INTERVAL = 2.0
+
+# Локальный HTTP-эндпоинт метрик в формате Prometheus (/metrics)
+METRICS_ENABLED = os.getenv("MERCHANT_BOT_METRICS_ENABLED", "1") == "1"
+METRICS_HOST = os.getenv("MERCHANT_BOT_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("MERCHANT_BOT_METRICS_PORT", "9108"))
 
 # Настройки логирования
-LOG_LEVEL = "INFO"
+LOG_LEVEL = os.getenv("MERCHANT_BOT_LOG_LEVEL", "INFO")
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Вывод логов в JSON (по одной записи на строку)
+LOG_JSON = os.getenv("MERCHANT_BOT_LOG_JSON", "0") == "1"
+# Доля сохраняемых записей по событию (extra={"event": ...}); WARNING и выше
+# сохраняются всегда
+LOG_SAMPLE_RATES = {
+    "invoice.state": 0.1,
+    "invoice.method_selected": 0.1,
+}
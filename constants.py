@@ -40,6 +40,46 @@ class Messages:
     PAYOUT_SUCCESS = "✅ Успех\nВыплата была создана.\n\n• ID выплаты: {withdrawal_id}\n• ID заявки: {order_id}\n• ID Клиента: {client_id}\n• Номер iBAN-счета: {iban_account}\n• ИНН: {iban_inn}\n• ФИО: {full_name}\n• Назначение платежа: {purpose}\n• Сумма: {amount} UAH"
     PAYOUT_ERROR = "⚠️ Ошибка\nВыплата не была создана. Проверьте данные заявки и попробуйте ещё раз.\n\nКод ошибки: {error_code}\nСтатус: {error_message}"
     
+    # Изменение статуса заказа (сверка с Konvert2pay)
+    ORDER_STATUS_CHANGED = "🔔 {kind} {order_id}\n\nСтатус: {status}\n• Сумма: {amount} UAH"
+    ORDER_KIND_LABELS = {"invoice": "Инвойс", "payout": "Выплата"}
+    ORDER_STATUS_LABELS = {
+        "paid": "✅ оплачен",
+        "success": "✅ выплачена",
+        "processing": "⏳ в обработке",
+        "failed": "❌ не прошёл",
+        "expired": "⌛ истёк срок оплаты",
+        "cancelled": "❌ отменён",
+    }
+    
+    # Массовое создание из файла
+    BULK_INVOICE_UPLOAD = "📦 Массовое создание инвойсов\n\nОтправьте CSV-файл (UTF-8, до {max_rows} строк) с колонками:\n• order_id — ID инвойса (если пусто, будет выдан автоматически)\n• client_id — ID Клиента\n• amount — сумма\n\nПример:\norder_id,client_id,amount\nINV-1,client-1,500.00\n,client-2,1250"
+    BULK_PAYOUT_UPLOAD = "💎 Массовая выплата\n\nОтправьте CSV-файл (UTF-8, до {max_rows} строк) с колонками:\n• order_id — ID заявки (если пусто, будет выдан автоматически)\n• client_id — ID Клиента\n• iban — IBAN-счет Клиента (UA…)\n• inn — ИНН Клиента\n• surname, name, middlename — ФИО Клиента (отчество необязательно)\n• purpose — назначение платежа\n• amount — сумма\n\nВсе строки будут проверены до отправки, выплаты уйдут только после подтверждения."
+    BULK_PAYOUT_CONFIRMATION = "💎 Массовая выплата\n\nСтрок в файле: {rows}\n• к выплате: {valid} на сумму {total:.2f} UAH\n• с ошибками: {invalid}\n\nПодтвердите отправку выплат."
+    BULK_PAYOUT_INVALID_ROWS = "⚠️ Строки с ошибками не будут отправлены. Исправьте их и загрузите отдельным файлом."
+    BULK_PAYOUT_NOTHING = "⚠️ В файле нет строк, готовых к выплате. Ошибки — в файле."
+    BULK_PAYOUT_CONFIRMED = "✅ Выплаты подтверждены: {valid} на сумму {total:.2f} UAH."
+    BULK_PAYOUT_CANCELLED = "❌ Массовая выплата отменена"
+    BULK_PAYOUT_EXPIRED = "⚠️ Файл выплат уже обработан или устарел. Загрузите его заново через /bulk_payouts."
+    BULK_USAGE = "📎 Чтобы создать инвойсы или выплаты из файла, отправьте команду /bulk_invoices или /bulk_payouts."
+    BULK_NOT_CSV = "⚠️ Нужен файл в формате CSV."
+    BULK_FILE_TOO_LARGE = "⚠️ Файл больше {limit} КБ. Разбейте его на несколько частей."
+    BULK_ALREADY_RUNNING = "⏳ Предыдущий файл ещё обрабатывается. Дождитесь результата."
+    BULK_STARTED = "📦 Файл получен, начинаю обработку…"
+    BULK_PROGRESS = "📦 Обработано строк: {processed}"
+    BULK_DONE = "✅ Обработка завершена. Строк: {processed}"
+    BULK_STATUS_LABELS = {
+        "created": "создано",
+        "error": "ошибок API",
+        "unknown": "без ответа API (проверьте статус)",
+        "duplicate": "уже отправлялись ранее",
+        "invalid": "неверных строк",
+    }
+    BULK_FILE_ERROR = "⚠️ Файл не обработан: {error}."
+    BULK_INTERRUPTED = "⚠️ Обработка прервана перезапуском бота после {processed} строк. Обработанные строки — в файле."
+    BULK_FAILED = "⚠️ Обработка остановлена из-за ошибки после {processed} строк. Обработанные строки — в файле, остальные загрузите заново."
+    BULK_TRUNCATED = "Обработаны первые {limit} строк, остальные пропущены."
+    
     # Выход из аккаунта
     LOGOUT_CONFIRMATION = "❌ Вы действительно хотите отвязать свой аккаунт от Бота?\n\nЧтобы подтвердить действие, отправьте свой @username в следующем сообщении."
     LOGOUT_SUCCESS = "✅ Аккаунт успешно отвязан от бота."
@@ -59,11 +99,31 @@ class Messages:
     ADMIN_DELETE_USER_SHOP_ID = "❌ Для подтверждения действия отправьте shop_id, к которому был привязан пользователь @{username}."
     ADMIN_DELETE_USER_ERROR = "⚠️ Ошибка\nПодтвердить удаление пользователя не удалось. Указанный shop_id не привязан к заявленному username."
     ADMIN_DELETE_USER_SUCCESS = "❌ Пользователь успешно удален"
+    ADMIN_STATS_TITLE = "📊 Статистика за {days} дн."
+    ADMIN_STATS_SHOP_TITLE = "📊 Статистика магазина {shop_id} за {days} дн."
+    ADMIN_STATS_ROW = "• {label}\n   Инвойсы: {invoice_success} из {invoice_total}, {invoice_amount:.2f} UAH\n   Выплаты: {payout_success} из {payout_total}, {payout_amount:.2f} UAH"
+    ADMIN_STATS_MORE = "…и ещё магазинов: {count}"
+    ADMIN_STATS_EMPTY = "📊 За {days} дн. инвойсов и выплат не было."
+    ADMIN_STATS_DISABLED = "📊 Статистика отключена."
+    ADMIN_STATS_USAGE = "Использование: /stats [shop_id] [дней], период — до {max_days} дней"
+    USER_SEARCH_USAGE = "Использование: /find <запрос> — поиск по username, shop_id или тегу заказов"
+    USER_SEARCH_TITLE = "🔎 Найдено по «{query}»: {count}"
+    USER_SEARCH_ROW = "• @{username} (ID {user_id}) — {role}"
+    USER_SEARCH_SHOP = "\n   Магазин: {shop_id}, тег: {order_id_tag}"
+    USER_SEARCH_EMPTY = "🔎 По «{query}» никого не найдено."
+    USER_SEARCH_DISABLED = "🔎 Поиск пользователей отключён."
+    EXPORT_USAGE = "Использование:\n/export users — все пользователи\n/export orders [с] [по] — заказы за период, даты ГГГГ-ММ-ДД или ДД.ММ.ГГГГ"
+    EXPORT_STARTED = "📤 Готовлю выгрузку, файл придёт отдельным сообщением."
+    EXPORT_DONE = "📤 Выгрузка готова. Строк: {rows}"
+    EXPORT_TOO_LARGE = "⚠️ Выгрузка из {rows} строк не помещается в файл Telegram даже в ZIP. Сузьте период."
+    EXPORT_FAILED = "⚠️ Не удалось подготовить выгрузку. Попробуйте позже."
     
     # Ошибки
     ERROR_MERCHANT_NOT_FOUND = "❌ Ошибка: Настройки мерчанта не найдены."
     ERROR_NOT_MERCHANT = "❌ У вас нет доступа к этому функционалу."
     ERROR_NOT_ADMIN = "❌ У вас нет прав администратора."
+    FIELD_INVALID = "❌ Ошибка: {error}.\n\nВведите значение ещё раз."
+    BOT_RESTARTING = "⏳ Бот перезапускается. Повторите действие через минуту."
 
 # Кнопки
 class Buttons:
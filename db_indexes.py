@@ -0,0 +1,135 @@
+"""Согласование индексов MongoDB при запуске бота.
+
+Для каждой коллекции список существующих индексов запрашивается один раз,
+все желаемые индексы из ``INDEX_PLAN`` сравниваются с ним в памяти, а
+недостающие создаются одним вызовом ``create_indexes``. Повторный запуск
+ничего не создаёт. Индекс с тем же именем, но другим определением не
+пересоздаётся автоматически — о конфликте сообщается в лог.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, List, Mapping
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+INDEX_BOOTSTRAP_DURATION = Gauge(
+    "mongo_index_bootstrap_seconds",
+    "Длительность последнего согласования индексов MongoDB",
+)
+
+# Желаемые индексы по коллекциям. Индекс _id_ создаётся MongoDB автоматически
+# и всегда уникален, поэтому для info_block отдельный индекс не нужен
+# (MongoDB отклоняет параметр unique для индекса по _id).
+INDEX_PLAN: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="users_user_id_unique_idx", unique=True, sparse=True),
+        IndexModel([("username", ASCENDING)], name="users_username_unique_idx", unique=True, sparse=True),
+        # Поиск и удаление по username или ключу документа (UserManager._find_by_username)
+        IndexModel([("username_keys", ASCENDING)], name="users_username_keys_idx"),
+        # Порядок списка пользователей в get_all_users
+        IndexModel([("created_at", DESCENDING), ("username", ASCENDING)], name="users_created_at_username_idx"),
+    ],
+    "merchant_settings": [
+        # OrderManager.get_next_order_id ищет настройки по user_id
+        IndexModel(
+            [("user_id", ASCENDING)], name="merchant_settings_user_id_unique_idx", unique=True, sparse=True,
+        ),
+    ],
+    "order_counters": [
+        IndexModel([("order_id_tag", ASCENDING)], name="order_counters_order_id_tag_unique_idx", unique=True),
+    ],
+    "orders": [
+        # История магазина, новые первыми (OrderHistory.get_shop_history)
+        IndexModel([("shop_id", ASCENDING), ("created_at", DESCENDING)], name="orders_shop_id_created_at_idx"),
+        # Поиск запроса по order_id; не уникален — повторные попытки пишутся отдельно
+        IndexModel([("order_id", ASCENDING)], name="orders_order_id_idx"),
+        # Выгрузка заказов за период (/export orders)
+        IndexModel([("created_at", ASCENDING)], name="orders_created_at_idx"),
+        # Заказы, которые пора сверить (Reconciler._due); у завершённых поля нет
+        IndexModel([("next_check_at", ASCENDING)], name="orders_next_check_at_idx", sparse=True),
+    ],
+    "stats_rollups": [
+        # Суточные счётчики магазина (StatsRollups.get_shop_stats)
+        IndexModel(
+            [("shop_id", ASCENDING), ("period", ASCENDING), ("bucket", ASCENDING)],
+            name="stats_rollups_shop_id_period_bucket_idx",
+        ),
+        # Счётчики всех магазинов за период (StatsRollups.get_totals)
+        IndexModel([("period", ASCENDING), ("bucket", ASCENDING)], name="stats_rollups_period_bucket_idx"),
+    ],
+}
+
+# Параметры, влияющие на поведение индекса; отсутствие равно значению по умолчанию
+_BOOLEAN_OPTIONS = ("unique", "sparse")
+_VALUE_OPTIONS = ("partialFilterExpression", "expireAfterSeconds", "collation")
+
+
+def _key_list(key: Mapping[str, Any]) -> List[tuple]:
+    return [(field, direction) for field, direction in key.items()]
+
+
+def _options_match(existing: Mapping[str, Any], desired: Mapping[str, Any]) -> bool:
+    if any(bool(existing.get(option)) != bool(desired.get(option)) for option in _BOOLEAN_OPTIONS):
+        return False
+    return all(existing.get(option) == desired.get(option) for option in _VALUE_OPTIONS)
+
+
+def plan_collection(existing: List[Mapping[str, Any]], desired: List[IndexModel]) -> Dict[str, List]:
+    """Разделить желаемые индексы на имеющиеся, недостающие и конфликтующие."""
+
+    by_name = {index["name"]: index for index in existing}
+    present, missing, conflicts = [], [], []
+    for model in desired:
+        document = model.document
+        keys = _key_list(document["key"])
+        equivalent = next(
+            (index for index in existing
+             if _key_list(index["key"]) == keys and _options_match(index, document)),
+            None,
+        )
+        if equivalent is not None:
+            present.append(equivalent["name"])
+        elif document["name"] in by_name:
+            conflicts.append(document["name"])
+        else:
+            missing.append(model)
+    return {"present": present, "missing": missing, "conflicts": conflicts}
+
+
+def reconcile_indexes(db_manager, plan: Mapping[str, List[IndexModel]] = INDEX_PLAN) -> Dict[str, Any]:
+    """Создать недостающие индексы; возвращает отчёт с длительностью."""
+
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"checked": 0, "created": [], "conflicts": [], "errors": []}
+
+    for collection_name, desired in plan.items():
+        collection = db_manager.get_collection(collection_name)
+        try:
+            result = plan_collection(list(collection.list_indexes()), desired)
+            report["checked"] += len(desired)
+            if result["missing"]:
+                report["created"].extend(collection.create_indexes(result["missing"]))
+        except PyMongoError as exc:
+            logger.error("Ошибка согласования индексов коллекции %s: %s", collection_name, exc)
+            report["errors"].append(collection_name)
+            continue
+        for name in result["conflicts"]:
+            logger.error("Индекс %s.%s существует с другим определением и не изменён", collection_name, name)
+            report["conflicts"].append(f"{collection_name}.{name}")
+
+    duration = time.perf_counter() - started
+    report["duration_ms"] = round(duration * 1000, 3)
+    INDEX_BOOTSTRAP_DURATION.set(duration)
+    logger.info(
+        "Индексы согласованы за %.1f мс: проверено %s, создано %s",
+        report["duration_ms"], report["checked"], len(report["created"]),
+    )
+    return report
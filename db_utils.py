@@ -3,29 +3,85 @@
 from __future__ import annotations
 
 import logging
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from pymongo import MongoClient, ReturnDocument
+from pymongo import MongoClient, ReturnDocument, UpdateOne
 from pymongo.collection import Collection
 from pymongo.errors import PyMongoError
 
-from config import MONGO_DB_NAME, MONGO_URI
+from config import INFO_CACHE_CHECK_INTERVAL, MONGO_DB_NAME, MONGO_URI, QUERY_PROFILING_ENABLED
+from metrics import Histogram
+from query_profiler import ProfiledCollection, QueryProfiler
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
+DB_OPERATION_LATENCY = Histogram(
+    "mongo_operation_duration_seconds",
+    "Длительность операций менеджеров MongoDB по методам",
+    ("method",),
+)
+
+# Пользователи с настройками мерчанта, новые первыми. Сортировка до $lookup
+# выполняется по индексу users_created_at_username_idx; после $lookup/$unwind
+# она шла бы в памяти по всей коллекции
+USERS_WITH_SETTINGS_PIPELINE: List[Dict[str, Any]] = [
+    {"$sort": {"created_at": -1, "username": 1}},
+    {
+        "$lookup": {
+            "from": "merchant_settings",
+            "localField": "_id",
+            "foreignField": "_id",
+            "as": "settings",
+        }
+    },
+    {"$unwind": {"path": "$settings", "preserveNullAndEmptyArrays": True}},
+]
+
+
+def _operation(name: str):
+    """Учитывать длительность метода в метриках и в спане текущей трассы."""
+
+    timer = DB_OPERATION_LATENCY.time(name)
+
+    def decorator(func):
+        return timer(traced(f"mongo {name}")(func))
+
+    return decorator
+
 
 class DatabaseManager:
     """Менеджер соединений с MongoDB."""
 
-    def __init__(self, mongo_uri: str = MONGO_URI, db_name: str = MONGO_DB_NAME):
-        self.client = MongoClient(mongo_uri)
+    def __init__(
+        self,
+        mongo_uri: str = MONGO_URI,
+        db_name: str = MONGO_DB_NAME,
+        client: Optional[MongoClient] = None,
+        profiler: Optional[QueryProfiler] = None,
+    ):
+        self.client = client if client is not None else MongoClient(mongo_uri)
         self.db = self.client[db_name]
+        if profiler is None and QUERY_PROFILING_ENABLED:
+            profiler = QueryProfiler()
+        self.profiler = profiler
+
+    def close(self) -> None:
+        """Дописать журнал медленных запросов и закрыть пул соединений."""
+
+        if self.profiler is not None:
+            self.profiler.flush()
+        self.client.close()
 
     def get_collection(self, name: str) -> Collection:
         """Возвращает коллекцию MongoDB по имени."""
 
-        return self.db[name]
+        collection = self.db[name]
+        if self.profiler is not None:
+            return ProfiledCollection(collection, self.profiler)
+        return collection
 
 
 class UserManager:
@@ -35,6 +91,23 @@ class UserManager:
         self.db = db_manager
         self.users = self.db.get_collection("users")
         self.merchant_settings = self.db.get_collection("merchant_settings")
+        # Пока username_keys не заполнено у всех документов, промах по нему
+        # повторяется запросом по _id/username
+        self.legacy_username_lookup = True
+        # Подписчики на изменения пользователей и настроек мерчантов (индекс поиска)
+        self._change_listeners: List[Callable[[Any], None]] = []
+
+    def add_change_listener(self, listener: Callable[[Any], None]) -> None:
+        """Вызывать ``listener(ключ документа)`` после каждого изменения пользователя."""
+
+        self._change_listeners.append(listener)
+
+    def _changed(self, user_key: Any) -> None:
+        for listener in self._change_listeners:
+            try:
+                listener(user_key)
+            except Exception:
+                logger.exception("Ошибка обработчика изменения пользователя %s", user_key)
 
     @staticmethod
     def _normalize_username(username: Optional[str]) -> Optional[str]:
@@ -42,14 +115,60 @@ class UserManager:
             return None
         return username.replace("@", "").strip()
 
-    def _get_user_filter(self, identifier: Union[int, str]) -> Dict[str, Any]:
-        if isinstance(identifier, int):
-            return {"user_id": identifier}
-        normalized = self._normalize_username(identifier)
-        if not normalized:
-            return {"username": None}
-        return {"$or": [{"_id": normalized}, {"username": normalized}]}
+    @staticmethod
+    def _username_keys(*names: Any) -> List[str]:
+        """Ключи поиска по username: без ``@`` и в нижнем регистре, без повторов."""
+
+        keys: List[str] = []
+        for name in names:
+            if isinstance(name, str):
+                key = name.replace("@", "").strip().lower()
+                if key and key not in keys:
+                    keys.append(key)
+        return keys
+
+    def _find_by_username(self, username: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Найти пользователя по username или ключу документа одним запросом по индексу."""
+
+        keys = self._username_keys(username)
+        if not keys:
+            return None
+        user = self.users.find_one({"username_keys": keys[0]})
+        if user is None and self.legacy_username_lookup:
+            # Документы, созданные до появления username_keys и ещё не дополненные
+            normalized = self._normalize_username(username)
+            user = self.users.find_one({"$or": [{"_id": normalized}, {"username": normalized}]})
+        return user
+
+    def backfill_username_keys(self, batch_size: int = 1000) -> int:
+        """Заполнить username_keys у документов, созданных до появления поля.
+
+        После успешного заполнения поиск по username больше не обращается к
+        устаревшему фильтру ``$or`` по ``_id``/``username``.
+        """
+
+        updated = 0
+        batch: List[UpdateOne] = []
+        try:
+            cursor = self.users.find({"username_keys": {"$exists": False}}, {"_id": 1, "username": 1})
+            for document in cursor:
+                keys = self._username_keys(document.get("username"), document["_id"])
+                batch.append(UpdateOne({"_id": document["_id"]}, {"$set": {"username_keys": keys}}))
+                if len(batch) >= batch_size:
+                    updated += self.users.bulk_write(batch, ordered=False).modified_count
+                    batch = []
+            if batch:
+                updated += self.users.bulk_write(batch, ordered=False).modified_count
+        except PyMongoError as exc:
+            logger.error("Ошибка заполнения username_keys: %s", exc)
+            return updated
+
+        self.legacy_username_lookup = False
+        if updated:
+            logger.info("Поле username_keys заполнено у %s пользователей", updated)
+        return updated
 
+    @_operation("UserManager.is_merchant")
     def is_merchant(self, user_id: int) -> bool:
         """Проверить, является ли пользователь мерчантом."""
 
@@ -63,6 +182,7 @@ class UserManager:
 
         return username == ADMIN_USERNAME
 
+    @_operation("UserManager.add_user")
     def add_user(self, user_id: int, username: str, is_merchant: bool = False) -> bool:
         """Добавить пользователя или обновить существующего."""
 
@@ -72,12 +192,14 @@ class UserManager:
         try:
             existing = self.users.find_one({"user_id": user_id})
             if not existing and normalized_username:
-                existing = self.users.find_one({"_id": normalized_username})
+                existing = self._find_by_username(normalized_username)
 
             if existing:
+                username_value = normalized_username or existing.get("username")
                 update_fields: Dict[str, Any] = {
                     "user_id": user_id,
-                    "username": normalized_username or existing.get("username"),
+                    "username": username_value,
+                    "username_keys": self._username_keys(username_value, existing["_id"]),
                 }
                 if is_merchant:
                     update_fields["is_merchant"] = True
@@ -89,6 +211,7 @@ class UserManager:
                     "_id": user_key,
                     "user_id": user_id,
                     "username": normalized_username or str(user_id),
+                    "username_keys": self._username_keys(normalized_username or str(user_id)),
                     "is_merchant": is_merchant,
                     "created_at": now,
                 }
@@ -101,29 +224,18 @@ class UserManager:
                 upsert=False,
             )
 
+            self._changed(user_key)
             return True
         except PyMongoError as exc:
             logger.error("Ошибка добавления пользователя: %s", exc)
             return False
 
+    @_operation("UserManager.get_all_users")
     def get_all_users(self) -> List[Dict[str, Any]]:
         """Получить всех пользователей с настройками мерчанта."""
 
-        pipeline = [
-            {
-                "$lookup": {
-                    "from": "merchant_settings",
-                    "localField": "_id",
-                    "foreignField": "_id",
-                    "as": "settings",
-                }
-            },
-            {"$unwind": {"path": "$settings", "preserveNullAndEmptyArrays": True}},
-            {"$sort": {"created_at": -1, "username": 1}},
-        ]
-
         users: List[Dict[str, Any]] = []
-        for document in self.users.aggregate(pipeline):
+        for document in self.users.aggregate(USERS_WITH_SETTINGS_PIPELINE):
             settings = document.get("settings") or {}
             users.append(
                 {
@@ -141,11 +253,13 @@ class UserManager:
 
         return users
 
+    @_operation("UserManager.get_all_merchants")
     def get_all_merchants(self) -> List[Dict[str, Any]]:
         """Получить всех пользователей-мерчантов."""
 
         return [user for user in self.get_all_users() if user.get("is_merchant")]
 
+    @_operation("UserManager.grant_merchant_access")
     def grant_merchant_access(
         self,
         identifier: Union[int, str],
@@ -155,10 +269,11 @@ class UserManager:
     ) -> bool:
         """Предоставить доступ мерчанта."""
 
-        filter_query = self._get_user_filter(identifier)
-
         try:
-            user = self.users.find_one(filter_query)
+            if isinstance(identifier, int):
+                user = self.users.find_one({"user_id": identifier})
+            else:
+                user = self._find_by_username(identifier)
 
             if not user:
                 if isinstance(identifier, int):
@@ -173,6 +288,7 @@ class UserManager:
                 user_document: Dict[str, Any] = {
                     "_id": normalized_username,
                     "username": normalized_username,
+                    "username_keys": self._username_keys(normalized_username),
                     "is_merchant": True,
                     "created_at": now,
                 }
@@ -201,11 +317,13 @@ class UserManager:
                 upsert=True,
             )
 
+            self._changed(user_key)
             return True
         except PyMongoError as exc:
             logger.error("Ошибка предоставления доступа мерчанта: %s", exc)
             return False
 
+    @_operation("UserManager.revoke_merchant_access")
     def revoke_merchant_access(self, user_id: int) -> bool:
         """Отозвать доступ мерчанта."""
 
@@ -216,11 +334,13 @@ class UserManager:
 
             self.users.update_one({"_id": user["_id"]}, {"$set": {"is_merchant": False}})
             self.merchant_settings.delete_one({"_id": user["_id"]})
+            self._changed(user["_id"])
             return True
         except PyMongoError as exc:
             logger.error("Ошибка отзыва доступа мерчанта: %s", exc)
             return False
 
+    @_operation("UserManager.get_merchant_settings")
     def get_merchant_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получить настройки мерчанта."""
 
@@ -230,14 +350,11 @@ class UserManager:
 
         return self.merchant_settings.find_one({"_id": user["_id"]})
 
+    @_operation("UserManager.get_user_by_username")
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """Получить информацию о пользователе по username."""
 
-        normalized_username = self._normalize_username(username)
-        if not normalized_username:
-            return None
-
-        user = self.users.find_one({"$or": [{"_id": normalized_username}, {"username": normalized_username}]})
+        user = self._find_by_username(username)
         if not user:
             return None
 
@@ -254,14 +371,11 @@ class UserManager:
             "created_at": user.get("created_at"),
         }
 
+    @_operation("UserManager.delete_user")
     def delete_user(self, username: str) -> bool:
         """Удалить пользователя."""
 
-        normalized_username = self._normalize_username(username)
-        if not normalized_username:
-            return False
-
-        user = self.users.find_one({"$or": [{"_id": normalized_username}, {"username": normalized_username}]})
+        user = self._find_by_username(username)
         if not user:
             return False
 
@@ -270,6 +384,7 @@ class UserManager:
         try:
             result = self.users.delete_one({"_id": user_key})
             self.merchant_settings.delete_one({"_id": user_key})
+            self._changed(user_key)
             return result.deleted_count > 0
         except PyMongoError as exc:
             logger.error("Ошибка удаления пользователя: %s", exc)
@@ -277,27 +392,81 @@ class UserManager:
 
 
 class InfoManager:
-    """Менеджер для работы с информационным блоком."""
+    """Менеджер для работы с информационным блоком.
 
-    def __init__(self, db_manager: DatabaseManager):
+    Блок меняется редко, а читается на каждое нажатие «📄 Информация», поэтому
+    он держится в памяти вместе с номером версии. ``update_info_content``
+    увеличивает версию в документе; остальные процессы бота сверяют её не
+    чаще раза в ``INFO_CACHE_CHECK_INTERVAL`` секунд (одним запросом с
+    проекцией) и перечитывают содержимое только при расхождении. Между
+    сверками чтение блока не обращается к базе.
+    """
+
+    DEFAULT_CONTENT = "Информационный блок не настроен."
+
+    def __init__(self, db_manager: DatabaseManager, check_interval: float = INFO_CACHE_CHECK_INTERVAL):
         self.db = db_manager
         self.collection = self.db.get_collection("info_block")
+        self.check_interval = check_interval
+        self._cached: Optional[Tuple[int, str]] = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _block(document: Optional[Dict[str, Any]]) -> Tuple[int, str]:
+        if not document:
+            return 0, InfoManager.DEFAULT_CONTENT
+        # Документы, записанные до появления версии, считаются версией 0
+        return document.get("version", 0), document.get("content")
+
+    @_operation("InfoManager.load_info")
+    def _load(self, cached: Optional[Tuple[int, str]]) -> Tuple[int, str]:
+        """Сверить версию с базой и перечитать содержимое, если оно изменилось."""
+
+        if cached is not None:
+            document = self.collection.find_one({"_id": 1}, {"version": 1})
+            if (document or {}).get("version", 0) == cached[0]:
+                return cached
+        return self._block(self.collection.find_one({"_id": 1}))
+
+    def get_info(self) -> Tuple[int, str]:
+        """Версия и содержимое информационного блока: из памяти, со сверкой версии раз в ``check_interval``."""
+
+        cached = self._cached
+        now = time.monotonic()
+        if cached is not None and now - self._checked_at < self.check_interval:
+            return cached
+        try:
+            self._cached = self._load(cached)
+        except PyMongoError as exc:
+            if cached is None:
+                raise
+            # База недоступна: пока отдаётся последняя известная версия
+            logger.warning("Не удалось сверить версию информационного блока: %s", exc)
+        self._checked_at = now
+        return self._cached
 
     def get_info_content(self) -> str:
         """Получить содержимое информационного блока."""
 
-        document = self.collection.find_one({"_id": 1})
-        return document.get("content") if document else "Информационный блок не настроен."
+        return self.get_info()[1]
 
+    @_operation("InfoManager.update_info_content")
     def update_info_content(self, content: str) -> bool:
-        """Обновить содержимое информационного блока."""
+        """Обновить содержимое информационного блока и увеличить его версию."""
 
         try:
-            self.collection.update_one({"_id": 1}, {"$set": {"content": content}}, upsert=True)
-            return True
+            document = self.collection.find_one_and_update(
+                {"_id": 1},
+                {"$set": {"content": content}, "$inc": {"version": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
         except PyMongoError as exc:
             logger.error("Ошибка обновления информационного блока: %s", exc)
             return False
+        self._cached = self._block(document)
+        self._checked_at = time.monotonic()
+        return True
 
 
 class OrderManager:
@@ -308,18 +477,32 @@ class OrderManager:
         self.merchant_settings = self.db.get_collection("merchant_settings")
         self.order_counters = self.db.get_collection("order_counters")
 
-    def get_next_order_id(self, user_id: int) -> str:
-        """Получить следующий ID заказа."""
-
+    def _order_id_tag(self, user_id: int) -> str:
         settings = self.merchant_settings.find_one({"user_id": user_id})
-        order_id_tag = settings.get("order_id_tag") if settings and settings.get("order_id_tag") else "ManagerApple"
+        return settings.get("order_id_tag") if settings and settings.get("order_id_tag") else "ManagerApple"
+
+    def _reserve(self, order_id_tag: str, count: int) -> int:
+        """Увеличить счётчик тега на ``count``; возвращает последний выделенный номер."""
 
         counter_doc = self.order_counters.find_one_and_update(
             {"order_id_tag": order_id_tag},
-            {"$inc": {"counter": 1}},
+            {"$inc": {"counter": count}},
             upsert=True,
             return_document=ReturnDocument.AFTER,
         )
+        return counter_doc.get("counter", count)
+
+    @_operation("OrderManager.get_next_order_id")
+    def get_next_order_id(self, user_id: int) -> str:
+        """Получить следующий ID заказа."""
+
+        order_id_tag = self._order_id_tag(user_id)
+        return f"{order_id_tag}_{self._reserve(order_id_tag, 1)}"
+
+    @_operation("OrderManager.allocate_order_ids")
+    def allocate_order_ids(self, user_id: int, count: int) -> List[str]:
+        """Выделить ``count`` последовательных ID заказов одним обновлением счётчика."""
 
-        counter = counter_doc.get("counter", 1)
-        return f"{order_id_tag}_{counter}"
+        order_id_tag = self._order_id_tag(user_id)
+        last = self._reserve(order_id_tag, count)
+        return [f"{order_id_tag}_{counter}" for counter in range(last - count + 1, last + 1)]
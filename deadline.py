@@ -0,0 +1,71 @@
+"""Бюджет времени (дедлайн) на обработку одного обновления Telegram."""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import time
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, TypeVar
+
+from config import UPDATE_DEADLINE
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("update_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Бюджет времени на обработку обновления исчерпан."""
+
+
+def remaining() -> Optional[float]:
+    """Оставшееся время бюджета в секундах или None, если дедлайн не задан."""
+
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def client_timeout(total: float, connect: Optional[float] = None, sock_read: Optional[float] = None) -> aiohttp.ClientTimeout:
+    """Собрать ClientTimeout, не выходящий за пределы оставшегося бюджета."""
+
+    # aiohttp импортируется при первом запросе, а не при импорте обработчиков
+    import aiohttp
+
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            raise DeadlineExceeded("Бюджет времени обработки обновления исчерпан")
+        total = min(total, left)
+        connect = min(connect, left) if connect is not None else None
+        sock_read = min(sock_read, left) if sock_read is not None else None
+
+    return aiohttp.ClientTimeout(total=total, sock_connect=connect, sock_read=sock_read)
+
+
+def with_deadline(
+    handler: Callable[..., Awaitable[T]],
+    seconds: float = UPDATE_DEADLINE,
+) -> Callable[..., Awaitable[Optional[T]]]:
+    """Обернуть обработчик обновления так, чтобы он не выходил за бюджет времени."""
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        token = _deadline.set(time.monotonic() + seconds)
+        try:
+            return await asyncio.wait_for(handler(update, context, *args, **kwargs), seconds)
+        except asyncio.TimeoutError:
+            logger.warning("Обработчик %s превысил бюджет времени %.1f с", handler.__name__, seconds)
+            return None
+        finally:
+            _deadline.reset(token)
+
+    return wrapper
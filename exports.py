@@ -0,0 +1,207 @@
+"""Выгрузка пользователей и истории заказов в CSV для администраторов.
+
+``/export users`` и ``/export orders [с] [по]`` выполняются фоновой задачей.
+Курсор MongoDB с проекцией (только выгружаемые поля, без ключей API)
+читается пачками по ``EXPORT_BATCH_SIZE`` документов в пуле потоков, каждая
+строка сразу пишется ``csv.writer`` во временный файл
+(``SpooledTemporaryFile``): до ``EXPORT_SPOOL_SIZE`` байт он держится в
+памяти, дальше переносится на диск. Поэтому память не растёт с числом строк,
+сколько бы пользователей или заказов ни выгружалось; целиком в память
+читается только готовый файл при отправке, а он ограничен размером документа.
+
+CSV больше ``EXPORT_MAX_FILE_SIZE`` (ограничение Telegram на документы от
+бота) потоково сжимается в ZIP; если не помещается и он, администратор
+получает сообщение с просьбой сузить период.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import logging
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from config import EXPORT_BATCH_SIZE, EXPORT_MAX_FILE_SIZE, EXPORT_SPOOL_SIZE
+from constants import Messages
+from db_utils import USERS_WITH_SETTINGS_PIPELINE
+from metrics import Counter
+from money import stored_amount
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ROWS = Counter(
+    "export_rows_total",
+    "Строки, выгруженные администраторами в CSV, по типу выгрузки",
+    ("kind",),
+)
+
+USER_COLUMNS = (
+    "user_id", "username", "first_name", "last_name", "is_merchant", "shop_id", "order_id_tag", "created_at",
+)
+ORDER_COLUMNS = (
+    "created_at", "kind", "shop_id", "order_id", "user_id", "username", "amount", "status", "payment_status",
+    "duration_ms",
+)
+
+# Пользователи в порядке списка /users с полями настроек мерчанта;
+# shop_api_key в выгрузку не попадает
+_USERS_PIPELINE = [
+    *USERS_WITH_SETTINGS_PIPELINE,
+    {"$project": {
+        "_id": 0, "user_id": 1, "username": 1, "first_name": 1, "last_name": 1, "is_merchant": 1, "created_at": 1,
+        "settings.shop_id": 1, "settings.order_id_tag": 1,
+    }},
+]
+_ORDER_PROJECTION = {
+    "_id": 0, "created_at": 1, "kind": 1, "shop_id": 1, "order_id": 1, "user_id": 1, "username": 1,
+    "amount": 1, "amount_minor": 1, "status": 1, "payment_status": 1, "duration_ms": 1,
+}
+_DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+Rows = Iterable[Sequence[Any]]
+
+
+class ExportTooLarge(ValueError):
+    """Выгрузка не помещается в документ Telegram даже после сжатия."""
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    return value
+
+
+def user_rows(db_manager) -> Iterator[Tuple[Any, ...]]:
+    """Строки выгрузки пользователей в порядке ``USER_COLUMNS``."""
+
+    cursor = db_manager.get_collection("users").aggregate(_USERS_PIPELINE, batchSize=EXPORT_BATCH_SIZE)
+    for document in cursor:
+        settings = document.get("settings") or {}
+        yield (
+            document.get("user_id"), document.get("username"), document.get("first_name"),
+            document.get("last_name"), int(bool(document.get("is_merchant"))), settings.get("shop_id"),
+            settings.get("order_id_tag"), document.get("created_at"),
+        )
+
+
+def order_rows(db_manager, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> Iterator[Tuple[Any, ...]]:
+    """Строки выгрузки заказов за ``[since, until)`` по возрастанию времени создания."""
+
+    period: Dict[str, datetime] = {}
+    if since is not None:
+        period["$gte"] = since
+    if until is not None:
+        period["$lt"] = until
+    query = {"created_at": period} if period else {}
+    cursor = db_manager.get_collection("orders").find(
+        query, _ORDER_PROJECTION, sort=[("created_at", 1)], batch_size=EXPORT_BATCH_SIZE,
+    )
+    for document in cursor:
+        yield (
+            document.get("created_at"), document.get("kind"), document.get("shop_id"), document.get("order_id"),
+            document.get("user_id"), document.get("username"), stored_amount(document), document.get("status"),
+            document.get("payment_status"), document.get("duration_ms"),
+        )
+
+
+def parse_period(args: Sequence[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Период ``/export orders [с] [по]``: даты ``ГГГГ-ММ-ДД`` или ``ДД.ММ.ГГГГ``, «по» включительно."""
+
+    if len(args) > 2:
+        raise ValueError("слишком много аргументов")
+    days = [_parse_date(arg) for arg in args]
+    since = datetime.combine(days[0], datetime.min.time()) if days else None
+    until = datetime.combine(days[1] + timedelta(days=1), datetime.min.time()) if len(days) > 1 else None
+    if since and until and since >= until:
+        raise ValueError("начало периода позже конца")
+    return since, until
+
+
+def _parse_date(text: str) -> date:
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"неверная дата: {text}")
+
+
+def write_csv(rows: Rows, columns: Sequence[str], spool_size: int = EXPORT_SPOOL_SIZE):
+    """Записать строки в CSV (UTF-8 с BOM для Excel); возвращает файл в начале и число строк."""
+
+    output = tempfile.SpooledTemporaryFile(max_size=spool_size, mode="w+b")
+    text = io.TextIOWrapper(output, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_cell(value) for value in row])
+        count += 1
+    text.flush()
+    # Обёртка не должна закрыть файл вместе с собой
+    text.detach()
+    output.seek(0)
+    return output, count
+
+
+def file_size(output) -> int:
+    output.seek(0, io.SEEK_END)
+    size = output.tell()
+    output.seek(0)
+    return size
+
+
+def zip_csv(output, name: str, spool_size: int = EXPORT_SPOOL_SIZE):
+    """Сжать CSV в ZIP с одним файлом ``name``, копируя поблочно."""
+
+    archive = tempfile.SpooledTemporaryFile(max_size=spool_size, mode="w+b")
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        with bundle.open(name, "w", force_zip64=True) as target:
+            shutil.copyfileobj(output, target)
+    output.close()
+    archive.seek(0)
+    return archive
+
+
+def build_export(rows: Rows, columns: Sequence[str], filename: str,
+                 max_size: int = EXPORT_MAX_FILE_SIZE) -> Tuple[Any, str, int]:
+    """Файл выгрузки, его имя и число строк; CSV сверх ``max_size`` сжимается в ZIP."""
+
+    output, count = write_csv(rows, columns)
+    if file_size(output) <= max_size:
+        return output, filename, count
+    archive = zip_csv(output, filename)
+    if file_size(archive) > max_size:
+        archive.close()
+        raise ExportTooLarge(count)
+    return archive, f"{filename.rsplit('.', 1)[0]}.zip", count
+
+
+async def run_export(bot, chat_id: int, kind: str, rows_factory: Callable[[], Rows],
+                     columns: Sequence[str], filename: str) -> None:
+    """Собрать выгрузку в пуле потоков и отправить её администратору документом."""
+
+    loop = asyncio.get_running_loop()
+    try:
+        output, name, count = await loop.run_in_executor(None, build_export, rows_factory(), columns, filename)
+    except ExportTooLarge as exc:
+        await bot.send_message(chat_id=chat_id, text=Messages.EXPORT_TOO_LARGE.format(rows=exc.args[0]))
+        return
+    except Exception:
+        logger.exception("Не удалось подготовить выгрузку %s", kind)
+        await bot.send_message(chat_id=chat_id, text=Messages.EXPORT_FAILED)
+        return
+
+    EXPORT_ROWS.inc(kind, amount=count)
+    with output:
+        await bot.send_document(
+            chat_id=chat_id, document=output, filename=name, caption=Messages.EXPORT_DONE.format(rows=count),
+        )
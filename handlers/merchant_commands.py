@@ -29,7 +29,9 @@ class ProfileCommand(BaseCommand):
         merchant_data = self.bot_instance.get_merchant_settings(user_id)
         
         if merchant_data:
-            shop_id, shop_api_key, order_id_tag = merchant_data[1], merchant_data[2], merchant_data[3]
+            shop_id, shop_api_key, order_id_tag = (
+                merchant_data.get("shop_id"), merchant_data.get("shop_api_key"), merchant_data.get("order_id_tag")
+            )
             message = f"👤 Профиль\n\n• Username: @{username}\n• Shop ID: {shop_id or 'Не указан'}\n• Shop API Key: {shop_api_key or 'Не указан'}\n• Order ID Tag: {order_id_tag or 'Не указан'}"
         else:
             message = f"👤 Профиль\n\n• Username: @{username}\n\nДанные мерчанта не найдены."
@@ -59,9 +61,8 @@ class InfoCommand(BaseCommand):
         if not self.bot_instance.is_merchant(user_id):
             return False
         
-        info_content = self.bot_instance.get_info_content()
-        message = f"📄 Информация\n\n{info_content}"
-        await update.message.reply_text(message)
+        _, content = self.bot_instance.get_info()
+        await update.message.reply_text(f"📄 Информация\n\n{content}")
         return True
 
 
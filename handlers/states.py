@@ -4,6 +4,9 @@
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from handlers.base import BaseState
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class WaitingForBroadcastTextState(BaseState):
@@ -34,7 +37,7 @@ class WaitingForBroadcastTextState(BaseState):
                 await context.bot.send_message(chat_id=user_id, text=broadcast_text)
                 success_count += 1
             except Exception as e:
-                print(f"Failed to send message to {user_id}: {e}")
+                logger.error("Ошибка отправки сообщения пользователю %s: %s", user_id, e)
         
         # Возвращаем в главное меню
         keyboard = [
@@ -0,0 +1,158 @@
+"""Контроль лага цикла событий и поиск блокирующих вызовов.
+
+Корутина-пульс раз в ``interval`` секунд отмечается в мониторе и измеряет,
+насколько позже запланированного она проснулась. Сторожевой поток следит за
+последней отметкой: если цикл не отвечает дольше ``threshold``, он снимает
+стек потока цикла через ``sys._current_frames()`` и определяет обработчик —
+ближайшую к месту блокировки корутину из кода бота (например,
+``MessageHandlers._handle_admin_delete_shop_id_input``), внутри которой
+выполняется синхронный вызов. Результат пишется в лог и в метрики.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from config import LOOP_BLOCK_THRESHOLD, LOOP_MONITOR_INTERVAL
+from metrics import Counter as MetricCounter
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Запаздывание пробуждения корутины-пульса относительно расписания",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = MetricCounter(
+    "event_loop_blocked_total",
+    "Блокировки цикла событий дольше порога по обработчикам",
+    ("handler",),
+)
+LOOP_BLOCK_DURATION = Histogram(
+    "event_loop_block_duration_seconds",
+    "Длительность блокировок цикла событий по обработчикам",
+    ("handler",),
+)
+
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+_EXTERNAL_DIRS = ("site-packages", "dist-packages")
+
+
+def _is_project_file(filename: str) -> bool:
+    path = os.path.abspath(filename)
+    return path.startswith(_PROJECT_ROOT + os.sep) and not any(part in path for part in _EXTERNAL_DIRS)
+
+
+def locate_blocking_handler(frame) -> Tuple[str, str]:
+    """Определить обработчик и место блокировки по стеку потока цикла.
+
+    Возвращает ``(handler, site)``: ``handler`` — самая вложенная корутина из
+    кода бота, ``site`` — самый вложенный кадр кода бота (обычно синхронный
+    вызов базы данных внутри этой корутины).
+    """
+
+    handler = site = "unknown"
+    while frame is not None:
+        code = frame.f_code
+        if _is_project_file(code.co_filename) and code.co_filename != __file__:
+            name = getattr(code, "co_qualname", code.co_name)
+            if site == "unknown":
+                site = f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+            if code.co_flags & inspect.CO_COROUTINE:
+                handler = name
+                break
+        frame = frame.f_back
+    return handler, site
+
+
+class LoopMonitor:
+    """Пульс цикла событий и сторожевой поток для обнаружения блокировок."""
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL,
+        threshold: float = LOOP_BLOCK_THRESHOLD,
+        keep_samples: bool = False,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples: Optional[List[float]] = [] if keep_samples else None
+        self.blocked: Counter = Counter()
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._stalled_handler: Optional[str] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Запустить мониторинг; вызывается из работающего цикла событий."""
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Остановить пульс и сторожевой поток."""
+
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._heartbeat
+            self._heartbeat = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.interval * 2)
+            self._watchdog = None
+
+    async def _beat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled)
+            self._last_beat = time.monotonic()
+            LOOP_LAG.observe(lag)
+            if self.samples is not None:
+                self.samples.append(lag)
+
+            handler, self._stalled_handler = self._stalled_handler, None
+            if handler is not None:
+                LOOP_BLOCK_DURATION.observe(lag, handler)
+                logger.warning("Цикл событий был заблокирован на %.3f с обработчиком %s", lag, handler)
+
+    def _watch(self) -> None:
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._stalled_handler is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            handler, site = locate_blocking_handler(frame)
+            stack = "".join(traceback.format_stack(frame))
+            del frame
+
+            self._stalled_handler = handler
+            self.blocked[handler] += 1
+            LOOP_BLOCKED.inc(handler)
+            logger.warning(
+                "Цикл событий не отвечает %.3f с: обработчик %s, блокирующий вызов в %s\n%s",
+                stalled_for, handler, site, stack,
+            )
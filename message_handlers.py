@@ -5,7 +5,12 @@ from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboard
 from telegram.ext import ContextTypes
 from states import UserState, StateManager
 from api_client import Konvert2payAPI
+from config import BULK_MAX_FILE_SIZE
+from constants import Messages
 from webhook_sender import WebhookSender
+from shutdown import coordinator
+from validators import ValidationError, validate_amount, validate_iban, validate_inn
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,28 +20,36 @@ class MessageHandlers:
     
     def __init__(self, bot_instance):
         self.bot = bot_instance
+
+    async def _validated(self, update: Update, rule, message_text: str):
+        """Значение поля после проверки правилом или None, если мерчанту нужно ввести его заново"""
+        try:
+            return rule(message_text)
+        except ValidationError as exc:
+            error = str(exc)
+            await update.message.reply_text(Messages.FIELD_INVALID.format(error=error[:1].upper() + error[1:]))
+            return None
     
     async def handle_invoice_states(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка состояний создания инвойса"""
         user = update.effective_user
         message_text = update.message.text.strip()
         
-        # Отладочная информация
-        print(f"DEBUG: handle_invoice_states called with message: '{message_text}'")
-        print(f"DEBUG: Current states: {context.user_data}")
-        
         if context.user_data.get(UserState.WAITING_FOR_INVOICE_ID.value):
-            print("DEBUG: Processing WAITING_FOR_INVOICE_ID")
-            return await self._handle_invoice_id_input(update, context, message_text)
+            state = UserState.WAITING_FOR_INVOICE_ID
+            handler = self._handle_invoice_id_input
         elif context.user_data.get(UserState.WAITING_FOR_CLIENT_ID.value):
-            print("DEBUG: Processing WAITING_FOR_CLIENT_ID")
-            return await self._handle_client_id_input(update, context, message_text)
+            state = UserState.WAITING_FOR_CLIENT_ID
+            handler = self._handle_client_id_input
         elif context.user_data.get(UserState.WAITING_FOR_AMOUNT.value):
-            print("DEBUG: Processing WAITING_FOR_AMOUNT")
-            return await self._handle_amount_input(update, context, message_text)
+            state = UserState.WAITING_FOR_AMOUNT
+            handler = self._handle_amount_input
+        else:
+            return False
         
-        print("DEBUG: No invoice state matched")
-        return False
+        logger.debug("Шаг создания инвойса: %s", state.value,
+                     extra={"event": "invoice.state", "user_id": user.id, "state": state.value})
+        return await handler(update, context, message_text)
     
     async def handle_payout_states(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка состояний создания выплаты"""
@@ -162,32 +175,30 @@ class MessageHandlers:
     
     async def _handle_amount_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Обработка ввода суммы"""
-        try:
-            amount = float(message_text)
-            context.user_data['invoice_amount'] = amount
-            context.user_data['current_state'] = None  # Завершаем флоу
-            context.user_data[UserState.WAITING_FOR_AMOUNT.value] = False
-            
-            invoice_order_id = context.user_data.get('invoice_order_id', 'Не указан')
-            client_id = context.user_data.get('invoice_client_id', 'Не указан')
-            
-            message = f"🎰 Заявка на инвойс\n\n• ID инвойса: {invoice_order_id}\n• ID Клиента: {client_id}\n• Сумма: {amount} UAH"
-            
-            inline_keyboard = [
-                [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_invoice"),
-                 InlineKeyboardButton("❌ Отмена", callback_data="cancel_invoice")]
-            ]
-            inline_markup = InlineKeyboardMarkup(inline_keyboard)
-            
-            keyboard = [[KeyboardButton("◀️ Главное меню")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            await update.message.reply_text(message, reply_markup=inline_markup)
-            await update.message.reply_text("◀️ Главное меню", reply_markup=reply_markup)
-            return True
-        except ValueError:
-            await update.message.reply_text("❌ Ошибка: Введите корректную сумму (например: 500.75)")
+        amount = await self._validated(update, validate_amount, message_text)
+        if amount is None:
             return True
+        context.user_data['invoice_amount'] = amount
+        context.user_data['current_state'] = None  # Завершаем флоу
+        context.user_data[UserState.WAITING_FOR_AMOUNT.value] = False
+        
+        invoice_order_id = context.user_data.get('invoice_order_id', 'Не указан')
+        client_id = context.user_data.get('invoice_client_id', 'Не указан')
+        
+        message = f"🎰 Заявка на инвойс\n\n• ID инвойса: {invoice_order_id}\n• ID Клиента: {client_id}\n• Сумма: {amount} UAH"
+        
+        inline_keyboard = [
+            [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_invoice"),
+             InlineKeyboardButton("❌ Отмена", callback_data="cancel_invoice")]
+        ]
+        inline_markup = InlineKeyboardMarkup(inline_keyboard)
+        
+        keyboard = [[KeyboardButton("◀️ Главное меню")]]
+        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        
+        await update.message.reply_text(message, reply_markup=inline_markup)
+        await update.message.reply_text("◀️ Главное меню", reply_markup=reply_markup)
+        return True
     
     # Приватные методы для обработки состояний выплаты
     async def _handle_payout_order_id_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
@@ -216,7 +227,10 @@ class MessageHandlers:
     
     async def _handle_iban_account_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Обработка ввода IBAN-счета"""
-        context.user_data['payout_iban_account'] = message_text
+        iban = await self._validated(update, validate_iban, message_text)
+        if iban is None:
+            return True
+        context.user_data['payout_iban_account'] = iban
         context.user_data[UserState.WAITING_FOR_IBAN_ACCOUNT.value] = False
         context.user_data[UserState.WAITING_FOR_IBAN_INN.value] = True
         
@@ -228,7 +242,10 @@ class MessageHandlers:
     
     async def _handle_iban_inn_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Обработка ввода ИНН"""
-        context.user_data['payout_iban_inn'] = message_text
+        inn = await self._validated(update, validate_inn, message_text)
+        if inn is None:
+            return True
+        context.user_data['payout_iban_inn'] = inn
         context.user_data[UserState.WAITING_FOR_IBAN_INN.value] = False
         context.user_data[UserState.WAITING_FOR_SURNAME.value] = True
         
@@ -298,37 +315,35 @@ class MessageHandlers:
     
     async def _handle_payout_amount_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Обработка ввода суммы для выплаты"""
-        try:
-            amount = float(message_text)
-            context.user_data['payout_amount'] = amount
-            context.user_data[UserState.WAITING_FOR_PAYOUT_AMOUNT.value] = False
-            
-            payout_order_id = context.user_data.get('payout_order_id', 'Не указан')
-            client_id = context.user_data.get('payout_client_id', 'Не указан')
-            iban_account = context.user_data.get('payout_iban_account', 'Не указан')
-            iban_inn = context.user_data.get('payout_iban_inn', 'Не указан')
-            surname = context.user_data.get('payout_surname', 'Не указан')
-            name = context.user_data.get('payout_name', 'Не указан')
-            middlename = context.user_data.get('payout_middlename', 'Не указан')
-            purpose = context.user_data.get('payout_purpose', 'Не указан')
-            
-            message = f"💎 Заявка на выплату\n\n• ID заявки: {payout_order_id}\n• ID Клиента: {client_id}\n• Номер iBAN-счета: {iban_account}\n• ИНН: {iban_inn}\n• ФИО: {surname} {name} {middlename}\n• Назначение платежа: {purpose}\n• Сумма: {amount} UAH"
-            
-            inline_keyboard = [
-                [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_payout"),
-                 InlineKeyboardButton("❌ Отмена", callback_data="cancel_payout")]
-            ]
-            inline_markup = InlineKeyboardMarkup(inline_keyboard)
-            
-            keyboard = [[KeyboardButton("◀️ Главное меню")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            await update.message.reply_text(message, reply_markup=inline_markup)
-            await update.message.reply_text("◀️ Главное меню", reply_markup=reply_markup)
-            return True
-        except ValueError:
-            await update.message.reply_text("❌ Ошибка: Введите корректную сумму (например: 1000.35)")
+        amount = await self._validated(update, validate_amount, message_text)
+        if amount is None:
             return True
+        context.user_data['payout_amount'] = amount
+        context.user_data[UserState.WAITING_FOR_PAYOUT_AMOUNT.value] = False
+        
+        payout_order_id = context.user_data.get('payout_order_id', 'Не указан')
+        client_id = context.user_data.get('payout_client_id', 'Не указан')
+        iban_account = context.user_data.get('payout_iban_account', 'Не указан')
+        iban_inn = context.user_data.get('payout_iban_inn', 'Не указан')
+        surname = context.user_data.get('payout_surname', 'Не указан')
+        name = context.user_data.get('payout_name', 'Не указан')
+        middlename = context.user_data.get('payout_middlename', 'Не указан')
+        purpose = context.user_data.get('payout_purpose', 'Не указан')
+        
+        message = f"💎 Заявка на выплату\n\n• ID заявки: {payout_order_id}\n• ID Клиента: {client_id}\n• Номер iBAN-счета: {iban_account}\n• ИНН: {iban_inn}\n• ФИО: {surname} {name} {middlename}\n• Назначение платежа: {purpose}\n• Сумма: {amount} UAH"
+        
+        inline_keyboard = [
+            [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_payout"),
+             InlineKeyboardButton("❌ Отмена", callback_data="cancel_payout")]
+        ]
+        inline_markup = InlineKeyboardMarkup(inline_keyboard)
+        
+        keyboard = [[KeyboardButton("◀️ Главное меню")]]
+        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        
+        await update.message.reply_text(message, reply_markup=inline_markup)
+        await update.message.reply_text("◀️ Главное меню", reply_markup=reply_markup)
+        return True
     
     # Приватные методы для обработки состояний админа
     async def _handle_admin_username_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
@@ -418,96 +433,6 @@ class MessageHandlers:
         StateManager.clear_admin_states(context)
         return True
     
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Основной обработчик сообщений"""
-        user = update.effective_user
-        message_text = update.message.text
-        current_state = context.user_data.get('current_state')
-        
-        # Обработка состояний создания инвойса
-        if current_state in [UserState.WAITING_FOR_INVOICE_ID.value, 
-                           UserState.WAITING_FOR_CLIENT_ID.value,
-                           UserState.WAITING_FOR_AMOUNT.value]:
-            return await self.handle_invoice_states(update, context)
-        
-        # Обработка состояний создания выплаты
-        elif current_state in [UserState.WAITING_FOR_PAYOUT_ORDER_ID.value,
-                             UserState.WAITING_FOR_PAYOUT_CLIENT_ID.value,
-                             UserState.WAITING_FOR_IBAN_ACCOUNT.value,
-                             UserState.WAITING_FOR_IBAN_INN.value,
-                             UserState.WAITING_FOR_SURNAME.value,
-                             UserState.WAITING_FOR_NAME.value,
-                             UserState.WAITING_FOR_MIDDLENAME.value,
-                             UserState.WAITING_FOR_PURPOSE.value,
-                             UserState.WAITING_FOR_PAYOUT_AMOUNT.value]:
-            return await self.handle_payout_states(update, context)
-        
-        # Обработка состояний админа
-        elif current_state in [UserState.WAITING_FOR_ADMIN_USERNAME.value,
-                             UserState.WAITING_FOR_ADMIN_SHOP_ID.value,
-                             UserState.WAITING_FOR_ADMIN_API_KEY.value,
-                             UserState.WAITING_FOR_ADMIN_ORDER_TAG.value,
-                             UserState.WAITING_FOR_ADMIN_DELETE_USERNAME.value,
-                             UserState.WAITING_FOR_ADMIN_DELETE_SHOP_ID.value,
-                             UserState.WAITING_FOR_ADMIN_BROADCAST.value,
-                             UserState.WAITING_FOR_INFO_EDIT.value]:
-            return await self.handle_admin_states(update, context)
-        
-        # Обработка состояния выхода из аккаунта
-        elif current_state == UserState.WAITING_FOR_LOGOUT_CONFIRMATION.value:
-            return await self.handle_logout_state(update, context)
-        
-        # Обработка команд мерчанта
-        elif message_text in ["👤 Профиль", "📄 Информация", "🎰 Создать инвойс", "💎 Создать выплату", "❌ Выйти из аккаунта"]:
-            return await self.handle_merchant_commands(update, context)
-        
-        # Обработка команд админа
-        elif message_text in ["👤 Пользователи", "✉️ Создать рассылку", "👤 Добавить пользователя", "❌ Удалить пользователя"]:
-            return await self.handle_admin_commands(update, context)
-        
-        return False
-    
-    async def handle_merchant_commands(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Обработка команд мерчанта"""
-        from handlers.merchant_commands import ProfileCommand, InfoCommand, CreateInvoiceCommand, CreatePayoutCommand, LogoutCommand
-        
-        if update.message.text == "👤 Профиль":
-            command = ProfileCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "📄 Информация":
-            command = InfoCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "🎰 Создать инвойс":
-            command = CreateInvoiceCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "💎 Создать выплату":
-            command = CreatePayoutCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "❌ Выйти из аккаунта":
-            command = LogoutCommand(self.bot)
-            return await command.handle(update, context)
-        
-        return False
-    
-    async def handle_admin_commands(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Обработка команд админа"""
-        from handlers.admin_commands import ShowUsersCommand, CreateBroadcastCommand, AddUserCommand, DeleteUserCommand
-        
-        if update.message.text == "👤 Пользователи":
-            command = ShowUsersCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "✉️ Создать рассылку":
-            command = CreateBroadcastCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "👤 Добавить пользователя":
-            command = AddUserCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "❌ Удалить пользователя":
-            command = DeleteUserCommand(self.bot)
-            return await command.handle(update, context)
-        
-        return False
-    
     async def _handle_admin_delete_username_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Обработка ввода username для удаления"""
         context.user_data['delete_username'] = message_text
@@ -582,96 +507,6 @@ class MessageHandlers:
         StateManager.clear_admin_states(context)
         return True
     
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Основной обработчик сообщений"""
-        user = update.effective_user
-        message_text = update.message.text
-        current_state = context.user_data.get('current_state')
-        
-        # Обработка состояний создания инвойса
-        if current_state in [UserState.WAITING_FOR_INVOICE_ID.value, 
-                           UserState.WAITING_FOR_CLIENT_ID.value,
-                           UserState.WAITING_FOR_AMOUNT.value]:
-            return await self.handle_invoice_states(update, context)
-        
-        # Обработка состояний создания выплаты
-        elif current_state in [UserState.WAITING_FOR_PAYOUT_ORDER_ID.value,
-                             UserState.WAITING_FOR_PAYOUT_CLIENT_ID.value,
-                             UserState.WAITING_FOR_IBAN_ACCOUNT.value,
-                             UserState.WAITING_FOR_IBAN_INN.value,
-                             UserState.WAITING_FOR_SURNAME.value,
-                             UserState.WAITING_FOR_NAME.value,
-                             UserState.WAITING_FOR_MIDDLENAME.value,
-                             UserState.WAITING_FOR_PURPOSE.value,
-                             UserState.WAITING_FOR_PAYOUT_AMOUNT.value]:
-            return await self.handle_payout_states(update, context)
-        
-        # Обработка состояний админа
-        elif current_state in [UserState.WAITING_FOR_ADMIN_USERNAME.value,
-                             UserState.WAITING_FOR_ADMIN_SHOP_ID.value,
-                             UserState.WAITING_FOR_ADMIN_API_KEY.value,
-                             UserState.WAITING_FOR_ADMIN_ORDER_TAG.value,
-                             UserState.WAITING_FOR_ADMIN_DELETE_USERNAME.value,
-                             UserState.WAITING_FOR_ADMIN_DELETE_SHOP_ID.value,
-                             UserState.WAITING_FOR_ADMIN_BROADCAST.value,
-                             UserState.WAITING_FOR_INFO_EDIT.value]:
-            return await self.handle_admin_states(update, context)
-        
-        # Обработка состояния выхода из аккаунта
-        elif current_state == UserState.WAITING_FOR_LOGOUT_CONFIRMATION.value:
-            return await self.handle_logout_state(update, context)
-        
-        # Обработка команд мерчанта
-        elif message_text in ["👤 Профиль", "📄 Информация", "🎰 Создать инвойс", "💎 Создать выплату", "❌ Выйти из аккаунта"]:
-            return await self.handle_merchant_commands(update, context)
-        
-        # Обработка команд админа
-        elif message_text in ["👤 Пользователи", "✉️ Создать рассылку", "👤 Добавить пользователя", "❌ Удалить пользователя"]:
-            return await self.handle_admin_commands(update, context)
-        
-        return False
-    
-    async def handle_merchant_commands(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Обработка команд мерчанта"""
-        from handlers.merchant_commands import ProfileCommand, InfoCommand, CreateInvoiceCommand, CreatePayoutCommand, LogoutCommand
-        
-        if update.message.text == "👤 Профиль":
-            command = ProfileCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "📄 Информация":
-            command = InfoCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "🎰 Создать инвойс":
-            command = CreateInvoiceCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "💎 Создать выплату":
-            command = CreatePayoutCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "❌ Выйти из аккаунта":
-            command = LogoutCommand(self.bot)
-            return await command.handle(update, context)
-        
-        return False
-    
-    async def handle_admin_commands(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Обработка команд админа"""
-        from handlers.admin_commands import ShowUsersCommand, CreateBroadcastCommand, AddUserCommand, DeleteUserCommand
-        
-        if update.message.text == "👤 Пользователи":
-            command = ShowUsersCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "✉️ Создать рассылку":
-            command = CreateBroadcastCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "👤 Добавить пользователя":
-            command = AddUserCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "❌ Удалить пользователя":
-            command = DeleteUserCommand(self.bot)
-            return await command.handle(update, context)
-        
-        return False
-    
     async def _handle_admin_info_edit_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Обработка редактирования информационного блока"""
         self.bot.update_info_content(message_text)
@@ -689,116 +524,21 @@ class MessageHandlers:
         StateManager.clear_admin_states(context)
         return True
     
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Основной обработчик сообщений"""
-        user = update.effective_user
-        message_text = update.message.text
-        current_state = context.user_data.get('current_state')
-        
-        # Обработка состояний создания инвойса
-        if current_state in [UserState.WAITING_FOR_INVOICE_ID.value, 
-                           UserState.WAITING_FOR_CLIENT_ID.value,
-                           UserState.WAITING_FOR_AMOUNT.value]:
-            return await self.handle_invoice_states(update, context)
-        
-        # Обработка состояний создания выплаты
-        elif current_state in [UserState.WAITING_FOR_PAYOUT_ORDER_ID.value,
-                             UserState.WAITING_FOR_PAYOUT_CLIENT_ID.value,
-                             UserState.WAITING_FOR_IBAN_ACCOUNT.value,
-                             UserState.WAITING_FOR_IBAN_INN.value,
-                             UserState.WAITING_FOR_SURNAME.value,
-                             UserState.WAITING_FOR_NAME.value,
-                             UserState.WAITING_FOR_MIDDLENAME.value,
-                             UserState.WAITING_FOR_PURPOSE.value,
-                             UserState.WAITING_FOR_PAYOUT_AMOUNT.value]:
-            return await self.handle_payout_states(update, context)
-        
-        # Обработка состояний админа
-        elif current_state in [UserState.WAITING_FOR_ADMIN_USERNAME.value,
-                             UserState.WAITING_FOR_ADMIN_SHOP_ID.value,
-                             UserState.WAITING_FOR_ADMIN_API_KEY.value,
-                             UserState.WAITING_FOR_ADMIN_ORDER_TAG.value,
-                             UserState.WAITING_FOR_ADMIN_DELETE_USERNAME.value,
-                             UserState.WAITING_FOR_ADMIN_DELETE_SHOP_ID.value,
-                             UserState.WAITING_FOR_ADMIN_BROADCAST.value,
-                             UserState.WAITING_FOR_INFO_EDIT.value]:
-            return await self.handle_admin_states(update, context)
-        
-        # Обработка состояния выхода из аккаунта
-        elif current_state == UserState.WAITING_FOR_LOGOUT_CONFIRMATION.value:
-            return await self.handle_logout_state(update, context)
-        
-        # Обработка команд мерчанта
-        elif message_text in ["👤 Профиль", "📄 Информация", "🎰 Создать инвойс", "💎 Создать выплату", "❌ Выйти из аккаунта"]:
-            return await self.handle_merchant_commands(update, context)
-        
-        # Обработка команд админа
-        elif message_text in ["👤 Пользователи", "✉️ Создать рассылку", "👤 Добавить пользователя", "❌ Удалить пользователя"]:
-            return await self.handle_admin_commands(update, context)
-        
-        return False
-    
-    async def handle_merchant_commands(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Обработка команд мерчанта"""
-        from handlers.merchant_commands import ProfileCommand, InfoCommand, CreateInvoiceCommand, CreatePayoutCommand, LogoutCommand
-        
-        if update.message.text == "👤 Профиль":
-            command = ProfileCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "📄 Информация":
-            command = InfoCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "🎰 Создать инвойс":
-            command = CreateInvoiceCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "💎 Создать выплату":
-            command = CreatePayoutCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "❌ Выйти из аккаунта":
-            command = LogoutCommand(self.bot)
-            return await command.handle(update, context)
-        
-        return False
-    
-    async def handle_admin_commands(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Обработка команд админа"""
-        from handlers.admin_commands import ShowUsersCommand, CreateBroadcastCommand, AddUserCommand, DeleteUserCommand
-        
-        if update.message.text == "👤 Пользователи":
-            command = ShowUsersCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "✉️ Создать рассылку":
-            command = CreateBroadcastCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "👤 Добавить пользователя":
-            command = AddUserCommand(self.bot)
-            return await command.handle(update, context)
-        elif update.message.text == "❌ Удалить пользователя":
-            command = DeleteUserCommand(self.bot)
-            return await command.handle(update, context)
-        
-        return False
-    
     async def _handle_admin_broadcast_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Обработка создания рассылки"""
         users = self.bot.get_all_users()
-        if users:
-            sent_count = 0
-            for user in users:
-                chat_id = user.get("user_id")
-                if not chat_id:
-                    continue
-                try:
-                    # Отправляем сообщение каждому пользователю
-                    await context.bot.send_message(chat_id=chat_id, text=message_text)
-                    sent_count += 1
-                except Exception as e:
-                    logger.error(f"Ошибка отправки сообщения пользователю {user.get('username')}: {e}")
-
-            if sent_count:
-                message = f"✅ Рассылка отправлена {sent_count} пользователям."
-            else:
-                message = "⚠️ Не удалось отправить сообщение: нет пользователей с доступным chat_id."
+        recipients = [(user.get("user_id"), user.get("username")) for user in users if user.get("user_id")]
+        if recipients:
+            # Рассылка идёт фоновой задачей: она не ограничена бюджетом времени
+            # обновления, а остановка бота дождётся её или прервёт с записью в лог
+            progress = {"sent": 0, "failed": 0, "total": len(recipients)}
+            coordinator.spawn(
+                self._run_broadcast(context.bot, update.effective_chat.id, recipients, message_text, progress),
+                "broadcast", admin_chat_id=update.effective_chat.id, progress=progress,
+            )
+            message = f"📤 Рассылка запущена для {len(recipients)} пользователей. По завершении придёт отчёт."
+        elif users:
+            message = "⚠️ Не удалось отправить сообщение: нет пользователей с доступным chat_id."
         else:
             message = "❌ Нет пользователей для рассылки."
         
@@ -813,6 +553,118 @@ class MessageHandlers:
         StateManager.clear_admin_states(context)
         return True
     
+    @staticmethod
+    async def _run_broadcast(bot, admin_chat_id, recipients, message_text, progress):
+        """Отправить рассылку и сообщить администратору итог"""
+        try:
+            for chat_id, username in recipients:
+                try:
+                    await bot.send_message(chat_id=chat_id, text=message_text)
+                    progress["sent"] += 1
+                except Exception as e:
+                    progress["failed"] += 1
+                    logger.error("Ошибка отправки сообщения пользователю %s: %s", username, e)
+        except asyncio.CancelledError:
+            try:
+                await bot.send_message(
+                    chat_id=admin_chat_id,
+                    text=f"⚠️ Рассылка прервана перезапуском бота: отправлено {progress['sent']} из {progress['total']}.",
+                )
+            except Exception as e:
+                logger.error("Не удалось сообщить о прерванной рассылке: %s", e)
+            raise
+
+        if progress["sent"]:
+            message = f"✅ Рассылка отправлена {progress['sent']} пользователям."
+        else:
+            message = "⚠️ Не удалось отправить сообщение ни одному пользователю."
+        await bot.send_message(chat_id=admin_chat_id, text=message)
+
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Обработка CSV-файла для массового создания инвойсов или выплат"""
+        from bulk_orders import InvoiceBatch, OrderIdAllocator, run_batch
+
+        user = update.effective_user
+        if not self.bot.is_merchant(user.id):
+            return False
+        state = context.user_data.get('current_state')
+        if state not in (UserState.WAITING_FOR_BULK_INVOICE_FILE.value, UserState.WAITING_FOR_BULK_PAYOUT_FILE.value):
+            await update.message.reply_text(Messages.BULK_USAGE)
+            return True
+
+        document = update.message.document
+        if not (document.file_name or "").lower().endswith(".csv"):
+            await update.message.reply_text(Messages.BULK_NOT_CSV)
+            return True
+        if document.file_size and document.file_size > BULK_MAX_FILE_SIZE:
+            await update.message.reply_text(Messages.BULK_FILE_TOO_LARGE.format(limit=BULK_MAX_FILE_SIZE // 1024))
+            return True
+        job = context.user_data.get('bulk_job')
+        if job is not None and not job.done():
+            await update.message.reply_text(Messages.BULK_ALREADY_RUNNING)
+            return True
+        settings = self.bot.get_merchant_settings(user.id)
+        if not settings:
+            await update.message.reply_text(Messages.ERROR_MERCHANT_NOT_FOUND)
+            return True
+
+        if state == UserState.WAITING_FOR_BULK_PAYOUT_FILE.value:
+            return await self._check_bulk_payouts(update, context, document)
+
+        context.user_data.pop('current_state', None)
+        user_info = {
+            "user_id": user.id,
+            "username": user.username,
+            "shop_id": settings.get("shop_id")
+        }
+        batch = InvoiceBatch(settings, user_info, OrderIdAllocator(self.bot.order_manager, user.id))
+        # Файл обрабатывается фоновой задачей вне бюджета времени обновления;
+        # остановка бота дождётся её или прервёт, отправив обработанные строки
+        context.user_data['bulk_job'] = coordinator.spawn(
+            run_batch(context.bot, update.effective_chat.id, document.file_id, batch),
+            "bulk_invoices", user_id=user.id, file_name=document.file_name,
+        )
+        return True
+
+    async def _check_bulk_payouts(self, update: Update, context: ContextTypes.DEFAULT_TYPE, document) -> bool:
+        """Проверить все строки файла выплат и показать сводку для подтверждения"""
+        from bulk_orders import BulkFileError, check_payout_rows, download_document, payout_errors_csv
+
+        buffer = await download_document(context.bot, document.file_id)
+        try:
+            checked = check_payout_rows(buffer)
+        except BulkFileError as exc:
+            await update.message.reply_text(Messages.BULK_FILE_ERROR.format(error=exc))
+            return True
+
+        context.user_data.pop('current_state', None)
+        valid = [values for _, _, values, errors in checked if not errors]
+        invalid = len(checked) - len(valid)
+        if invalid:
+            await update.message.reply_document(
+                document=payout_errors_csv(checked), filename="payouts_errors.csv",
+                caption=Messages.BULK_PAYOUT_INVALID_ROWS if valid else Messages.BULK_PAYOUT_NOTHING,
+            )
+        if not valid:
+            return True
+
+        total = sum(values["amount"] for values in valid)
+        # План хранится до нажатия кнопки; подтверждение забирает его из user_data,
+        # поэтому повторное нажатие не отправит выплаты второй раз
+        context.user_data['bulk_payout'] = {
+            "checked": checked, "file_key": document.file_unique_id, "file_name": document.file_name,
+            "valid": len(valid), "total": total,
+        }
+        keyboard = [[
+            InlineKeyboardButton("✅ Подтвердить", callback_data="bulk_payout_confirm"),
+            InlineKeyboardButton("❌ Отмена", callback_data="bulk_payout_cancel"),
+        ]]
+        await update.message.reply_text(
+            Messages.BULK_PAYOUT_CONFIRMATION.format(rows=len(checked), valid=len(valid), total=total, invalid=invalid),
+            reply_markup=InlineKeyboardMarkup(keyboard),
+        )
+        return True
+
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Основной обработчик сообщений"""
         user = update.effective_user
@@ -0,0 +1,291 @@
+"""Метрики времени выполнения бота в формате Prometheus.
+
+Метрики объявляются на уровне модуля там, где они используются, и
+регистрируются в общем реестре. ``start_metrics_server`` поднимает локальный
+HTTP-эндпоинт ``/metrics`` с текстовым форматом экспозиции Prometheus.
+Запись значения — это поиск серии по кортежу меток и пара сложений, без
+блокировок на горячем пути.
+"""
+
+from __future__ import annotations
+
+import abc
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин (в секундах), подходящие для сетевых запросов и обработчиков
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_REGISTRY: List["_Metric"] = []
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(abc.ABC):
+    """Общая часть метрик: имя, описание, метки и регистрация."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _REGISTRY_LOCK:
+            _REGISTRY.append(self)
+
+    def _check_labels(self, labelvalues: Tuple[str, ...]) -> None:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидается {len(self.labelnames)} меток, получено {len(labelvalues)}")
+
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """Строки серий метрики в текстовом формате экспозиции."""
+
+
+class Counter(_Metric):
+    """Монотонно возрастающий счётчик."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        """Увеличить счётчик для указанных значений меток."""
+
+        try:
+            self._values[labelvalues] += amount
+        except KeyError:
+            self._check_labels(labelvalues)
+            with self._lock:
+                self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент сбора."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        if labelvalues not in self._values:
+            self._check_labels(labelvalues)
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self.set(self._values.get(labelvalues, 0) + amount, *labelvalues)
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.set(self._values.get(labelvalues, 0) - amount, *labelvalues)
+
+    def value(self, *labelvalues: str) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class _HistogramSeries:
+    """Значения гистограммы для одного набора меток."""
+
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self, size: int):
+        self.buckets: List[int] = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class _Timer:
+    """Контекстный менеджер и декоратор для замера длительности."""
+
+    __slots__ = ("_histogram", "_labelvalues", "_started")
+
+    def __init__(self, histogram: "Histogram", labelvalues: Tuple[str, ...]):
+        self._histogram = histogram
+        self._labelvalues = labelvalues
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._started, *self._labelvalues)
+
+    def __call__(self, func: Callable) -> Callable:
+        histogram, labelvalues = self._histogram, self._labelvalues
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labelvalues)
+
+        return wrapper
+
+
+class Histogram(_Metric):
+    """Гистограмма распределения значений с метками."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], _HistogramSeries] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """Зарегистрировать наблюдение для указанных значений меток."""
+
+        series = self._series.get(labelvalues)
+        if series is None:
+            self._check_labels(labelvalues)
+            with self._lock:
+                series = self._series.setdefault(labelvalues, _HistogramSeries(len(self.upper_bounds) + 1))
+
+        # Последняя корзина соответствует +Inf
+        series.buckets[bisect_left(self.upper_bounds, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def time(self, *labelvalues: str) -> _Timer:
+        """Замерить длительность блока ``with`` или вызова декорированной функции."""
+
+        return _Timer(self, labelvalues)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float, int]]:
+        """Получить копию текущих значений по всем наборам меток."""
+
+        with self._lock:
+            items = list(self._series.items())
+        return {labels: (list(series.buckets), series.sum, series.count) for labels, series in items}
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (buckets, total, count) in self.snapshot().items():
+            cumulative = 0
+            for bound, bucket in zip(self.upper_bounds + (float("inf"),), buckets):
+                cumulative += bucket
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Все зарегистрированные метрики в текстовом формате Prometheus."""
+
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+UPDATES_TOTAL = Counter("bot_updates_total", "Обработанные обновления Telegram", ("type", "handler"))
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Длительность обработки обновления", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках обновлений", ("handler",))
+
+_UPDATE_TYPES = ("message", "callback_query", "edited_message", "inline_query", "my_chat_member")
+
+
+def _update_type(update) -> str:
+    for attribute in _UPDATE_TYPES:
+        if getattr(update, attribute, None) is not None:
+            return attribute
+    return "other"
+
+
+def instrument_handler(handler: Callable) -> Callable:
+    """Учитывать обновления, длительность и ошибки асинхронного обработчика PTB."""
+
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        UPDATES_TOTAL.inc(_update_type(update), name)
+        started = time.perf_counter()
+        try:
+            return await handler(update, context, *args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+async def start_metrics_server(host: str, port: int):
+    """Запустить HTTP-эндпоинт /metrics в текущем цикле событий."""
+
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,121 @@
+"""Денежные суммы в копейках.
+
+``Money`` хранит сумму целым числом минимальных единиц (копеек), поэтому
+сложение и сравнение точны и не дают артефактов округления ``float``.
+Сумма проходит весь путь в этом виде: ``validators.validate_amount`` разбирает
+ввод мерчанта сразу в ``Money``, сообщения и запросы к Konvert2pay получают
+строку ``"1000.50"`` (``str``), в истории заказов и сводной статистике
+хранятся целые копейки (поля ``*_minor``), а суммы за период считаются
+сложением целых чисел.
+
+Значения, сохранённые до перехода на копейки (``float`` в ``user_data``,
+поле ``amount`` в ``orders``, ``*_amount`` в ``stats_rollups``), приводятся
+через ``Money.coerce`` и ``stored_amount``.
+"""
+
+from __future__ import annotations
+
+import functools
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Mapping, Optional
+
+# Знаков после запятой у гривны
+DECIMALS = 2
+SCALE = 10 ** DECIMALS
+_QUANTUM = Decimal(1).scaleb(-DECIMALS)
+
+
+@functools.total_ordering
+class Money:
+    """Сумма в копейках."""
+
+    __slots__ = ("minor",)
+
+    def __init__(self, minor: int = 0):
+        if not isinstance(minor, int) or isinstance(minor, bool):
+            raise TypeError(f"Сумма задаётся целым числом копеек, а не {type(minor).__name__}")
+        self.minor = minor
+
+    @classmethod
+    def coerce(cls, value: Any) -> "Money":
+        """Сумма в гривнах (``Money``, ``Decimal``, ``int``, ``float`` или строка) в ``Money``.
+
+        Лишние знаки после запятой округляются по правилам бухгалтерии (половина вверх).
+        """
+
+        if isinstance(value, Money):
+            return value
+        if value is None or isinstance(value, bool):
+            raise TypeError(f"Не сумма: {value!r}")
+        if isinstance(value, float):
+            # repr float — кратчайшая десятичная запись, без хвоста двоичного округления
+            value = repr(value)
+        if isinstance(value, str):
+            value = value.strip().replace(",", ".")
+        return cls(int(Decimal(value).quantize(_QUANTUM, rounding=ROUND_HALF_UP).scaleb(DECIMALS)))
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.minor).scaleb(-DECIMALS)
+
+    def __str__(self) -> str:
+        major, minor = divmod(abs(self.minor), SCALE)
+        return f"{'-' if self.minor < 0 else ''}{major}.{minor:0{DECIMALS}d}"
+
+    def __format__(self, spec: str) -> str:
+        return format(self.to_decimal(), spec) if spec else str(self)
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
+
+    def __hash__(self) -> int:
+        return hash(self.minor)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Money):
+            return self.minor == other.minor
+        return NotImplemented
+
+    def __lt__(self, other) -> bool:
+        if isinstance(other, Money):
+            return self.minor < other.minor
+        return NotImplemented
+
+    def __bool__(self) -> bool:
+        return self.minor != 0
+
+    def __add__(self, other) -> "Money":
+        if isinstance(other, Money):
+            return Money(self.minor + other.minor)
+        return NotImplemented
+
+    def __radd__(self, other) -> "Money":
+        # sum() начинает с 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other) -> "Money":
+        if isinstance(other, Money):
+            return Money(self.minor - other.minor)
+        return NotImplemented
+
+    def __neg__(self) -> "Money":
+        return Money(-self.minor)
+
+
+ZERO = Money(0)
+
+
+def stored_amount(document: Mapping[str, Any], field: str = "amount") -> Optional[Money]:
+    """Сумма из документа MongoDB: ``<field>_minor`` в копейках или прежнее ``<field>`` в гривнах."""
+
+    minor = document.get(f"{field}_minor")
+    if minor is not None:
+        return Money(int(minor))
+    value = document.get(field)
+    if value is None:
+        return None
+    try:
+        return Money.coerce(value)
+    except (ArithmeticError, TypeError, ValueError):
+        return None
@@ -0,0 +1,168 @@
+"""История созданных инвойсов и выплат.
+
+Каждый вызов ``Konvert2payAPI.create_invoice``/``create_payout`` сохраняется
+в коллекцию ``orders``: запрос, ответ API, статус и длительность запроса.
+Сумма заказа хранится целым числом копеек в ``amount_minor``.
+Запись не задерживает ответ мерчанту: ``record_order`` только ставит документ
+в очередь, а фоновый поток записывает очередь пачками через ``insert_many``.
+При остановке бота оставшиеся документы дописываются до закрытия клиента
+MongoDB (``shutdown_order_history``).
+
+Выборки истории идут по индексам ``orders_shop_id_created_at_idx`` и
+``orders_order_id_idx`` из ``db_indexes.INDEX_PLAN``.
+
+Успешно созданный заказ получает ``payment_status: "pending"`` и время первой
+проверки ``next_check_at``; дальше статус ведёт сверка (``reconciliation.py``).
+"""
+
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional
+
+from pymongo import DESCENDING
+from pymongo.errors import PyMongoError
+
+from config import ORDER_HISTORY_BATCH_SIZE, ORDER_HISTORY_ENABLED, ORDER_HISTORY_FLUSH_INTERVAL, RECONCILE_INTERVALS
+from metrics import Counter
+from money import stored_amount
+
+logger = logging.getLogger(__name__)
+
+ORDER_HISTORY_WRITES = Counter(
+    "order_history_writes_total",
+    "Записи истории инвойсов и выплат по результату",
+    ("outcome",),
+)
+
+
+def build_order_document(kind: str, request: Mapping[str, Any], response: Mapping[str, Any],
+                         created_at: datetime, duration: float,
+                         user_info: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """Документ истории для одного запроса создания инвойса или выплаты."""
+
+    user_info = user_info or {}
+    amount = stored_amount(request)
+    document = {
+        "kind": kind,
+        "shop_id": request.get("shop_id"),
+        "order_id": request.get("order_id"),
+        "user_id": user_info.get("user_id"),
+        "username": user_info.get("username"),
+        "amount_minor": amount.minor if amount is not None else None,
+        "request": dict(request),
+        "response": response,
+        "status": "success" if response.get("Success") else "error",
+        "created_at": created_at,
+        "duration_ms": round(duration * 1000, 3),
+    }
+    if response.get("Success"):
+        document.update(
+            payment_status="pending", checks=0, next_check_at=created_at + timedelta(seconds=RECONCILE_INTERVALS[0]),
+        )
+    return document
+
+
+class OrderHistory:
+    """Фоновая запись истории заказов и выборки из неё."""
+
+    def __init__(self, db_manager, batch_size: int = ORDER_HISTORY_BATCH_SIZE,
+                 interval: float = ORDER_HISTORY_FLUSH_INTERVAL):
+        self.orders = db_manager.get_collection("orders")
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="order-history", daemon=True)
+        self._thread.start()
+
+    def submit(self, document: Dict[str, Any]) -> None:
+        self._queue.put(document)
+
+    def _drain(self, block: bool) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        try:
+            item = self._queue.get(timeout=self.interval) if block else self._queue.get_nowait()
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            self.orders.insert_many(batch, ordered=False)
+            ORDER_HISTORY_WRITES.inc("success", amount=len(batch))
+        except PyMongoError as exc:
+            ORDER_HISTORY_WRITES.inc("error", amount=len(batch))
+            logger.error("Не удалось записать в историю %s заказов: %s", len(batch), exc)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def close(self) -> None:
+        """Остановить поток и записать оставшиеся документы."""
+
+        self._stopped.set()
+        # None будит поток, ожидающий в _drain
+        self._queue.put(None)
+        self._thread.join(timeout=self.interval + 1)
+        while batch := self._drain(block=False):
+            self._write(batch)
+
+    def get_shop_history(self, shop_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Последние инвойсы и выплаты магазина, новые первыми."""
+
+        cursor = self.orders.find({"shop_id": shop_id}, sort=[("created_at", DESCENDING)], limit=limit)
+        return list(cursor)
+
+    def get_by_order_id(self, order_id: str) -> List[Dict[str, Any]]:
+        """Все запросы с данным order_id (повторные попытки тоже), новые первыми."""
+
+        return list(self.orders.find({"order_id": order_id}, sort=[("created_at", DESCENDING)]))
+
+
+_history: Optional[OrderHistory] = None
+
+
+def configure_order_history(db_manager) -> Optional[OrderHistory]:
+    """Включить запись истории в базу ``db_manager``."""
+
+    global _history
+    if not ORDER_HISTORY_ENABLED:
+        return None
+    if _history is not None:
+        _history.close()
+    _history = OrderHistory(db_manager)
+    return _history
+
+
+def get_order_history() -> Optional[OrderHistory]:
+    return _history
+
+
+def record_order(kind: str, request: Mapping[str, Any], response: Mapping[str, Any],
+                 created_at: datetime, duration: float,
+                 user_info: Optional[Mapping[str, Any]] = None) -> None:
+    """Поставить запрос в очередь записи; без ``configure_order_history`` ничего не делает."""
+
+    if _history is not None:
+        _history.submit(build_order_document(kind, request, response, created_at, duration, user_info))
+
+
+def shutdown_order_history() -> None:
+    """Записать накопленную историю и остановить фоновый поток."""
+
+    global _history
+    if _history is not None:
+        _history.close()
+        _history = None
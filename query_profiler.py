@@ -0,0 +1,274 @@
+"""Журнал медленных запросов MongoDB и захват планов выполнения.
+
+``DatabaseManager`` оборачивает коллекции в ``ProfiledCollection``: каждая
+операция записывается в метрики с указанием коллекции и операции, а в
+статистику профайлера — с формой фильтра (значения заменены на ``"?"``).
+Операции дольше ``SLOW_QUERY_THRESHOLD_MS`` попадают в журнал
+``SLOW_QUERY_LOG``; для каждой новой формы медленного запроса фоновый поток
+выполняет ``explain`` и отмечает полные сканирования коллекции (COLLSCAN) и
+сортировки в памяти (SORT). Сводку по журналу строит
+``python -m tools.slow_query_report``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from config import SLOW_QUERY_EXPLAIN_INTERVAL, SLOW_QUERY_LOG, SLOW_QUERY_THRESHOLD_MS
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+MONGO_QUERY_LATENCY = Histogram(
+    "mongo_query_duration_seconds",
+    "Длительность операций с коллекциями MongoDB",
+    ("collection", "operation"),
+)
+
+# Операции, первый аргумент которых — фильтр запроса
+_FILTER_OPERATIONS = frozenset({
+    "find_one", "count_documents", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "find_one_and_update", "find_one_and_delete", "distinct",
+})
+# Операции, возвращающие курсор: время учитывается до исчерпания курсора
+_CURSOR_OPERATIONS = frozenset({"find", "aggregate"})
+_WRITE_OPERATIONS = frozenset({"insert_one", "insert_many", "bulk_write"})
+
+
+def query_shape(value: Any) -> Any:
+    """Форма фильтра или конвейера: операторы и имена полей без значений."""
+
+    if isinstance(value, Mapping):
+        return {key: query_shape(item) if key.startswith("$") or isinstance(item, (Mapping, list)) else "?"
+                for key, item in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(item, Mapping) for item in value):
+            return [query_shape(item) for item in value]
+        return "?"
+    return "?"
+
+
+def _sort_shape(sort: Any) -> Optional[List[Tuple[str, int]]]:
+    if not sort:
+        return None
+    if isinstance(sort, str):
+        return [(sort, 1)]
+    return [tuple(item) if not isinstance(item, str) else (item, 1) for item in sort]
+
+
+def analyze_plan(explain: Mapping[str, Any]) -> Dict[str, Any]:
+    """Найти в выводе explain полные сканирования и сортировки в памяти."""
+
+    stages: List[str] = []
+    indexes: List[str] = []
+
+    def walk(node: Any) -> None:
+        if isinstance(node, Mapping):
+            stage = node.get("stage")
+            if isinstance(stage, str):
+                stages.append(stage)
+                if node.get("indexName"):
+                    indexes.append(node["indexName"])
+            for key, item in node.items():
+                # Отклонённые планы не выполнялись и не должны давать ложных флагов
+                if key != "rejectedPlans":
+                    walk(item)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(explain.get("queryPlanner", explain))
+    # Стадии конвейера, не перенесённые в запрос к коллекции (например, $sort
+    # после $lookup/$unwind), выполняются в памяти
+    pipeline = [operator for stage in explain.get("stages", []) for operator in stage if operator != "$cursor"]
+    upper = [stage.upper() for stage in stages]
+    return {
+        "stages": stages,
+        "pipeline": pipeline,
+        "indexes": indexes,
+        "collscan": "COLLSCAN" in upper,
+        "in_memory_sort": "SORT" in upper or "$sort" in pipeline,
+    }
+
+
+class QueryProfiler:
+    """Статистика операций по формам запросов и журнал медленных запросов."""
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+        log_path: Optional[str] = SLOW_QUERY_LOG,
+        explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.log_path = log_path
+        self.explain_interval = explain_interval
+        # (коллекция, операция, форма) -> [количество, сумма, максимум]
+        self.stats: Dict[Tuple[str, str, str], List[float]] = {}
+        self._explained_at: Dict[Tuple[str, str, str], float] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+
+    def record(self, collection, operation: str, duration: float, args: Sequence[Any],
+               kwargs: Mapping[str, Any]) -> None:
+        query = self._query_of(operation, args, kwargs)
+        shape = json.dumps(query_shape(query), sort_keys=True, ensure_ascii=False)
+        key = (collection.name, operation, shape)
+
+        entry = self.stats.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self.stats.setdefault(key, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+        if duration > entry[2]:
+            entry[2] = duration
+
+        if duration < self.threshold:
+            return
+        # explain для одной формы запроса выполняется не чаще раза в explain_interval
+        now = time.monotonic()
+        last_explained = self._explained_at.get(key)
+        explain = operation not in _WRITE_OPERATIONS and (
+            last_explained is None or now - last_explained >= self.explain_interval
+        )
+        if explain:
+            self._explained_at[key] = now
+        self._executor.submit(self._capture, collection, operation, shape, query, kwargs.get("sort"), duration, explain)
+
+    @staticmethod
+    def _query_of(operation: str, args: Sequence[Any], kwargs: Mapping[str, Any]) -> Any:
+        if operation == "aggregate":
+            return list(args[0]) if args else list(kwargs.get("pipeline", []))
+        if operation in _FILTER_OPERATIONS or operation == "find":
+            return args[0] if args else kwargs.get("filter", {})
+        return None
+
+    def _capture(self, collection, operation: str, shape: str, query: Any, sort: Any,
+                 duration: float, explain: bool) -> None:
+        entry: Dict[str, Any] = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "collection": collection.name,
+            "operation": operation,
+            "shape": shape,
+            "duration_ms": round(duration * 1000, 3),
+        }
+        if explain:
+            try:
+                plan = analyze_plan(self._explain(collection, operation, query, sort))
+                entry["plan"] = plan
+            except Exception as exc:
+                entry["explain_error"] = str(exc)
+
+        plan = entry.get("plan") or {}
+        logger.warning(
+            "Медленный запрос %.1f мс: %s.%s %s%s%s",
+            entry["duration_ms"], collection.name, operation, shape,
+            " [COLLSCAN]" if plan.get("collscan") else "",
+            " [SORT в памяти]" if plan.get("in_memory_sort") else "",
+        )
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _explain(collection, operation: str, query: Any, sort: Any) -> Mapping[str, Any]:
+        database = collection.database
+        if operation == "aggregate":
+            command = {"aggregate": collection.name, "pipeline": query, "cursor": {}}
+        else:
+            command = {"find": collection.name, "filter": query or {}}
+            sort_spec = _sort_shape(sort)
+            if sort_spec:
+                command["sort"] = dict(sort_spec)
+        return database.command("explain", command, verbosity="queryPlanner")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Статистика по формам запросов, отсортированная по суммарному времени."""
+
+        with self._lock:
+            items = list(self.stats.items())
+        rows = [
+            {
+                "collection": collection,
+                "operation": operation,
+                "shape": shape,
+                "count": int(count),
+                "avg_ms": round(total / count * 1000, 3),
+                "max_ms": round(maximum * 1000, 3),
+                "total_ms": round(total * 1000, 3),
+            }
+            for (collection, operation, shape), (count, total, maximum) in items
+        ]
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def flush(self) -> None:
+        """Дождаться записи уже поставленных в очередь медленных запросов."""
+
+        self._executor.submit(lambda: None).result()
+
+
+class _ProfiledCursor:
+    """Курсор, время итерации по которому включается в длительность операции."""
+
+    def __init__(self, cursor: Iterable, finish):
+        self._cursor = cursor
+        self._finish = finish
+
+    def __iter__(self):
+        try:
+            yield from self._cursor
+        finally:
+            if self._finish is not None:
+                self._finish()
+                self._finish = None
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
+class ProfiledCollection:
+    """Обёртка коллекции pymongo, измеряющая операции чтения и записи."""
+
+    _OPERATIONS = _FILTER_OPERATIONS | _CURSOR_OPERATIONS | _WRITE_OPERATIONS
+
+    def __init__(self, collection, profiler: QueryProfiler):
+        self._collection = collection
+        self._profiler = profiler
+
+    @property
+    def name(self) -> str:
+        return self._collection.name
+
+    @property
+    def database(self):
+        return self._collection.database
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._collection, name)
+        if name not in self._OPERATIONS:
+            return attribute
+
+        collection, profiler = self._collection, self._profiler
+
+        def operation(*args, **kwargs):
+            started = time.perf_counter()
+
+            def finish() -> None:
+                duration = time.perf_counter() - started
+                MONGO_QUERY_LATENCY.observe(duration, collection.name, name)
+                profiler.record(collection, name, duration, args, kwargs)
+
+            result = attribute(*args, **kwargs)
+            if name in _CURSOR_OPERATIONS:
+                return _ProfiledCursor(result, finish)
+            finish()
+            return result
+
+        return operation
@@ -0,0 +1,211 @@
+"""Сверка статусов созданных инвойсов и выплат с Konvert2pay.
+
+После создания инвойса бот знает только ссылку на оплату. ``Reconciler``
+раз в ``RECONCILE_TICK`` секунд выбирает из коллекции ``orders`` заказы, у
+которых наступило ``next_check_at``, и запрашивает их статусы:
+
+* паузы между проверками одного заказа растут по ``RECONCILE_INTERVALS`` —
+  свежий инвойс проверяется часто, давний всё реже;
+* заказы одного магазина проверяются одним запросом, до
+  ``RECONCILE_BATCH_SIZE`` штук;
+* все запросы статуса расходуют общий бюджет ``RECONCILE_RATE`` в секунду,
+  поэтому сверка не вытесняет запросы мерчантов, сколько бы заказов ни ждало.
+
+Изменившийся статус записывается в документ заказа (``payment_status``), а
+мерчанту приходит уведомление. У заказа в конечном статусе или старше
+``RECONCILE_MAX_AGE`` поле ``next_check_at`` удаляется, и он выпадает из
+разреженного индекса ``orders_next_check_at_idx``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import functools
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from api_client import Konvert2payAPI
+from api_limiter import RateBudget
+from config import (
+    RECONCILE_BATCH_SIZE, RECONCILE_INTERVALS, RECONCILE_MAX_AGE, RECONCILE_RATE, RECONCILE_TICK,
+)
+from constants import Messages
+from metrics import Counter
+from money import stored_amount
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CHECKS = Counter(
+    "reconcile_checks_total",
+    "Проверки статусов заказов по типу заказа и результату",
+    ("kind", "outcome"),
+)
+
+# Статусы, после которых заказ больше не проверяется
+FINAL_STATUSES = frozenset({"paid", "success", "failed", "expired", "cancelled"})
+
+_PROJECTION = {
+    "kind": 1, "shop_id": 1, "order_id": 1, "user_id": 1, "amount": 1, "amount_minor": 1,
+    "payment_status": 1, "checks": 1, "created_at": 1,
+}
+
+
+def next_interval(checks: int, intervals: Sequence[float] = RECONCILE_INTERVALS) -> float:
+    """Пауза перед следующей проверкой заказа, уже проверенного ``checks`` раз."""
+
+    return intervals[min(checks, len(intervals) - 1)]
+
+
+async def notify_status_change(bot, order: Dict[str, Any], status: str) -> None:
+    """Сообщить мерчанту, создавшему заказ, о новом статусе."""
+
+    if order.get("user_id") is None:
+        return
+    text = Messages.ORDER_STATUS_CHANGED.format(
+        kind=Messages.ORDER_KIND_LABELS.get(order["kind"], order["kind"]),
+        order_id=order["order_id"],
+        status=Messages.ORDER_STATUS_LABELS.get(status, status),
+        amount=stored_amount(order),
+    )
+    try:
+        await bot.send_message(chat_id=order["user_id"], text=text)
+    except Exception as exc:
+        logger.warning("Не удалось уведомить мерчанта %s о статусе заказа: %s", order["user_id"], exc)
+
+
+class Reconciler:
+    """Фоновая сверка статусов заказов с бюджетом запросов к API."""
+
+    def __init__(self, db_manager, user_manager, bot, rate: float = RECONCILE_RATE,
+                 batch_size: int = RECONCILE_BATCH_SIZE, intervals: Sequence[float] = RECONCILE_INTERVALS,
+                 max_age: float = RECONCILE_MAX_AGE, tick: float = RECONCILE_TICK):
+        self.orders = db_manager.get_collection("orders")
+        self.user_manager = user_manager
+        self.bot = bot
+        self.budget = RateBudget(rate)
+        self.batch_size = batch_size
+        self.intervals = intervals
+        self.max_age = timedelta(seconds=max_age)
+        self.tick = tick
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запустить сверку; вызывается из работающего цикла событий."""
+
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить сверку. Прерванная проверка безопасна: заказ проверится после запуска."""
+
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("Ошибка сверки статусов заказов")
+            await asyncio.sleep(self.tick)
+
+    def _due(self, now: datetime, limit: int) -> List[Dict[str, Any]]:
+        cursor = self.orders.find(
+            {"next_check_at": {"$lte": now}}, _PROJECTION, sort=[("next_check_at", ASCENDING)], limit=limit,
+        )
+        return list(cursor)
+
+    async def poll_once(self) -> Dict[str, int]:
+        """Проверить заказы, которым подошёл срок; возвращает число заказов по результату."""
+
+        loop = asyncio.get_running_loop()
+        # Больше заказов до следующего цикла бюджет всё равно не позволит проверить
+        limit = self.batch_size * max(1, math.ceil(self.budget.rate * self.tick))
+        due = await loop.run_in_executor(None, self._due, datetime.utcnow(), limit)
+
+        groups: Dict[tuple, List[Dict[str, Any]]] = collections.defaultdict(list)
+        for order in due:
+            groups[(order["kind"], order["shop_id"])].append(order)
+        batches = [
+            (kind, shop_id, orders[start:start + self.batch_size])
+            for (kind, shop_id), orders in groups.items()
+            for start in range(0, len(orders), self.batch_size)
+        ]
+        totals: collections.Counter = collections.Counter()
+        for outcomes in await asyncio.gather(*(self._check_batch(*batch) for batch in batches)):
+            totals.update(outcomes)
+        return dict(totals)
+
+    def _schedule(self, order: Dict[str, Any], now: datetime, status: str) -> UpdateOne:
+        """Обновление заказа после проверки: новый статус и время следующей проверки."""
+
+        checks = order.get("checks", 0) + 1
+        update: Dict[str, Any] = {"$set": {"payment_status": status, "checks": checks, "checked_at": now}}
+        if status in FINAL_STATUSES or now - order["created_at"] >= self.max_age:
+            update["$unset"] = {"next_check_at": ""}
+        else:
+            update["$set"]["next_check_at"] = now + timedelta(seconds=next_interval(checks, self.intervals))
+        return UpdateOne({"_id": order["_id"]}, update)
+
+    async def _check_batch(self, kind: str, shop_id: str, orders: List[Dict[str, Any]]) -> Dict[str, int]:
+        loop = asyncio.get_running_loop()
+        user_id = next((order["user_id"] for order in orders if order.get("user_id") is not None), None)
+        settings = None
+        if user_id is not None:
+            settings = await loop.run_in_executor(None, self.user_manager.get_merchant_settings, user_id)
+
+        # None — статусы получить не удалось
+        statuses: Optional[Dict[str, Any]] = None
+        if settings and settings.get("shop_api_key"):
+            await self.budget.acquire()
+            response = await Konvert2payAPI.get_statuses(
+                kind, shop_id, settings["shop_api_key"], [order["order_id"] for order in orders],
+            )
+            if response.get("Success"):
+                statuses = {item.get("order_id"): item.get("status") for item in response.get("Data") or []}
+            else:
+                error = response.get("Error") or {}
+                logger.warning("Не удалось получить статусы (%s, магазин %s): %s", kind, shop_id, error.get("Message"))
+        else:
+            # Магазин удалён или заказ создан без мерчанта: проверять нечем, пробуем позже
+            logger.warning("Нет ключа API для сверки заказов магазина %s", shop_id)
+
+        now = datetime.utcnow()
+        outcomes: collections.Counter = collections.Counter()
+        requests, changed = [], []
+        for order in orders:
+            previous = order.get("payment_status", "pending")
+            status = (statuses or {}).get(order["order_id"]) or previous
+            if status == "not_found":
+                # Заказ мог ещё не появиться в выдаче статусов: проверим позже
+                status = previous
+            requests.append(self._schedule(order, now, status))
+            if statuses is None:
+                outcome = "error"
+            elif status != previous:
+                outcome = "changed"
+                changed.append((order, status))
+            else:
+                outcome = "unchanged"
+            outcomes[outcome] += 1
+            RECONCILE_CHECKS.inc(kind, outcome)
+
+        try:
+            await loop.run_in_executor(None, functools.partial(self.orders.bulk_write, requests, ordered=False))
+        except PyMongoError as exc:
+            # Статус не сохранён: уведомление не отправляем, заказ проверится снова
+            logger.error("Не удалось сохранить результаты сверки (%s заказов): %s", len(requests), exc)
+            return dict(outcomes)
+
+        for order, status in changed:
+            await notify_status_change(self.bot, order, status)
+        return dict(outcomes)
@@ -0,0 +1,246 @@
+"""Плавная остановка бота.
+
+По сигналу остановки ``ShutdownCoordinator`` перестаёт принимать новые
+обновления (обработчики, обёрнутые ``guard_update``, отвечают, что бот
+перезапускается), ждёт до ``SHUTDOWN_TIMEOUT`` секунд завершения начатых
+операций — обработки обновлений, запросов к Konvert2pay, отправки webhook и
+рассылок — и отменяет оставшиеся, записывая в лог, что именно было прервано.
+Только после этого останавливается цикл событий и ``Application`` выполняет
+свою обычную остановку. В ``post_shutdown`` сбрасываются фоновые очереди
+(журнал медленных запросов, история заказов, статистика, спаны) и закрываются общие пулы HTTP-соединений
+и клиент MongoDB. Повторный сигнал останавливает бот сразу.
+
+Операции регистрируются контекстным менеджером ``track`` или запускаются
+фоновой задачей через ``spawn``::
+
+    async with coordinator.track("webhook", event_type=event_type):
+        ...
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import logging
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from config import SHUTDOWN_TIMEOUT
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Время на обработку отмены (например, уведомление администратора), в секундах
+_CANCEL_GRACE = 5.0
+
+SHUTDOWN_INTERRUPTED = Counter(
+    "shutdown_interrupted_operations_total",
+    "Операции, прерванные по истечении времени плавной остановки",
+    ("kind",),
+)
+
+
+class _Operation:
+    """Выполняющаяся операция и её описание для журнала."""
+
+    __slots__ = ("kind", "details", "task", "started")
+
+    def __init__(self, kind: str, details: Dict[str, Any], task: Optional[asyncio.Task]):
+        self.kind = kind
+        self.details = details
+        self.task = task
+        self.started = time.monotonic()
+
+    def describe(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "running_s": round(time.monotonic() - self.started, 3), **self.details}
+
+
+class ShutdownCoordinator:
+    """Учёт начатых операций и их завершение при остановке."""
+
+    def __init__(self, timeout: float = SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self.draining = False
+        self._operations: Dict[int, _Operation] = {}
+        self._ids = itertools.count()
+        self._idle: Optional[asyncio.Event] = None
+        self._stopping: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Количество выполняющихся операций."""
+
+        return len(self._operations)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Описания выполняющихся операций."""
+
+        return [operation.describe() for operation in self._operations.values()]
+
+    def _register(self, kind: str, details: Dict[str, Any], task: Optional[asyncio.Task]) -> int:
+        key = next(self._ids)
+        self._operations[key] = _Operation(kind, details, task)
+        if self._idle is not None:
+            self._idle.clear()
+        return key
+
+    def _unregister(self, key: int) -> None:
+        self._operations.pop(key, None)
+        if not self._operations and self._idle is not None:
+            self._idle.set()
+
+    @asynccontextmanager
+    async def track(self, kind: str, **details: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Зарегистрировать операцию на время блока; возвращает изменяемое описание."""
+
+        key = self._register(kind, details, asyncio.current_task())
+        try:
+            yield details
+        finally:
+            self._unregister(key)
+
+    def spawn(self, coroutine: Awaitable[Any], kind: str, **details: Any) -> asyncio.Task:
+        """Запустить фоновую задачу, которую остановка дождётся или прервёт."""
+
+        task = asyncio.ensure_future(coroutine)
+        key = self._register(kind, details, task)
+        task.add_done_callback(lambda _: self._unregister(key))
+        task.add_done_callback(_log_task_error)
+        return task
+
+    def begin(self) -> None:
+        """Перестать принимать новые обновления."""
+
+        if not self.draining:
+            self.draining = True
+            logger.info("Начата плавная остановка: выполняется операций %s", self.in_flight)
+
+    async def drain(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Дождаться начатых операций; невыполненные к сроку отменить.
+
+        Возвращает описания прерванных операций.
+        """
+
+        self.begin()
+        timeout = self.timeout if timeout is None else timeout
+        if self._operations:
+            self._idle = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        interrupted = []
+        current = asyncio.current_task()
+        for operation in list(self._operations.values()):
+            description = operation.describe()
+            interrupted.append(description)
+            SHUTDOWN_INTERRUPTED.inc(operation.kind)
+            logger.error("Операция прервана при остановке: %s", description)
+            if operation.task is not None and operation.task is not current and not operation.task.done():
+                operation.task.cancel()
+        tasks = [operation.task for operation in self._operations.values()
+                 if operation.task is not None and operation.task is not current]
+        if tasks:
+            # Дать отменённым задачам выполнить свои finally-блоки
+            await asyncio.wait(tasks, timeout=_CANCEL_GRACE)
+        if not interrupted:
+            logger.info("Все операции завершены до остановки")
+        return interrupted
+
+    def install_signal_handlers(self, loop: Optional[asyncio.AbstractEventLoop] = None, updater=None) -> None:
+        """Перехватить сигналы остановки: сначала завершить начатое, затем остановить цикл.
+
+        Заменяет обработчики, установленные ``Application.run_polling``: после
+        ``loop.stop()`` приложение выполняет обычную последовательность
+        остановки (Updater, Application, post_stop, post_shutdown).
+        ``updater`` останавливается до ожидания операций: новые обновления не
+        забираются у Telegram и достанутся следующему экземпляру бота.
+        """
+
+        loop = loop or asyncio.get_running_loop()
+
+        async def drain_and_stop() -> None:
+            try:
+                if updater is not None and updater.running:
+                    await updater.stop()
+                await self.drain()
+            finally:
+                loop.stop()
+
+        def stop() -> None:
+            if self._stopping is not None:
+                logger.warning("Повторный сигнал остановки: выход без ожидания операций")
+                raise SystemExit
+            self.begin()
+            self._stopping = loop.create_task(drain_and_stop())
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop)
+            except (NotImplementedError, RuntimeError):
+                # Цикл событий без поддержки сигналов (например, на Windows)
+                return
+
+    def guard_update(self, handler: Callable) -> Callable:
+        """Учитывать обработку обновления как операцию; во время остановки отвечать отказом.
+
+        Отказ получают только обновления, забранные до остановки ``Updater``.
+        """
+
+        name = handler.__name__
+
+        @functools.wraps(handler)
+        async def wrapper(update, context, *args, **kwargs):
+            if not self.draining:
+                user = getattr(update, "effective_user", None)
+                async with self.track("update", handler=name, user_id=getattr(user, "id", None)):
+                    return await handler(update, context, *args, **kwargs)
+
+            from constants import Messages
+
+            query = getattr(update, "callback_query", None)
+            if query is not None:
+                await query.answer(Messages.BOT_RESTARTING, show_alert=True)
+            elif getattr(update, "effective_message", None) is not None:
+                await update.effective_message.reply_text(Messages.BOT_RESTARTING)
+            return None
+
+        return wrapper
+
+
+def _log_task_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Фоновая задача завершилась ошибкой", exc_info=task.exception())
+
+
+coordinator = ShutdownCoordinator()
+
+SHUTDOWN_IN_FLIGHT = Gauge(
+    "shutdown_in_flight_operations",
+    "Операции, которые плавная остановка дождётся перед выходом",
+    function=lambda: coordinator.in_flight,
+)
+
+
+async def close_resources(merchant_bot=None) -> None:
+    """Сбросить фоновые очереди и закрыть общие пулы соединений."""
+
+    from api_client import Konvert2payAPI
+    from order_history import shutdown_order_history
+    from stats_rollups import shutdown_stats_rollups
+    from tracing import shutdown_tracing
+    from webhook_sender import WebhookSender
+
+    await Konvert2payAPI.close()
+    await WebhookSender.close()
+    loop = asyncio.get_running_loop()
+    # История заказов и статистика дописываются до закрытия клиента MongoDB
+    await loop.run_in_executor(None, shutdown_order_history)
+    await loop.run_in_executor(None, shutdown_stats_rollups)
+    if merchant_bot is not None:
+        await loop.run_in_executor(None, merchant_bot.close_database)
+    shutdown_tracing()
@@ -21,6 +21,10 @@ class UserState(Enum):
     WAITING_FOR_PURPOSE = "waiting_for_purpose"
     WAITING_FOR_PAYOUT_AMOUNT = "waiting_for_payout_amount"
     
+    # Ожидание CSV-файла для массового создания
+    WAITING_FOR_BULK_INVOICE_FILE = "waiting_for_bulk_invoice_file"
+    WAITING_FOR_BULK_PAYOUT_FILE = "waiting_for_bulk_payout_file"
+    
     # Состояния админа
     WAITING_FOR_ADMIN_USERNAME = "waiting_for_admin_username"
     WAITING_FOR_ADMIN_SHOP_ID = "waiting_for_admin_shop_id"
@@ -55,7 +59,7 @@ class StateManager:
         states_to_clear = [
             'payout_order_id', 'payout_client_id', 'payout_iban_account',
             'payout_iban_inn', 'payout_surname', 'payout_name', 'payout_middlename',
-            'payout_purpose', 'payout_amount',
+            'payout_purpose', 'payout_amount', 'current_state',
             UserState.WAITING_FOR_PAYOUT_ORDER_ID.value,
             UserState.WAITING_FOR_PAYOUT_CLIENT_ID.value,
             UserState.WAITING_FOR_IBAN_ACCOUNT.value,
@@ -99,3 +103,4 @@ class StateManager:
         StateManager.clear_payout_states(context)
         StateManager.clear_admin_states(context)
         StateManager.clear_logout_states(context)
+        context.user_data.pop('current_state', None)
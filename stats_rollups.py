@@ -0,0 +1,233 @@
+"""Сводная статистика инвойсов и выплат по магазинам.
+
+Для каждого магазина ведутся документы-счётчики за час и за сутки в
+коллекции ``stats_rollups``. Обработчики подтверждения вызывают
+``record_outcome``, который только увеличивает счётчики в памяти; фоновый
+поток раз в ``STATS_FLUSH_INTERVAL`` секунд записывает накопленное одним
+``bulk_write`` с атомарным ``$inc`` (upsert), поэтому несколько процессов
+бота могут писать в одни и те же документы. Экран статистики читает по
+документу на магазин за сутки — O(дней), а не O(заказов).
+
+Обороты хранятся целым числом копеек (``invoice_amount_minor``,
+``payout_amount_minor``), поэтому ``$inc`` и суммы за период точны.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from config import STATS_FLUSH_INTERVAL, STATS_ROLLUPS_ENABLED, STATS_TOP_SHOPS
+from constants import Messages
+from metrics import Counter
+from money import Money
+
+logger = logging.getLogger(__name__)
+
+STATS_FLUSHES = Counter(
+    "stats_rollup_flushes_total",
+    "Записи накопленных счётчиков статистики по результату",
+    ("outcome",),
+)
+
+PERIODS = ("hour", "day")
+
+# (shop_id, период, начало периода) -> {счётчик: приращение}
+_Key = Tuple[str, str, datetime]
+
+
+def period_start(moment: datetime, period: str) -> datetime:
+    """Начало часа или суток, к которым относится ``moment``."""
+
+    if period == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_id(shop_id: str, period: str, bucket: datetime) -> str:
+    return f"{shop_id}|{period}|{bucket:%Y-%m-%dT%H}"
+
+
+def outcome_increments(kind: str, amount: Any, success: bool) -> Dict[str, Any]:
+    """Приращения счётчиков для одного результата создания инвойса или выплаты."""
+
+    increments: Dict[str, Any] = {f"{kind}_total": 1}
+    if success:
+        increments[f"{kind}_success"] = 1
+        increments[f"{kind}_amount_minor"] = Money.coerce(amount).minor if amount is not None else 0
+    else:
+        increments[f"{kind}_failed"] = 1
+    return increments
+
+
+class StatsRollups:
+    """Накопление счётчиков в памяти, периодическая запись и чтение сводок."""
+
+    def __init__(self, db_manager, interval: float = STATS_FLUSH_INTERVAL):
+        self.collection = db_manager.get_collection("stats_rollups")
+        self.interval = interval
+        self._pending: Dict[_Key, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stats-rollups", daemon=True)
+        self._thread.start()
+
+    def record(self, kind: str, shop_id: str, amount: Any, success: bool,
+               moment: Optional[datetime] = None) -> None:
+        moment = moment or datetime.utcnow()
+        increments = outcome_increments(kind, amount, success)
+        with self._lock:
+            for period in PERIODS:
+                counters = self._pending.setdefault((shop_id, period, period_start(moment, period)), {})
+                for field, value in increments.items():
+                    counters[field] = counters.get(field, 0) + value
+
+    def flush(self) -> int:
+        """Записать накопленные счётчики; возвращает число обновлённых документов.
+
+        При ошибке записи счётчики возвращаются в очередь и уйдут со следующей
+        попыткой.
+        """
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        requests = [
+            UpdateOne(
+                {"_id": rollup_id(shop_id, period, bucket)},
+                {"$inc": counters, "$setOnInsert": {"shop_id": shop_id, "period": period, "bucket": bucket}},
+                upsert=True,
+            )
+            for (shop_id, period, bucket), counters in pending.items()
+        ]
+        try:
+            self.collection.bulk_write(requests, ordered=False)
+        except PyMongoError as exc:
+            STATS_FLUSHES.inc("error")
+            logger.error("Не удалось записать статистику (%s документов): %s", len(requests), exc)
+            with self._lock:
+                for key, counters in pending.items():
+                    merged = self._pending.setdefault(key, {})
+                    for field, value in counters.items():
+                        merged[field] = merged.get(field, 0) + value
+            return 0
+        STATS_FLUSHES.inc("success")
+        return len(requests)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Остановить поток и записать оставшиеся счётчики."""
+
+        self._stopped.set()
+        self._thread.join(timeout=self.interval + 1)
+        self.flush()
+
+    @staticmethod
+    def _daily_query(days: int) -> Dict[str, Any]:
+        since = period_start(datetime.utcnow(), "day") - timedelta(days=days - 1)
+        return {"period": "day", "bucket": {"$gte": since}}
+
+    def get_shop_stats(self, shop_id: str, days: int = 7) -> List[Dict[str, Any]]:
+        """Суточные счётчики магазина за последние ``days`` дней, по возрастанию даты."""
+
+        query = {"shop_id": shop_id, **self._daily_query(days)}
+        return list(self.collection.find(query, sort=[("bucket", ASCENDING)]))
+
+    def get_totals(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Суммы счётчиков по магазинам за последние ``days`` дней."""
+
+        totals: Dict[str, Dict[str, Any]] = defaultdict(lambda: defaultdict(int))
+        for document in self.collection.find(self._daily_query(days)):
+            shop = totals[document["shop_id"]]
+            for field, value in document.items():
+                if field.startswith(("invoice_", "payout_")):
+                    shop[field] += value
+        return [{"shop_id": shop_id, **counters} for shop_id, counters in totals.items()]
+
+
+def _turnover(counters: Dict[str, Any], kind: str) -> Money:
+    """Оборот по типу заказа: копейки плюс суммы в гривнах из документов до перехода на копейки."""
+
+    amount = Money(counters.get(f"{kind}_amount_minor", 0))
+    if counters.get(f"{kind}_amount"):
+        amount += Money.coerce(counters[f"{kind}_amount"])
+    return amount
+
+
+def _row(label: str, counters: Dict[str, Any]) -> str:
+    values = {field: counters.get(field, 0) for field in (
+        "invoice_total", "invoice_success", "payout_total", "payout_success",
+    )}
+    return Messages.ADMIN_STATS_ROW.format(
+        label=label, invoice_amount=_turnover(counters, "invoice"), payout_amount=_turnover(counters, "payout"),
+        **values,
+    )
+
+
+def render_totals(totals: List[Dict[str, Any]], days: int, top: int = STATS_TOP_SHOPS) -> str:
+    """Текст экрана статистики по всем магазинам, по убыванию оборота инвойсов."""
+
+    if not totals:
+        return Messages.ADMIN_STATS_EMPTY.format(days=days)
+    ordered = sorted(totals, key=lambda row: _turnover(row, "invoice"), reverse=True)
+    lines = [Messages.ADMIN_STATS_TITLE.format(days=days), ""]
+    lines.extend(_row(row["shop_id"], row) for row in ordered[:top])
+    if len(ordered) > top:
+        lines.append(Messages.ADMIN_STATS_MORE.format(count=len(ordered) - top))
+    return "\n".join(lines)
+
+
+def render_shop(shop_id: str, daily: List[Dict[str, Any]], days: int) -> str:
+    """Текст экрана статистики магазина по дням."""
+
+    if not daily:
+        return Messages.ADMIN_STATS_EMPTY.format(days=days)
+    lines = [Messages.ADMIN_STATS_SHOP_TITLE.format(shop_id=shop_id, days=days), ""]
+    lines.extend(_row(f"{document['bucket']:%d.%m.%Y}", document) for document in daily)
+    return "\n".join(lines)
+
+
+_rollups: Optional[StatsRollups] = None
+
+
+def configure_stats_rollups(db_manager) -> Optional[StatsRollups]:
+    """Включить накопление статистики с записью в базу ``db_manager``."""
+
+    global _rollups
+    if not STATS_ROLLUPS_ENABLED:
+        return None
+    if _rollups is not None:
+        _rollups.close()
+    _rollups = StatsRollups(db_manager)
+    return _rollups
+
+
+def get_stats_rollups() -> Optional[StatsRollups]:
+    return _rollups
+
+
+def record_outcome(kind: str, shop_id: str, amount: Any, success: bool) -> None:
+    """Учесть результат подтверждения; без ``configure_stats_rollups`` ничего не делает."""
+
+    if _rollups is not None:
+        _rollups.record(kind, shop_id, amount, success)
+
+
+def shutdown_stats_rollups() -> None:
+    """Записать накопленные счётчики и остановить фоновый поток."""
+
+    global _rollups
+    if _rollups is not None:
+        _rollups.close()
+        _rollups = None
@@ -0,0 +1,110 @@
+"""Структурированное логирование с выборкой и фоновой записью.
+
+``setup_logging`` заменяет обработчики корневого логгера на ``QueueHandler``:
+вызывающая корутина только кладёт запись в очередь, а форматирование и
+запись в поток выполняет фоновый поток ``QueueListener``. Записи с атрибутом
+``event`` (``logger.debug("...", extra={"event": "invoice.state"})``)
+проходят выборку с долей из ``LOG_SAMPLE_RATES``; предупреждения и ошибки
+не отбрасываются никогда.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional, TextIO
+
+from config import LOG_FORMAT, LOG_JSON, LOG_LEVEL, LOG_SAMPLE_RATES
+
+_RESERVED_ATTRS = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None))
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирование записи в одну строку JSON с полями из ``extra``."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка записей по событию: ``{"invoice.state": 0.1}`` пропускает ~10%."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler``, откладывающий форматирование до фонового потока.
+
+    Стандартный ``prepare`` форматирует сообщение в вызывающем потоке. Здесь
+    это делается только если среди аргументов есть изменяемые объекты,
+    которые могут поменяться до записи.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        # Единственный аргумент-словарь logging сохраняет в args как есть
+        if args and (isinstance(args, dict) or not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    json_output: bool = LOG_JSON,
+    sample_rates: Optional[Dict[str, float]] = None,
+    stream: Optional[TextIO] = None,
+) -> logging.handlers.QueueListener:
+    """Настроить корневой логгер и запустить фоновую запись; возвращает слушатель очереди."""
+
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(JsonFormatter() if json_output else logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES if sample_rates is None else sample_rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level))
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+
+def _stop_listener(listener: logging.handlers.QueueListener) -> None:
+    """Дописать оставшиеся записи; повторная остановка ничего не делает."""
+
+    if listener._thread is not None:
+        listener.stop()
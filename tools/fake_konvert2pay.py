@@ -0,0 +1,391 @@
+"""Локальная заглушка API Konvert2pay и приёмника webhook для нагрузочного тестирования.
+
+Запуск::
+
+    python -m tools.fake_konvert2pay --port 8081 --latency lognormal:0.08:0.4 --error-rate 0.02 --rate-limit 50
+
+После этого бота можно направить на заглушку::
+
+    KONVERT2PAY_API_BASE_URL=http://127.0.0.1:8081/api/v1 \\
+    MERCHANT_BOT_WEBHOOK_URL=http://127.0.0.1:8081/webhook python MerchantBot.py
+
+Заглушка также принимает спаны трассировки по OTLP/HTTP (``POST /v1/traces``,
+``MERCHANT_BOT_TRACING_ENABLED=1`` ``MERCHANT_BOT_TRACE_EXPORTER=otlp``
+``MERCHANT_BOT_TRACE_OTLP_ENDPOINT=http://127.0.0.1:8081/v1/traces``) и
+показывает трассы по ``GET /traces``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter, defaultdict, deque
+from typing import Callable, Dict, Optional, Tuple
+
+from aiohttp import ClientSession, web
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/v1"
+
+
+class LatencyDistribution:
+    """Распределение задержки ответа, задаваемое строкой вида ``тип:параметры``.
+
+    Поддерживаются ``fixed:СЕК``, ``uniform:МИН:МАКС``, ``exp:СРЕДНЕЕ`` и
+    ``lognormal:МЕДИАНА:СИГМА``.
+    """
+
+    def __init__(self, spec: str = "fixed:0", rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, *raw_params = spec.split(":")
+        params = [float(value) for value in raw_params]
+        self._sample = self._build_sampler(kind, params)
+
+    def _build_sampler(self, kind: str, params) -> Callable[[], float]:
+        if kind == "fixed" and len(params) == 1:
+            return lambda: params[0]
+        if kind == "uniform" and len(params) == 2:
+            return lambda: self.rng.uniform(params[0], params[1])
+        if kind == "exp" and len(params) == 1:
+            return lambda: self.rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+        if kind == "lognormal" and len(params) == 2:
+            mu = math.log(params[0])
+            return lambda: self.rng.lognormvariate(mu, params[1])
+        raise ValueError(f"Некорректное описание распределения задержки: {self.spec!r}")
+
+    def sample(self) -> float:
+        """Случайная задержка в секундах."""
+
+        return max(0.0, self._sample())
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов (token bucket)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class FakeKonvert2pay:
+    """Заглушка эндпоинтов создания и статуса инвойсов и выплат и приёмника webhook.
+
+    ``rate_limit`` задаёт допустимое число запросов в секунду на один shop_id
+    (0 — без ограничения), ``error_rate`` — долю ответов с ``Success: false``,
+    ``webhook_error_rate`` — долю webhook, на которые отвечаем статусом 500.
+    Созданный заказ через время из распределения ``settle`` переходит в
+    конечный статус: с вероятностью ``paid_rate`` оплачен (выплачен), иначе
+    истёк (не прошёл). Если задан ``callback_url``, в этот момент на него
+    уходит подписанный ``callback_secret`` callback о статусе.
+    """
+
+    def __init__(
+        self,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        webhook_latency: str = "fixed:0",
+        webhook_error_rate: float = 0.0,
+        public_url: str = "http://127.0.0.1:8081",
+        seed: Optional[int] = None,
+        settle: str = "exp:60",
+        paid_rate: float = 0.8,
+        callback_url: Optional[str] = None,
+        callback_secret: str = "",
+    ):
+        self.rng = random.Random(seed)
+        self.latency = LatencyDistribution(latency, self.rng)
+        self.webhook_latency = LatencyDistribution(webhook_latency, self.rng)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.webhook_error_rate = webhook_error_rate
+        self.public_url = public_url.rstrip("/")
+        self.stats: Counter = Counter()
+        self.webhooks: list = []
+        self.spans: deque = deque(maxlen=100_000)
+        self._buckets: Dict[str, TokenBucket] = defaultdict(lambda: TokenBucket(self.rate_limit))
+        self._ids = itertools.count(100000)
+        self.settle = LatencyDistribution(settle, self.rng)
+        self.paid_rate = paid_rate
+        # (тип, shop_id, order_id) -> (время перехода в конечный статус, конечный статус)
+        self._orders: Dict[Tuple[str, str, str], Tuple[float, str]] = {}
+        self.callback_url = callback_url
+        self.callback_secret = callback_secret
+        self._events = itertools.count(1)
+        self._callbacks: set = set()
+        self._session: Optional[ClientSession] = None
+
+    def create_app(self) -> web.Application:
+        """Собрать aiohttp-приложение заглушки."""
+
+        app = web.Application()
+        app.router.add_post(f"{API_PREFIX}/invoice_create.ashx", self.invoice_create)
+        app.router.add_post(f"{API_PREFIX}/withdrawal_create.ashx", self.withdrawal_create)
+        app.router.add_post(f"{API_PREFIX}/invoice_status.ashx", self.invoice_status)
+        app.router.add_post(f"{API_PREFIX}/withdrawal_status.ashx", self.withdrawal_status)
+        app.router.add_post("/webhook", self.webhook)
+        app.router.add_get("/stats", self.get_stats)
+        app.router.add_post("/v1/traces", self.collect_traces)
+        app.router.add_get("/traces", self.get_traces)
+        app.on_cleanup.append(self._close_session)
+        return app
+
+    @staticmethod
+    def _error(code: int, message: str, status: int = 200) -> web.Response:
+        return web.json_response({"Success": False, "Error": {"Code": code, "Message": message}}, status=status)
+
+    async def _precheck(self, request: web.Request, endpoint: str, required,
+                        check_amount: bool = True) -> Optional[web.Response]:
+        """Общие проверки запроса: авторизация, лимит частоты, обязательные поля, задержка."""
+
+        self.stats[f"{endpoint}_requests"] += 1
+        if "traceparent" in request.headers:
+            self.stats[f"{endpoint}_traced"] += 1
+        form = await request.post()
+        request["form"] = form
+
+        if not request.headers.get("Authorization"):
+            self.stats[f"{endpoint}_unauthorized"] += 1
+            return self._error(401, "Authorization header is required", status=401)
+
+        shop_id = form.get("shop_id", "")
+        if self.rate_limit and not self._buckets[shop_id].try_take():
+            self.stats[f"{endpoint}_rate_limited"] += 1
+            return self._error(429, "Too many requests", status=429)
+
+        await asyncio.sleep(self.latency.sample())
+
+        missing = [field for field in required if not form.get(field)]
+        if missing:
+            self.stats[f"{endpoint}_invalid"] += 1
+            return self._error(400, f"Missing fields: {', '.join(missing)}")
+
+        if check_amount:
+            try:
+                amount = float(form["amount"])
+            except ValueError:
+                amount = 0.0
+            if amount <= 0:
+                self.stats[f"{endpoint}_invalid"] += 1
+                return self._error(400, "Invalid amount")
+
+        if self.rng.random() < self.error_rate:
+            self.stats[f"{endpoint}_failed"] += 1
+            return self._error(500, "Internal provider error")
+
+        return None
+
+    async def invoice_create(self, request: web.Request) -> web.Response:
+        error = await self._precheck(request, "invoice", ("shop_id", "order_id", "amount"))
+        if error is not None:
+            return error
+
+        form = request["form"]
+        invoice_id = next(self._ids)
+        self.stats["invoice_created"] += 1
+        self._track("invoice", form, "paid", "expired")
+        return web.json_response(
+            {
+                "Success": True,
+                "Data": {
+                    "invoice_id": invoice_id,
+                    "order_id": form.get("order_id"),
+                    "client_id": form.get("client_id"),
+                    "amount": form.get("amount"),
+                    "currency": "UAH",
+                    "status": "pending",
+                    "pay_url": f"{self.public_url}/pay/{invoice_id}",
+                },
+            }
+        )
+
+    async def withdrawal_create(self, request: web.Request) -> web.Response:
+        error = await self._precheck(request, "withdrawal", ("shop_id", "order_id", "ibanAccount", "amount"))
+        if error is not None:
+            return error
+
+        form = request["form"]
+        withdrawal_id = next(self._ids)
+        self.stats["withdrawal_created"] += 1
+        self._track("withdrawal", form, "success", "failed")
+        return web.json_response(
+            {
+                "Success": True,
+                "Data": {
+                    "withdrawal_id": withdrawal_id,
+                    "order_id": form.get("order_id"),
+                    "amount": form.get("amount"),
+                    "currency": "UAH",
+                    "status": "pending",
+                },
+            }
+        )
+
+    def _track(self, kind: str, form, paid: str, unpaid: str) -> None:
+        final = paid if self.rng.random() < self.paid_rate else unpaid
+        key = (kind, form.get("shop_id", ""), form.get("order_id", ""))
+        delay = self.settle.sample()
+        self._orders[key] = (time.monotonic() + delay, final)
+        if self.callback_url:
+            task = asyncio.ensure_future(self._send_callback(delay, key, final))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+
+    async def _send_callback(self, delay: float, key: Tuple[str, str, str], status: str) -> None:
+        await asyncio.sleep(delay)
+        kind, shop_id, order_id = key
+        body = json.dumps({
+            "event_id": f"evt-{next(self._events)}", "type": kind, "shop_id": shop_id,
+            "order_id": order_id, "status": status,
+        }).encode()
+        signature = hmac.new(self.callback_secret.encode(), body, hashlib.sha256).hexdigest()
+        if self._session is None:
+            self._session = ClientSession()
+        try:
+            async with self._session.post(self.callback_url, data=body, headers={
+                "Content-Type": "application/json", "X-Signature": signature,
+            }) as response:
+                self.stats[f"callback_{response.status}"] += 1
+        except Exception as exc:
+            self.stats["callback_failed"] += 1
+            logger.warning("Callback не доставлен: %s", exc)
+
+    async def _close_session(self, app: web.Application) -> None:
+        for task in list(self._callbacks):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    async def _statuses(self, request: web.Request, kind: str) -> web.Response:
+        error = await self._precheck(request, f"{kind}_status", ("shop_id", "order_ids"), check_amount=False)
+        if error is not None:
+            return error
+
+        form = request["form"]
+        now = time.monotonic()
+        data = []
+        for order_id in form["order_ids"].split(","):
+            tracked = self._orders.get((kind, form["shop_id"], order_id))
+            if tracked is None:
+                status = "not_found"
+            else:
+                status = tracked[1] if now >= tracked[0] else "pending"
+            data.append({"order_id": order_id, "status": status})
+        self.stats[f"{kind}_status_orders"] += len(data)
+        return web.json_response({"Success": True, "Data": data})
+
+    async def invoice_status(self, request: web.Request) -> web.Response:
+        return await self._statuses(request, "invoice")
+
+    async def withdrawal_status(self, request: web.Request) -> web.Response:
+        return await self._statuses(request, "withdrawal")
+
+    async def webhook(self, request: web.Request) -> web.Response:
+        self.stats["webhook_requests"] += 1
+        if "traceparent" in request.headers:
+            self.stats["webhook_traced"] += 1
+        payload = await request.json()
+        await asyncio.sleep(self.webhook_latency.sample())
+        if self.rng.random() < self.webhook_error_rate:
+            self.stats["webhook_failed"] += 1
+            return web.Response(status=500)
+        self.webhooks.append(payload)
+        self.stats[f"webhook_{payload.get('event_type')}"] += 1
+        return web.Response(text="OK")
+
+    async def collect_traces(self, request: web.Request) -> web.Response:
+        """Приём спанов в формате OTLP/HTTP JSON."""
+
+        payload = await request.json()
+        for resource_spans in payload.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    self.spans.append(span)
+                    self.stats["trace_spans"] += 1
+        return web.json_response({})
+
+    async def get_traces(self, request: web.Request) -> web.Response:
+        """Принятые спаны, сгруппированные по trace_id, с длительностями в мс."""
+
+        traces: Dict[str, list] = defaultdict(list)
+        for span in self.spans:
+            traces[span["traceId"]].append(
+                {
+                    "name": span["name"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "duration_ms": (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6,
+                    "error": span.get("status", {}).get("message"),
+                }
+            )
+        return web.json_response(traces)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+        """Запустить заглушку в текущем цикле событий (для бенчмарков и нагрузочных тестов)."""
+
+        runner = web.AppRunner(self.create_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Заглушка Konvert2pay слушает http://%s:%s", host, port)
+        return runner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальная заглушка API Konvert2pay")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="fixed:0", help="задержка API, например lognormal:0.08:0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой (0..1)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="запросов в секунду на shop_id, 0 — без лимита")
+    parser.add_argument("--webhook-latency", default="fixed:0")
+    parser.add_argument("--webhook-error-rate", type=float, default=0.0)
+    parser.add_argument("--settle", default="exp:60", help="через сколько секунд заказ получает конечный статус")
+    parser.add_argument("--paid-rate", type=float, default=0.8, help="доля оплаченных заказов (0..1)")
+    parser.add_argument("--callback-url", default=None, help="куда отправлять callback о статусах")
+    parser.add_argument("--callback-secret", default="", help="секрет подписи callback")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeKonvert2pay(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        webhook_latency=args.webhook_latency,
+        webhook_error_rate=args.webhook_error_rate,
+        public_url=f"http://{args.host}:{args.port}",
+        seed=args.seed,
+        settle=args.settle,
+        paid_rate=args.paid_rate,
+        callback_url=args.callback_url,
+        callback_secret=args.callback_secret,
+    )
+    web.run_app(fake.create_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
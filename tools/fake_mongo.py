@@ -0,0 +1,681 @@
+"""Упрощённая in-memory реализация MongoClient для нагрузочных прогонов и бенчмарков.
+
+Поддерживается подмножество API pymongo, которое использует бот: поиск по
+равенству и операторам сравнения, ``$or``/``$and``, операторы обновления
+``$set``/``$inc``/``$setOnInsert``/``$unset``, upsert, агрегации с ``$match``,
+``$lookup``, ``$unwind``, ``$sort``, ``$skip``, ``$limit``, ``$project`` и
+``$group`` (только ``$sum``), а также хранение описаний индексов. Поиск по
+равенству или ``$in`` строкам и числам в поле, которое является ведущим полем индекса,
+выполняется через хеш-таблицу значений (перестраивается при первом чтении
+после записи), остальные запросы — полным перебором. Индексы учитываются
+и в ответе на ``explain``: план показывает IXSCAN, если ведущее поле индекса
+совпадает с полем равенства в фильтре, иначе COLLSCAN; сортировка, не
+покрытая индексом, отображается стадией SORT.
+"""
+
+from __future__ import annotations
+
+import copy
+import re
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+_MISSING = object()
+# Типы значений, по которым работает поиск через индекс
+_LOOKUP_TYPES = (str, int, float)
+
+
+def _get_path(document: Mapping[str, Any], path: str) -> Any:
+    if "." not in path:
+        # Поле верхнего уровня: документы коллекции всегда dict
+        return document.get(path, _MISSING)
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, Mapping) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_path(document: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    target = document
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    target[parts[-1]] = value
+
+
+def _unset_path(document: Dict[str, Any], path: str) -> None:
+    parts = path.split(".")
+    target: Any = document
+    for part in parts[:-1]:
+        target = target.get(part)
+        if not isinstance(target, dict):
+            return
+    target.pop(parts[-1], None)
+
+
+def _type_rank(value: Any) -> int:
+    """Порядок типов при сортировке (упрощённый порядок BSON)."""
+
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    rank = _type_rank(value)
+    return (rank, None if rank == 1 else value)
+
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    if operator == "$eq":
+        return _equals(value, operand)
+    if operator == "$ne":
+        return not _equals(value, operand)
+    if operator == "$in":
+        return any(_equals(value, item) for item in operand)
+    if operator == "$nin":
+        return not any(_equals(value, item) for item in operand)
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator == "$regex":
+        return isinstance(value, str) and re.search(operand, value) is not None
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        if value is _MISSING or value is None or _type_rank(value) != _type_rank(operand):
+            return False
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        return value <= operand
+    if operator == "$options":
+        return True
+    raise OperationFailure(f"Оператор {operator} не поддерживается FakeMongoClient")
+
+
+def _equals(value: Any, operand: Any) -> bool:
+    if value is _MISSING:
+        return operand is None
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+
+def matches(document: Mapping[str, Any], query: Optional[Mapping[str, Any]]) -> bool:
+    """Проверить соответствие документа фильтру."""
+
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, sub) for sub in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(document, sub) for sub in condition):
+                return False
+            continue
+        value = _get_path(document, key)
+        if isinstance(condition, Mapping) and condition and next(iter(condition)).startswith("$"):
+            if "$regex" in condition and "i" in condition.get("$options", ""):
+                condition = dict(condition, **{"$regex": f"(?i){condition['$regex']}"})
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif isinstance(condition, re.Pattern):
+            if not (isinstance(value, str) and condition.search(value)):
+                return False
+        elif not _equals(value, condition):
+            return False
+    return True
+
+
+def _project(document: Mapping[str, Any], projection: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return dict(document)
+    include = {key for key, flag in projection.items() if flag and key != "_id"}
+    if include:
+        result = {}
+        for key in include:
+            value = _get_path(document, key)
+            if value is not _MISSING:
+                _set_path(result, key, value)
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    result = dict(document)
+    for key, flag in projection.items():
+        if not flag:
+            _unset_path(result, key)
+    return result
+
+
+def _expression(document: Mapping[str, Any], expression: Any) -> Any:
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get_path(document, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, Mapping):
+        return {key: _expression(document, value) for key, value in expression.items()}
+    return expression
+
+
+def _group(documents: Iterable[Dict[str, Any]], spec: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """Стадия ``$group`` с аккумулятором ``$sum``."""
+
+    groups: Dict[str, Dict[str, Any]] = {}
+    for document in documents:
+        key = _expression(document, spec["_id"])
+        group = groups.setdefault(repr(key), {"_id": key})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (operator, operand), = accumulator.items()
+            if operator != "$sum":
+                raise OperationFailure(f"Аккумулятор {operator} не поддерживается FakeMongoClient")
+            value = _expression(document, operand)
+            group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+    return list(groups.values())
+
+
+def _sort_documents(documents: List[Dict[str, Any]], spec: Sequence[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    for key, direction in reversed(list(spec)):
+        documents.sort(key=lambda doc: _sort_key(_get_path(doc, key)), reverse=direction < 0)
+    return documents
+
+
+def _normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, Mapping):
+        return list(key_or_list.items())
+    return [tuple(item) for item in key_or_list]
+
+
+class _Result:
+    """Результат операции записи, совместимый по атрибутам с pymongo."""
+
+    def __init__(self, **fields: Any):
+        self.acknowledged = True
+        self.__dict__.update(fields)
+
+
+class FakeCursor:
+    """Курсор с поддержкой sort/skip/limit и итерации."""
+
+    def __init__(self, documents: List[Dict[str, Any]], projection: Optional[Mapping[str, Any]] = None):
+        self._documents = documents
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._batch_size = 0
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "FakeCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "FakeCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "FakeCursor":
+        self._batch_size = size
+        return self
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        documents = self._documents
+        if self._sort:
+            documents = _sort_documents(list(documents), self._sort)
+        stop = self._skip + self._limit if self._limit else None
+        for document in islice(documents, self._skip, stop):
+            yield _project(document, self._projection)
+
+    def close(self) -> None:
+        self._documents = []
+
+
+class FakeCollection:
+    """In-memory коллекция MongoDB."""
+
+    def __init__(self, name: str, database: "FakeDatabase"):
+        self.name = name
+        self.database = database
+        self._documents: Dict[Any, Dict[str, Any]] = {}
+        self._indexes: Dict[str, Dict[str, Any]] = {"_id_": {"v": 2, "key": {"_id": 1}, "name": "_id_"}}
+        # Таблицы "значение -> документы" для ведущих полей индексов; сбрасываются при записи
+        self._lookups: Dict[str, Optional[Dict[Any, List[Dict[str, Any]]]]] = {}
+
+    def _changed(self) -> None:
+        self._lookups.clear()
+
+    # --- чтение ---------------------------------------------------------
+
+    def _lookup_table(self, field: str) -> Optional[Dict[Any, List[Dict[str, Any]]]]:
+        """Таблица значений поля; None, если в поле есть значения, не поддерживаемые поиском."""
+
+        if field in self._lookups:
+            return self._lookups[field]
+        table: Optional[Dict[Any, List[Dict[str, Any]]]] = {}
+        for document in self._documents.values():
+            value = _get_path(document, field)
+            values = value if isinstance(value, list) else (value,)
+            if not all(item is _MISSING or item is None or isinstance(item, _LOOKUP_TYPES) for item in values):
+                table = None
+                break
+            for item in values:
+                if isinstance(item, _LOOKUP_TYPES) and not isinstance(item, bool):
+                    table.setdefault(item, []).append(document)
+        self._lookups[field] = table
+        return table
+
+    @staticmethod
+    def _lookup_values(value: Any) -> Optional[List[Any]]:
+        """Значения для поиска по индексу: равенство или ``$in`` строкам и числам."""
+
+        if isinstance(value, Mapping) and set(value) == {"$in"}:
+            values = list(value["$in"])
+        else:
+            values = [value]
+        if all(isinstance(item, _LOOKUP_TYPES) and not isinstance(item, bool) for item in values):
+            return values
+        return None
+
+    def _indexed_candidates(self, query: Mapping[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Документы-кандидаты по индексу для равенства или ``$in`` строкам и числам."""
+
+        leading = {next(iter(index["key"])) for index in self._indexes.values()}
+        for field, value in query.items():
+            values = self._lookup_values(value) if field in leading else None
+            if values is not None:
+                table = self._lookup_table(field)
+                if table is not None:
+                    if len(values) == 1:
+                        return table.get(values[0], [])
+                    found = {id(document): document for item in values for document in table.get(item, [])}
+                    return list(found.values())
+        return None
+
+    def _iter_matching(self, query: Optional[Mapping[str, Any]]) -> Iterator[Dict[str, Any]]:
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], Mapping):
+            document = self._documents.get(query["_id"])
+            if document is not None:
+                yield document
+            return
+        candidates = self._indexed_candidates(query) if query else None
+        for document in self._documents.values() if candidates is None else list(candidates):
+            if matches(document, query):
+                yield document
+
+    def find_one(self, filter: Optional[Mapping[str, Any]] = None, projection: Optional[Mapping[str, Any]] = None, **kwargs: Any):
+        sort = kwargs.get("sort")
+        if sort:
+            documents = _sort_documents(list(self._iter_matching(filter)), _normalize_sort(sort))
+            document = documents[0] if documents else None
+        else:
+            document = next(self._iter_matching(filter), None)
+        return _project(document, projection) if document is not None else None
+
+    def find(self, filter: Optional[Mapping[str, Any]] = None, projection: Optional[Mapping[str, Any]] = None, **kwargs: Any) -> FakeCursor:
+        cursor = FakeCursor(list(self._iter_matching(filter)), projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def count_documents(self, filter: Optional[Mapping[str, Any]] = None, **kwargs: Any) -> int:
+        return sum(1 for _ in self._iter_matching(filter))
+
+    def estimated_document_count(self) -> int:
+        return len(self._documents)
+
+    def aggregate(self, pipeline: Sequence[Mapping[str, Any]], **kwargs: Any) -> FakeCursor:
+        documents: Iterable[Dict[str, Any]] = self._documents.values()
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                documents = [doc for doc in documents if matches(doc, spec)]
+            elif operator == "$lookup":
+                foreign = self.database[spec["from"]]
+                joined = []
+                for doc in documents:
+                    local_value = _get_path(doc, spec["localField"])
+                    matches_ = [
+                        dict(other) for other in foreign._iter_matching({spec["foreignField"]: local_value})
+                    ] if local_value is not _MISSING else []
+                    joined.append(dict(doc, **{spec["as"]: matches_}))
+                documents = joined
+            elif operator == "$unwind":
+                path = spec if isinstance(spec, str) else spec["path"]
+                preserve = isinstance(spec, Mapping) and spec.get("preserveNullAndEmptyArrays", False)
+                field = path.lstrip("$")
+                unwound = []
+                for doc in documents:
+                    values = doc.get(field)
+                    if isinstance(values, list) and values:
+                        unwound.extend(dict(doc, **{field: value}) for value in values)
+                    elif preserve:
+                        unwound.append({key: value for key, value in doc.items() if key != field})
+                documents = unwound
+            elif operator == "$sort":
+                documents = _sort_documents(list(documents), list(spec.items()))
+            elif operator == "$skip":
+                documents = list(documents)[spec:]
+            elif operator == "$limit":
+                documents = list(documents)[:spec]
+            elif operator == "$project":
+                documents = [_project(doc, spec) for doc in documents]
+            elif operator == "$group":
+                documents = _group(documents, spec)
+            else:
+                raise OperationFailure(f"Стадия {operator} не поддерживается FakeMongoClient")
+        return FakeCursor(list(documents))
+
+    # --- запись ---------------------------------------------------------
+
+    def insert_one(self, document: Dict[str, Any], **kwargs: Any) -> _Result:
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} _id: {document['_id']!r}")
+        self._documents[document["_id"]] = copy.deepcopy(document)
+        self._changed()
+        return _Result(inserted_id=document["_id"])
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs: Any) -> _Result:
+        inserted_ids = [self.insert_one(document).inserted_id for document in documents]
+        return _Result(inserted_ids=inserted_ids)
+
+    @staticmethod
+    def _apply_update(document: Dict[str, Any], update: Mapping[str, Any], inserting: bool) -> None:
+        for operator, fields in update.items():
+            if operator == "$set":
+                for path, value in fields.items():
+                    _set_path(document, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    for path, value in fields.items():
+                        _set_path(document, path, copy.deepcopy(value))
+            elif operator == "$inc":
+                for path, value in fields.items():
+                    current = _get_path(document, path)
+                    _set_path(document, path, (0 if current is _MISSING else current) + value)
+            elif operator == "$max":
+                for path, value in fields.items():
+                    current = _get_path(document, path)
+                    if current is _MISSING or value > current:
+                        _set_path(document, path, value)
+            elif operator == "$min":
+                for path, value in fields.items():
+                    current = _get_path(document, path)
+                    if current is _MISSING or value < current:
+                        _set_path(document, path, value)
+            elif operator == "$unset":
+                for path in fields:
+                    _unset_path(document, path)
+            else:
+                raise OperationFailure(f"Оператор обновления {operator} не поддерживается FakeMongoClient")
+
+    def _upsert(self, filter: Mapping[str, Any], update: Mapping[str, Any]) -> Dict[str, Any]:
+        document = {
+            key: value for key, value in filter.items()
+            if not key.startswith("$") and not (isinstance(value, Mapping) and any(k.startswith("$") for k in value))
+        }
+        self._apply_update(document, update, inserting=True)
+        self.insert_one(document)
+        return self._documents[document["_id"]]
+
+    def update_one(self, filter: Mapping[str, Any], update: Mapping[str, Any], upsert: bool = False, **kwargs: Any) -> _Result:
+        document = next(self._iter_matching(filter), None)
+        if document is None:
+            if upsert:
+                created = self._upsert(filter, update)
+                return _Result(matched_count=0, modified_count=0, upserted_id=created["_id"])
+            return _Result(matched_count=0, modified_count=0, upserted_id=None)
+        self._apply_update(document, update, inserting=False)
+        self._changed()
+        return _Result(matched_count=1, modified_count=1, upserted_id=None)
+
+    def update_many(self, filter: Mapping[str, Any], update: Mapping[str, Any], upsert: bool = False, **kwargs: Any) -> _Result:
+        documents = list(self._iter_matching(filter))
+        for document in documents:
+            self._apply_update(document, update, inserting=False)
+        self._changed()
+        if not documents and upsert:
+            created = self._upsert(filter, update)
+            return _Result(matched_count=0, modified_count=0, upserted_id=created["_id"])
+        return _Result(matched_count=len(documents), modified_count=len(documents), upserted_id=None)
+
+    def find_one_and_update(
+        self,
+        filter: Mapping[str, Any],
+        update: Mapping[str, Any],
+        projection: Optional[Mapping[str, Any]] = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        **kwargs: Any,
+    ):
+        document = next(self._iter_matching(filter), None)
+        if document is None:
+            if not upsert:
+                return None
+            created = self._upsert(filter, update)
+            return _project(created, projection) if return_document == ReturnDocument.AFTER else None
+        before = copy.deepcopy(document)
+        self._apply_update(document, update, inserting=False)
+        self._changed()
+        return _project(document if return_document == ReturnDocument.AFTER else before, projection)
+
+    def delete_one(self, filter: Mapping[str, Any], **kwargs: Any) -> _Result:
+        document = next(self._iter_matching(filter), None)
+        if document is None:
+            return _Result(deleted_count=0)
+        del self._documents[document["_id"]]
+        self._changed()
+        return _Result(deleted_count=1)
+
+    def delete_many(self, filter: Mapping[str, Any], **kwargs: Any) -> _Result:
+        keys = [document["_id"] for document in self._iter_matching(filter)]
+        for key in keys:
+            del self._documents[key]
+        self._changed()
+        return _Result(deleted_count=len(keys))
+
+    def bulk_write(self, requests: Sequence[Any], ordered: bool = True, **kwargs: Any) -> _Result:
+        """Выполнить UpdateOne/InsertOne/DeleteOne из pymongo.operations."""
+
+        counts = {"inserted_count": 0, "matched_count": 0, "modified_count": 0, "deleted_count": 0, "upserted_count": 0}
+        for request in requests:
+            kind = type(request).__name__
+            doc = request._doc
+            if kind == "InsertOne":
+                self.insert_one(doc)
+                counts["inserted_count"] += 1
+            elif kind in ("UpdateOne", "UpdateMany"):
+                method = self.update_one if kind == "UpdateOne" else self.update_many
+                result = method(request._filter, doc, upsert=bool(request._upsert))
+                counts["matched_count"] += result.matched_count
+                counts["modified_count"] += result.modified_count
+                counts["upserted_count"] += int(result.upserted_id is not None)
+            elif kind == "DeleteOne":
+                counts["deleted_count"] += self.delete_one(request._filter).deleted_count
+            else:
+                raise OperationFailure(f"Операция {kind} не поддерживается FakeMongoClient")
+        return _Result(**counts)
+
+    # --- планы запросов -------------------------------------------------
+
+    def _index_scan(self, fields: Iterable[str], sort: Sequence[Tuple[str, int]]) -> Optional[Dict[str, Any]]:
+        """Индекс, ведущее поле которого — поле равенства или первое поле сортировки."""
+
+        fields = set(fields)
+        for name, index in self._indexes.items():
+            keys = list(index["key"].items())
+            if keys[0][0] in fields:
+                return {"stage": "IXSCAN", "indexName": name, "keyPattern": dict(keys)}
+        for name, index in self._indexes.items():
+            keys = list(index["key"].items())
+            if sort and self._index_covers_sort(keys, sort):
+                return {"stage": "IXSCAN", "indexName": name, "keyPattern": dict(keys)}
+        return None
+
+    @staticmethod
+    def _index_covers_sort(keys: Sequence[Tuple[str, int]], sort: Sequence[Tuple[str, int]]) -> bool:
+        if len(sort) > len(keys):
+            return False
+        prefix = keys[:len(sort)]
+        same = all(k == s_k and d == s_d for (k, d), (s_k, s_d) in zip(prefix, sort))
+        reverse = all(k == s_k and d == -s_d for (k, d), (s_k, s_d) in zip(prefix, sort))
+        return same or reverse
+
+    def _plan_filter(self, query: Optional[Mapping[str, Any]], sort: Sequence[Tuple[str, int]]) -> Dict[str, Any]:
+        query = query or {}
+        if "$or" in query:
+            return {"stage": "OR", "inputStages": [self._plan_filter(branch, ()) for branch in query["$or"]]}
+        equality = [key for key, value in query.items() if not key.startswith("$")
+                    and (not (isinstance(value, Mapping) and any(op.startswith("$") for op in value))
+                         or self._lookup_values(value) is not None)]
+        scan = self._index_scan(equality, sort)
+        if scan is None:
+            return {"stage": "COLLSCAN", "filter": query}
+        return {"stage": "FETCH", "inputStage": scan}
+
+    def explain_plan(self, query: Optional[Mapping[str, Any]] = None, sort: Optional[Mapping[str, int]] = None) -> Dict[str, Any]:
+        """Упрощённый план в формате ``queryPlanner`` команды explain."""
+
+        sort_spec = list((sort or {}).items())
+        plan = self._plan_filter(query, sort_spec)
+        if sort_spec:
+            scans = [plan.get("inputStage", plan)]
+            covered = any(
+                scan.get("stage") == "IXSCAN" and self._index_covers_sort(list(scan["keyPattern"].items()), sort_spec)
+                for scan in scans
+            )
+            if not covered:
+                plan = {"stage": "SORT", "sortPattern": dict(sort_spec), "inputStage": plan}
+        return {"queryPlanner": {"namespace": f"{self.database.name}.{self.name}", "winningPlan": plan}, "ok": 1.0}
+
+    # --- индексы --------------------------------------------------------
+
+    def list_indexes(self) -> Iterator[Dict[str, Any]]:
+        return iter([dict(index) for index in self._indexes.values()])
+
+    def index_information(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {"key": list(index["key"].items())} for name, index in self._indexes.items()}
+
+    def create_index(self, keys: Any, **kwargs: Any) -> str:
+        key_list = _normalize_sort(keys)
+        name = kwargs.pop("name", None) or "_".join(f"{key}_{direction}" for key, direction in key_list)
+        self._indexes[name] = {"v": 2, "key": dict(key_list), "name": name, **kwargs}
+        return name
+
+    def create_indexes(self, indexes: Sequence[Any], **kwargs: Any) -> List[str]:
+        names = []
+        for model in indexes:
+            document = dict(model.document)
+            keys = list(document.pop("key").items())
+            names.append(self.create_index(keys, **document))
+        return names
+
+    def drop_index(self, name: str) -> None:
+        self._indexes.pop(name, None)
+
+    def drop(self) -> None:
+        self._documents.clear()
+        self._changed()
+
+
+class FakeDatabase:
+    """In-memory база данных."""
+
+    def __init__(self, client: "FakeMongoClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = FakeCollection(name, self)
+        return collection
+
+    def get_collection(self, name: str) -> FakeCollection:
+        return self[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    def command(self, command: Any, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        if command == "ping":
+            return {"ok": 1.0}
+        if command == "explain" and args:
+            return self._explain(args[0])
+        raise OperationFailure(f"Команда {command!r} не поддерживается FakeMongoClient")
+
+
+    def _explain(self, command: Mapping[str, Any]) -> Dict[str, Any]:
+        if "find" in command:
+            return self[command["find"]].explain_plan(command.get("filter"), command.get("sort"))
+        if "aggregate" in command:
+            # Ведущие $match и $sort выполняются запросом к коллекции, остальное — в конвейере
+            query: Dict[str, Any] = {}
+            sort: Optional[Mapping[str, int]] = None
+            pushed = 0
+            for stage in command["pipeline"]:
+                (operator, spec), = stage.items()
+                if operator == "$match" and sort is None:
+                    query.update(spec)
+                elif operator == "$sort" and sort is None:
+                    sort = spec
+                else:
+                    break
+                pushed += 1
+            explain = self[command["aggregate"]].explain_plan(query, sort)
+            explain["stages"] = [{"$cursor": {"queryPlanner": explain.pop("queryPlanner")}}] + [
+                {operator: spec} for stage in command["pipeline"][pushed:] for operator, spec in stage.items()
+            ]
+            return explain
+        raise OperationFailure(f"explain для {command!r} не поддерживается FakeMongoClient")
+
+
+class FakeMongoClient:
+    """Замена pymongo.MongoClient, хранящая данные в памяти процесса."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        self._databases: Dict[str, FakeDatabase] = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = FakeDatabase(self, name)
+        return database
+
+    def get_database(self, name: str) -> FakeDatabase:
+        return self[name]
+
+    def close(self) -> None:
+        pass
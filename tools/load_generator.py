@@ -0,0 +1,349 @@
+"""Генератор синтетической нагрузки на бота для оценки пропускной способности.
+
+Строит объекты ``Update``/``CallbackQuery`` для полных диалогов создания
+инвойсов и выплат и передаёт их в ``MerchantBot.handle_message`` и
+``MerchantBot.button_callback``. Вызовы Telegram Bot API перехватывает
+заглушка, API Konvert2pay и приёмник webhook обслуживает
+``tools.fake_konvert2pay``, а MongoDB по умолчанию подменяется in-memory
+реализацией ``tools.fake_mongo``.
+
+Пример::
+
+    python -m tools.load_generator --merchants 50 --rate 20 --duration 30 --payout-share 0.3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+logger = logging.getLogger(__name__)
+
+Step = Tuple[str, str, str]  # (имя шага, тип: "msg" | "cb", текст или callback_data)
+
+
+class RecordingBot:
+    """Заглушка telegram.Bot, записывающая исходящие вызовы Bot API."""
+
+    defaults = None
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def method(*args, **kwargs):
+            self.calls[name] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return True
+
+        return method
+
+
+class UpdateFactory:
+    """Фабрика синтетических обновлений Telegram для одного виртуального мерчанта."""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, bot: RecordingBot, user_id: int, username: str):
+        self.bot = bot
+        self.user = User(id=user_id, first_name="Load", is_bot=False, username=username)
+        self.chat = Chat(id=user_id, type=Chat.PRIVATE)
+        self.last_message: Optional[Message] = None
+
+    def _message(self, text: str) -> Message:
+        message = Message(
+            message_id=next(self._update_ids),
+            date=datetime.now(timezone.utc),
+            chat=self.chat,
+            from_user=self.user,
+            text=text,
+        )
+        message.set_bot(self.bot)
+        return message
+
+    def message(self, text: str) -> Update:
+        self.last_message = self._message(text)
+        return Update(update_id=next(self._update_ids), message=self.last_message)
+
+    def callback(self, data: str) -> Update:
+        query = CallbackQuery(
+            id=str(next(self._update_ids)),
+            from_user=self.user,
+            chat_instance=str(self.chat.id),
+            data=data,
+            message=self.last_message or self._message("."),
+        )
+        query.set_bot(self.bot)
+        return Update(update_id=next(self._update_ids), callback_query=query)
+
+
+def invoice_conversation(rng: random.Random, n: int) -> List[Step]:
+    """Шаги полного диалога создания инвойса."""
+
+    return [
+        ("invoice.menu", "msg", "🎰 Создать инвойс"),
+        ("invoice.method", "cb", "invoice_method_oneclick"),
+        ("invoice.order_id", "msg", f"INV-{n}"),
+        ("invoice.client_id", "msg", f"client-{rng.randint(1, 10_000)}"),
+        ("invoice.amount", "msg", f"{rng.randint(100, 50_000)}.{rng.randint(0, 99):02d}"),
+        ("invoice.confirm", "cb", "confirm_invoice"),
+    ]
+
+
+def payout_conversation(rng: random.Random, n: int) -> List[Step]:
+    """Шаги полного диалога создания выплаты."""
+
+    return [
+        ("payout.menu", "msg", "💎 Создать выплату"),
+        ("payout.method", "cb", "payout_method_iban"),
+        ("payout.order_id", "msg", f"PAY-{n}"),
+        ("payout.client_id", "msg", f"client-{rng.randint(1, 10_000)}"),
+        ("payout.iban", "msg", "UA213223130000026007233566001"),
+        ("payout.inn", "msg", "3215708815"),
+        ("payout.surname", "msg", "Шевченко"),
+        ("payout.name", "msg", "Тарас"),
+        ("payout.middlename", "msg", "Григорович"),
+        ("payout.purpose", "cb", "purpose_perekaz"),
+        ("payout.amount", "msg", f"{rng.randint(100, 50_000)}.{rng.randint(0, 99):02d}"),
+        ("payout.confirm", "cb", "confirm_payout"),
+    ]
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class LoadGenerator:
+    """Подача диалогов в обработчики бота с пуассоновским потоком прибытия."""
+
+    def __init__(self, merchant_bot_module, bot: RecordingBot, merchants: int, payout_share: float,
+                 think_time: float, seed: Optional[int] = None):
+        self.app = merchant_bot_module
+        self.bot = bot
+        self.rng = random.Random(seed)
+        self.payout_share = payout_share
+        self.think_time = think_time
+        self.step_latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.completed: Counter = Counter()
+        self.updates = 0
+        # config читает переменные окружения при импорте, поэтому модули бота
+        # импортируются только после _load_bot_module
+        from loop_monitor import LoopMonitor
+
+        self.loop_monitor = LoopMonitor(interval=0.01, keep_samples=True)
+        self._conversations = itertools.count(1)
+        self._merchants = self._seed_merchants(merchants)
+
+    def _seed_merchants(self, count: int):
+        """Зарегистрировать виртуальных мерчантов в базе бота."""
+
+        merchants = []
+        user_manager = self.app.get_bot().user_manager
+        for index in range(count):
+            user_id = 900_000_000 + index
+            username = f"load_merchant_{index}"
+            user_manager.grant_merchant_access(username, f"shop-{index}", f"key-{index}", f"LOAD{index}")
+            user_manager.add_user(user_id, username)
+            merchants.append(
+                SimpleNamespace(
+                    factory=UpdateFactory(self.bot, user_id, username),
+                    context=SimpleNamespace(user_data={}, bot=self.bot),
+                    lock=asyncio.Lock(),
+                )
+            )
+        return merchants
+
+    async def _run_conversation(self) -> None:
+        n = next(self._conversations)
+        kind = "payout" if self.rng.random() < self.payout_share else "invoice"
+        steps = payout_conversation(self.rng, n) if kind == "payout" else invoice_conversation(self.rng, n)
+        merchant = self.rng.choice(self._merchants)
+
+        async with merchant.lock:
+            await self.app.handle_message(merchant.factory.message("◀️ Главное меню"), merchant.context)
+            for name, step_type, payload in steps:
+                if self.think_time:
+                    await asyncio.sleep(self.rng.expovariate(1.0 / self.think_time))
+                if step_type == "msg":
+                    update = merchant.factory.message(payload)
+                    handler = self.app.handle_message
+                else:
+                    update = merchant.factory.callback(payload)
+                    handler = self.app.button_callback
+                started = time.perf_counter()
+                try:
+                    await handler(update, merchant.context)
+                except Exception as exc:
+                    self.errors[f"{name}: {type(exc).__name__}"] += 1
+                    return
+                finally:
+                    self.updates += 1
+                    self.step_latency[name].append(time.perf_counter() - started)
+        self.completed[kind] += 1
+
+    async def run(self, rate: float, duration: float) -> float:
+        """Подавать диалоги со средней частотой ``rate`` в секунду в течение ``duration`` секунд."""
+
+        self.loop_monitor.start()
+        tasks = []
+        started = time.perf_counter()
+        deadline = started + duration
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(self._run_conversation()))
+            await asyncio.sleep(self.rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        await self.loop_monitor.stop()
+        return elapsed
+
+    def report(self, elapsed: float) -> Dict[str, object]:
+        conversations = sum(self.completed.values())
+        lag = self.loop_monitor.samples
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "conversations": dict(self.completed),
+            "conversations_per_s": round(conversations / elapsed, 2) if elapsed else 0.0,
+            "updates": self.updates,
+            "updates_per_s": round(self.updates / elapsed, 2) if elapsed else 0.0,
+            "errors": dict(self.errors),
+            "steps_ms": {
+                name: {
+                    "count": len(values),
+                    "p50": round(percentile(values, 0.50) * 1000, 3),
+                    "p95": round(percentile(values, 0.95) * 1000, 3),
+                    "p99": round(percentile(values, 0.99) * 1000, 3),
+                    "max": round(max(values) * 1000, 3),
+                }
+                for name, values in sorted(self.step_latency.items())
+            },
+            "loop_lag_ms": {
+                "p50": round(percentile(lag, 0.50) * 1000, 3),
+                "p99": round(percentile(lag, 0.99) * 1000, 3),
+                "max": round(max(lag, default=0.0) * 1000, 3),
+            },
+            "blocking_handlers": dict(self.loop_monitor.blocked),
+            "telegram_calls": dict(self.bot.calls),
+        }
+
+
+def print_report(report: Dict[str, object]) -> None:
+    print(f"Время прогона: {report['elapsed_s']} с")
+    print(f"Диалогов завершено: {report['conversations']} ({report['conversations_per_s']}/с)")
+    print(f"Обновлений обработано: {report['updates']} ({report['updates_per_s']}/с)")
+    if report["errors"]:
+        print(f"Ошибки: {report['errors']}")
+    print(f"\n{'Шаг':<20}{'N':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}")
+    for name, stats in report["steps_ms"].items():
+        print(f"{name:<20}{stats['count']:>8}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    lag = report["loop_lag_ms"]
+    print(f"\nЛаг цикла событий, мс: p50={lag['p50']} p99={lag['p99']} max={lag['max']}")
+    if report["blocking_handlers"]:
+        print(f"Блокировки цикла событий по обработчикам: {report['blocking_handlers']}")
+    print(f"Вызовы Telegram Bot API: {report['telegram_calls']}")
+    if report.get("fake_api"):
+        print(f"Заглушка Konvert2pay: {report['fake_api']}")
+    print(f"Записей в истории заказов: {report['orders_recorded']}")
+
+
+def _load_bot_module(api_base_url: str, webhook_url: str, use_fake_mongo: bool):
+    """Импортировать MerchantBot, направив его на заглушки, и подготовить базу бота."""
+
+    os.environ["KONVERT2PAY_API_BASE_URL"] = api_base_url
+    os.environ["MERCHANT_BOT_WEBHOOK_URL"] = webhook_url
+
+    import MerchantBot
+
+    if use_fake_mongo:
+        from db_utils import DatabaseManager
+        from tools.fake_mongo import FakeMongoClient
+
+        MerchantBot.set_bot(MerchantBot.MerchantBot(DatabaseManager(client=FakeMongoClient())))
+    MerchantBot.get_bot().init_database()
+    from order_history import configure_order_history
+    from stats_rollups import configure_stats_rollups
+
+    configure_order_history(MerchantBot.get_bot().db_manager)
+    configure_stats_rollups(MerchantBot.get_bot().db_manager)
+    return MerchantBot
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, object]:
+    from tools.fake_konvert2pay import FakeKonvert2pay
+
+    base = f"http://127.0.0.1:{args.api_port}"
+    fake_api = FakeKonvert2pay(latency=args.api_latency, error_rate=args.api_error_rate, public_url=base, seed=args.seed)
+    runner = await fake_api.start(port=args.api_port)
+
+    app = _load_bot_module(f"{base}/api/v1", f"{base}/webhook", not args.real_mongo)
+    from structured_logging import setup_logging
+
+    setup_logging(args.log_level)
+
+    generator = LoadGenerator(app, RecordingBot(args.telegram_latency), args.merchants, args.payout_share,
+                              args.think_time, args.seed)
+    try:
+        # Отладочный вывод обработчиков не должен смешиваться с отчётом
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = await generator.run(args.rate, args.duration)
+    finally:
+        from shutdown import close_resources
+
+        await close_resources()
+        await runner.cleanup()
+
+    report = generator.report(elapsed)
+    report["fake_api"] = dict(fake_api.stats)
+    report["orders_recorded"] = app.get_bot().db_manager.get_collection("orders").count_documents({})
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Синтетическая нагрузка на MerchantBot")
+    parser.add_argument("--merchants", type=int, default=20, help="число виртуальных мерчантов")
+    parser.add_argument("--rate", type=float, default=10.0, help="новых диалогов в секунду")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность подачи нагрузки, с")
+    parser.add_argument("--payout-share", type=float, default=0.3, help="доля диалогов создания выплаты")
+    parser.add_argument("--think-time", type=float, default=0.0, help="средняя пауза пользователя между шагами, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка заглушки Bot API, с")
+    parser.add_argument("--api-latency", default="lognormal:0.05:0.4", help="задержка заглушки Konvert2pay")
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--real-mongo", action="store_true", help="использовать MongoDB из config.MONGO_URI")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON-файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(_main(args))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
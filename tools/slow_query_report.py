@@ -0,0 +1,94 @@
+"""Сводка журнала медленных запросов MongoDB.
+
+Группирует записи ``slow_queries.jsonl`` по коллекции, операции и форме
+запроса и отмечает формы, план которых содержит полное сканирование
+коллекции (COLLSCAN) или сортировку в памяти.
+
+Пример::
+
+    python -m tools.slow_query_report slow_queries.jsonl --flagged
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+from tools.load_generator import percentile
+
+
+def load_entries(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def build_report(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Строки отчёта, отсортированные по суммарной длительности."""
+
+    durations: Dict[Tuple[str, str, str], List[float]] = defaultdict(list)
+    plans: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for entry in entries:
+        key = (entry["collection"], entry["operation"], entry["shape"])
+        durations[key].append(entry["duration_ms"] / 1000)
+        if "plan" in entry:
+            plans[key] = entry["plan"]
+
+    rows = []
+    for (collection, operation, shape), values in durations.items():
+        plan = plans.get((collection, operation, shape), {})
+        rows.append(
+            {
+                "collection": collection,
+                "operation": operation,
+                "shape": shape,
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "max_ms": round(max(values) * 1000, 3),
+                "total_ms": round(sum(values) * 1000, 3),
+                "collscan": plan.get("collscan"),
+                "in_memory_sort": plan.get("in_memory_sort"),
+                "indexes": plan.get("indexes", []),
+            }
+        )
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    print(f"{'N':>6}{'p50 мс':>10}{'max мс':>10}  {'флаги':<18}запрос")
+    for row in rows:
+        flags = []
+        if row["collscan"]:
+            flags.append("COLLSCAN")
+        if row["in_memory_sort"]:
+            flags.append("SORT")
+        if row["collscan"] is None:
+            flags.append("нет плана")
+        print(f"{row['count']:>6}{row['p50_ms']:>10}{row['max_ms']:>10}  {','.join(flags):<18}"
+              f"{row['collection']}.{row['operation']} {row['shape']}")
+        if row["indexes"]:
+            print(f"{'':>28}индексы: {', '.join(row['indexes'])}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сводка журнала медленных запросов MongoDB")
+    parser.add_argument("path", nargs="?", default="slow_queries.jsonl")
+    parser.add_argument("--flagged", action="store_true", help="только запросы с COLLSCAN или SORT в памяти")
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    args = parser.parse_args()
+
+    rows = build_report(load_entries(args.path))
+    if args.flagged:
+        rows = [row for row in rows if row["collscan"] or row["in_memory_sort"]]
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
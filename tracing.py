@@ -0,0 +1,314 @@
+"""Лёгкая трассировка обработки обновлений.
+
+Каждое обновление Telegram получает корневой спан (``trace_update``), внутри
+которого создаются дочерние спаны вызовов ``db_utils``, запросов к
+Konvert2pay и отправки webhook. Текущий спан хранится в ``ContextVar``, поэтому
+он доступен во всех корутинах обработчика, в том числе в задаче,
+созданной ``with_deadline``. Идентификаторы передаются в исходящих запросах
+заголовком ``traceparent`` (W3C Trace Context).
+
+Решение о выборке принимается для корневого спана (``TRACE_SAMPLE_RATE``);
+для невыбранных трасс дочерние спаны не создаются, а заголовок передаётся с
+флагом ``00``. Завершённые спаны экспортирует фоновый поток пачками — в файл
+JSON Lines или в OTLP/HTTP-совместимый коллектор (``/v1/traces``).
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import json
+import logging
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (
+    TRACE_EXPORT_BATCH_SIZE, TRACE_EXPORT_INTERVAL, TRACE_EXPORTER, TRACE_FILE, TRACE_OTLP_ENDPOINT,
+    TRACE_SAMPLE_RATE, TRACE_SERVICE_NAME, TRACING_ENABLED,
+)
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """Интервал работы внутри трассы."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attributes",
+                 "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = repr(exc)
+        _current_span.reset(self._token)
+        if self.sampled and _processor is not None:
+            _processor.submit(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Заглушка для невыбранных трасс и вызовов вне обработки обновления."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def start_trace(name: str, **attributes: Any):
+    """Корневой спан новой трассы с решением о выборке."""
+
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    sampled = random.random() < TRACE_SAMPLE_RATE
+    return Span(name, secrets.token_hex(16), None, sampled, attributes)
+
+
+def span(name: str, **attributes: Any):
+    """Дочерний спан текущей трассы; вне выбранной трассы ничего не делает."""
+
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return _NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, True, attributes)
+
+
+def inject_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Добавить заголовок ``traceparent`` текущей трассы в исходящий запрос."""
+
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent
+    return headers
+
+
+def traced(name: str) -> Callable:
+    """Обернуть синхронную или асинхронную функцию в дочерний спан."""
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_update(handler: Callable) -> Callable:
+    """Открыть корневой спан на время обработки обновления Telegram."""
+
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        user = getattr(update, "effective_user", None)
+        with start_trace(f"telegram.{name}", handler=name, user_id=getattr(user, "id", None)):
+            return await handler(update, context, *args, **kwargs)
+
+    return wrapper
+
+
+class FileSpanExporter:
+    """Запись спанов в файл JSON Lines."""
+
+    def __init__(self, path: Optional[str] = TRACE_FILE):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as fh:
+            for item in spans:
+                fh.write(json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+class OtlpHttpExporter:
+    """Отправка спанов в коллектор по OTLP/HTTP в JSON-кодировке."""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, service_name: str = TRACE_SERVICE_NAME,
+                 timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def encode(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [
+                        {
+                            "traceId": item.trace_id,
+                            "spanId": item.span_id,
+                            "parentSpanId": item.parent_id or "",
+                            "name": item.name,
+                            "kind": 1,
+                            "startTimeUnixNano": str(item.start_ns),
+                            "endTimeUnixNano": str(item.end_ns),
+                            "attributes": [self._attribute(k, v) for k, v in item.attributes.items() if v is not None],
+                            "status": {"code": 2, "message": item.error} if item.error else {"code": 1},
+                        }
+                        for item in spans
+                    ],
+                }],
+            }]
+        }
+
+    def export(self, spans: List[Span]) -> None:
+        body = json.dumps(self.encode(spans), ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchSpanProcessor:
+    """Фоновый экспорт завершённых спанов пачками."""
+
+    def __init__(self, exporter, batch_size: int = TRACE_EXPORT_BATCH_SIZE, interval: float = TRACE_EXPORT_INTERVAL):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Span) -> None:
+        self._queue.put(item)
+
+    def _drain(self, block: bool) -> List[Span]:
+        batch: List[Span] = []
+        try:
+            item = self._queue.get(timeout=self.interval) if block else self._queue.get_nowait()
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return batch
+
+    def _export(self, batch: List[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception as exc:
+            logger.warning("Не удалось экспортировать %s спанов: %s", len(batch), exc)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._export(batch)
+
+    def shutdown(self) -> None:
+        """Остановить поток и экспортировать оставшиеся спаны."""
+
+        self._stopped.set()
+        # None будит поток, ожидающий в _drain
+        self._queue.put(None)
+        self._thread.join(timeout=self.interval + 1)
+        while batch := self._drain(block=False):
+            self._export(batch)
+
+
+_processor: Optional[BatchSpanProcessor] = None
+
+
+def configure_tracing(exporter=None) -> Optional[BatchSpanProcessor]:
+    """Запустить экспорт спанов; без экспортёра он выбирается по ``TRACE_EXPORTER``."""
+
+    global _processor
+    if exporter is None:
+        if not TRACING_ENABLED or TRACE_EXPORTER == "none":
+            return None
+        if TRACE_EXPORTER == "otlp":
+            exporter = OtlpHttpExporter()
+        elif TRACE_FILE:
+            exporter = FileSpanExporter()
+        else:
+            logger.warning("Экспорт спанов в файл не настроен: задайте MERCHANT_BOT_TRACE_FILE")
+            return None
+    _processor = BatchSpanProcessor(exporter)
+    return _processor
+
+
+def shutdown_tracing() -> None:
+    """Экспортировать накопленные спаны и остановить фоновый поток."""
+
+    global _processor
+    if _processor is not None:
+        _processor.shutdown()
+        _processor = None
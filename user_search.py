@@ -0,0 +1,270 @@
+"""Поиск пользователей админом по началу или части username, shop_id и order_id_tag.
+
+``UserSearchIndex`` держит в памяти по каждому полю отсортированный массив
+ключей (в нижнем регистре) с владельцами и триграммный индекс. Поиск по
+началу — ``bisect`` и проход по соседним ключам, O(log n + k); поиск по
+части — кандидаты из самого короткого списка владельцев триграмм запроса с
+проверкой ``in``, а запрос с триграммой, которой нет ни у одного ключа,
+отвечается сразу. На 100k пользователей ответ укладывается в десятки
+микросекунд (``python -m benchmarks run --filter user_search``).
+
+Индекс строится одним чтением ``users`` и ``merchant_settings`` с проекцией в
+пуле потоков. Изменения этого процесса приходят от ``UserManager`` через
+``add_change_listener``: запись пользователя перечитывается по ключу. Изменения
+других процессов бота подхватывает полная перестройка раз в
+``USER_SEARCH_REFRESH`` секунд. Пока индекс не построен, поиск идёт запросом
+к MongoDB с ``$regex``.
+"""
+
+from __future__ import annotations
+
+import bisect
+import itertools
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import USER_SEARCH_LIMIT, USER_SEARCH_REFRESH
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+USER_SEARCHES = Counter(
+    "user_searches_total",
+    "Поиски пользователей админом по источнику ответа",
+    ("source",),
+)
+
+FIELDS = ("username", "shop_id", "order_id_tag")
+# Длина n-грамм индекса поиска по части поля
+GRAM = 3
+
+_USER_PROJECTION = {"user_id": 1, "username": 1, "is_merchant": 1}
+_SETTINGS_PROJECTION = {"shop_id": 1, "order_id_tag": 1}
+
+User = Dict[str, Any]
+
+
+def normalize_query(query: str) -> str:
+    return query.strip().lstrip("@").lower()
+
+
+def _user_record(user: User, settings: Optional[User]) -> User:
+    settings = settings or {}
+    return {
+        "user_id": user.get("user_id"),
+        "username": user.get("username"),
+        "is_merchant": bool(user.get("is_merchant")),
+        "shop_id": settings.get("shop_id"),
+        "order_id_tag": settings.get("order_id_tag"),
+    }
+
+
+def _trigrams(key: str) -> Set[str]:
+    return {key[start:start + GRAM] for start in range(len(key) - GRAM + 1)}
+
+
+class SortedKeys:
+    """Ключи одного поля: отсортированный массив для поиска по началу и триграммы для поиска по части."""
+
+    def __init__(self, pairs: List[Tuple[str, Any]] = ()):
+        pairs = sorted(pairs, key=lambda pair: pair[0])
+        self.keys: List[str] = [key for key, _ in pairs]
+        self.owners: List[Any] = [owner for _, owner in pairs]
+        self._key_of: Dict[Any, str] = {owner: key for key, owner in pairs}
+        self._grams: Dict[str, List[Any]] = {}
+        for key, owner in pairs:
+            for gram in _trigrams(key):
+                self._grams.setdefault(gram, []).append(owner)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, owner: Any) -> None:
+        index = bisect.bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.owners.insert(index, owner)
+        self._key_of[owner] = key
+        for gram in _trigrams(key):
+            self._grams.setdefault(gram, []).append(owner)
+
+    def remove(self, key: str, owner: Any) -> None:
+        index = bisect.bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.owners[index] == owner:
+                del self.keys[index], self.owners[index]
+                break
+            index += 1
+        if self._key_of.pop(owner, None) is not None:
+            for gram in _trigrams(key):
+                postings = self._grams[gram]
+                postings.remove(owner)
+                if not postings:
+                    del self._grams[gram]
+
+    def prefix(self, query: str) -> Iterator[Any]:
+        index = bisect.bisect_left(self.keys, query)
+        while index < len(self.keys) and self.keys[index].startswith(query):
+            yield self.owners[index]
+            index += 1
+
+    def substring(self, query: str) -> Iterator[Any]:
+        if len(query) < GRAM:
+            # Короткий запрос: триграмм нет, проход по всем ключам
+            for key, owner in zip(self.keys, self.owners):
+                if query in key:
+                    yield owner
+            return
+        postings = []
+        for gram in _trigrams(query):
+            owners = self._grams.get(gram)
+            if owners is None:
+                return
+            postings.append(owners)
+        # Кандидаты — владельцы самой редкой триграммы запроса, проверяются по ключу
+        key_of = self._key_of
+        for owner in min(postings, key=len):
+            if query in key_of[owner]:
+                yield owner
+
+
+class UserSearchIndex:
+    """Индекс поиска пользователей в памяти с запасным поиском в MongoDB."""
+
+    def __init__(self, user_manager, refresh: float = USER_SEARCH_REFRESH, limit: int = USER_SEARCH_LIMIT):
+        self.user_manager = user_manager
+        self.users = user_manager.users
+        self.merchant_settings = user_manager.merchant_settings
+        self.refresh = refresh
+        self.limit = limit
+        self._records: Dict[Any, User] = {}
+        self._fields: Dict[str, SortedKeys] = {field: SortedKeys() for field in FIELDS}
+        self._lock = threading.Lock()
+        self._built_at: Optional[float] = None
+        self._building = False
+        # Пользователи, изменённые во время перестройки: перечитываются после неё
+        self._changed_during_build: Set[Any] = set()
+        user_manager.add_change_listener(self.reload_user)
+
+    @property
+    def ready(self) -> bool:
+        return self._built_at is not None
+
+    @property
+    def building(self) -> bool:
+        return self._building
+
+    def rebuild(self) -> int:
+        """Построить индекс заново по базе; возвращает число пользователей."""
+
+        with self._lock:
+            if self._building:
+                return len(self._records)
+            self._building = True
+            self._changed_during_build = set()
+        try:
+            settings = {document["_id"]: document for document in self.merchant_settings.find({}, _SETTINGS_PROJECTION)}
+            records = {
+                user["_id"]: _user_record(user, settings.get(user["_id"]))
+                for user in self.users.find({}, _USER_PROJECTION)
+            }
+            fields = {
+                field: SortedKeys([
+                    (record[field].lower(), key) for key, record in records.items() if record.get(field)
+                ])
+                for field in FIELDS
+            }
+            with self._lock:
+                self._records, self._fields = records, fields
+                self._built_at = time.monotonic()
+                changed, self._changed_during_build = self._changed_during_build, set()
+        finally:
+            with self._lock:
+                self._building = False
+        for user_key in changed:
+            self.reload_user(user_key)
+        logger.info("Индекс поиска пользователей построен: %s пользователей", len(records))
+        return len(records)
+
+    def reload_user(self, user_key: Any) -> None:
+        """Перечитать пользователя из базы после изменения (обработчик ``UserManager``)."""
+
+        user = self.users.find_one({"_id": user_key}, _USER_PROJECTION)
+        settings = self.merchant_settings.find_one({"_id": user_key}, _SETTINGS_PROJECTION) if user else None
+        with self._lock:
+            if self._building:
+                self._changed_during_build.add(user_key)
+            previous = self._records.pop(user_key, None)
+            if previous is not None:
+                for field in FIELDS:
+                    if previous.get(field):
+                        self._fields[field].remove(previous[field].lower(), user_key)
+            if user is not None:
+                record = _user_record(user, settings)
+                self._records[user_key] = record
+                for field in FIELDS:
+                    if record.get(field):
+                        self._fields[field].add(record[field].lower(), user_key)
+
+    def is_stale(self) -> bool:
+        return self._built_at is None or time.monotonic() - self._built_at >= self.refresh
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[User]:
+        """Пользователи, у которых поле начинается с ``query``, затем — содержит его.
+
+        Вызывается только после построения индекса (``ready``).
+        """
+
+        query = normalize_query(query)
+        USER_SEARCHES.inc("memory")
+        if not query:
+            return []
+        limit = limit or self.limit
+        found: Dict[Any, None] = {}
+        with self._lock:
+            matches = itertools.chain.from_iterable(
+                getattr(self._fields[field], matcher)(query)
+                for matcher in ("prefix", "substring") for field in FIELDS
+            )
+            for owner in matches:
+                found[owner] = None
+                if len(found) >= limit:
+                    break
+            return [dict(self._records[owner]) for owner in found]
+
+    def search_database(self, query: str, limit: Optional[int] = None) -> List[User]:
+        """Тот же поиск запросом к MongoDB, пока индекс не построен."""
+
+        query = normalize_query(query)
+        limit = limit or self.limit
+        USER_SEARCHES.inc("database")
+        if not query:
+            return []
+        pattern = {"$regex": re.escape(query), "$options": "i"}
+        settings = {
+            document["_id"]: document
+            for document in self.merchant_settings.find(
+                {"$or": [{"shop_id": pattern}, {"order_id_tag": pattern}]}, _SETTINGS_PROJECTION, limit=limit,
+            )
+        }
+        username_query: Dict[str, Any] = {"username_keys": {"$regex": re.escape(query)}}
+        if self.user_manager.legacy_username_lookup:
+            username_query = {"$or": [username_query, {"username": pattern}]}
+        users = {user["_id"]: user for user in self.users.find(username_query, _USER_PROJECTION, limit=limit)}
+        missing_users = [key for key in settings if key not in users]
+        if missing_users:
+            users.update((user["_id"], user) for user in self.users.find({"_id": {"$in": missing_users}}, _USER_PROJECTION))
+        missing_settings = [key for key in users if key not in settings]
+        if missing_settings:
+            settings.update(
+                (document["_id"], document)
+                for document in self.merchant_settings.find({"_id": {"$in": missing_settings}}, _SETTINGS_PROJECTION)
+            )
+        records = [_user_record(user, settings.get(key)) for key, user in users.items()]
+        # Совпадения по началу поля — первыми, как в поиске по индексу
+        records.sort(key=lambda record: not any(
+            str(record.get(field) or "").lower().startswith(query) for field in FIELDS
+        ))
+        return records[:limit]
@@ -0,0 +1,143 @@
+"""Локальная проверка полей заказа до обращения к Konvert2pay.
+
+Каждое правило принимает строку из ввода мерчанта, возвращает нормализованное
+значение или выбрасывает ``ValidationError`` с понятным мерчанту текстом.
+Правила проверяют IBAN Украины (длина и контрольная сумма mod 97), РНОКПП
+(формат и контрольная цифра) и суммы (``money.Money``, ограничение разрядов).
+Пошаговые сценарии создания инвойса и выплаты проверяют каждое поле сразу
+после ввода, поэтому неверные данные не доходят до Konvert2pay.
+``validate_row`` применяет набор правил к строке файла и собирает все ошибки
+сразу, чтобы мерчант исправил файл за один раз.
+"""
+
+from __future__ import annotations
+
+import operator
+import re
+import string
+from typing import Any, Callable, Dict, List, Mapping, Tuple
+
+from money import DECIMALS, SCALE, Money
+
+# IBAN Украины: UA, 2 контрольные цифры, 6 цифр МФО банка и 19 цифр счёта
+IBAN_UA_LENGTH = 29
+# РНОКПП (ИНН физического лица): 9 цифр и контрольная
+INN_LENGTH = 10
+# Сумма: до 9 цифр целой части и до 2 знаков после запятой
+AMOUNT_INTEGER_DIGITS = 9
+AMOUNT_DECIMALS = DECIMALS
+
+# Правила компилируются один раз при импорте модуля
+_IBAN_UA = re.compile(rf"UA\d{{{IBAN_UA_LENGTH - 2}}}")
+_INN = re.compile(rf"\d{{{INN_LENGTH}}}")
+_AMOUNT = re.compile(rf"(\d{{1,{AMOUNT_INTEGER_DIGITS}}})(?:[.,](\d{{1,{AMOUNT_DECIMALS}}}))?")
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+# Пробелы-разделители разрядов, в том числе неразрывные, как их вставляют банковские приложения
+_SEPARATORS = str.maketrans("", "", " \u00a0\u202f")
+# Буква IBAN -> число (A=10 … Z=35) по ISO 13616
+_IBAN_LETTERS = str.maketrans({letter: str(index) for index, letter in enumerate(string.ascii_uppercase, 10)})
+_INN_WEIGHTS = (-1, 5, 7, 9, 4, 6, 10, 5, 7)
+
+
+class ValidationError(ValueError):
+    """Значение поля не прошло проверку."""
+
+
+def iban_checksum_valid(iban: str) -> bool:
+    """Контрольная сумма IBAN по ISO 13616 (mod 97)."""
+
+    return int((iban[4:] + iban[:4]).translate(_IBAN_LETTERS)) % 97 == 1
+
+
+def inn_checksum_valid(inn: str) -> bool:
+    """Контрольная цифра РНОКПП: взвешенная сумма первых 9 цифр по модулю 11, затем 10."""
+
+    total = sum(map(operator.mul, _INN_WEIGHTS, map(int, inn)))
+    return total % 11 % 10 == int(inn[9])
+
+
+def validate_iban(value: str) -> str:
+    iban = value.translate(_SEPARATORS).upper()
+    if not _IBAN_UA.fullmatch(iban):
+        raise ValidationError(f"IBAN должен начинаться с UA и содержать {IBAN_UA_LENGTH} символов")
+    if not iban_checksum_valid(iban):
+        raise ValidationError("неверная контрольная сумма IBAN")
+    return iban
+
+
+def validate_inn(value: str) -> str:
+    inn = value.translate(_SEPARATORS)
+    if not _INN.fullmatch(inn):
+        raise ValidationError(f"ИНН должен состоять из {INN_LENGTH} цифр")
+    if not inn_checksum_valid(inn):
+        raise ValidationError("неверная контрольная цифра ИНН")
+    return inn
+
+
+def validate_amount(value: str) -> Money:
+    """Положительная сумма в копейках.
+
+    Допускаются десятичная запятая и пробелы между разрядами.
+    """
+
+    text = value.translate(_SEPARATORS)
+    match = _AMOUNT.fullmatch(text)
+    if match is None:
+        if not _NUMBER.fullmatch(text):
+            raise ValidationError("неверная сумма")
+        if text.startswith("-"):
+            raise ValidationError("сумма должна быть больше нуля")
+        if len(re.split(r"[.,]", text)[0]) > AMOUNT_INTEGER_DIGITS:
+            raise ValidationError("слишком большая сумма")
+        raise ValidationError(f"не больше {AMOUNT_DECIMALS} знаков после запятой")
+    integer, fraction = match.groups()
+    amount = Money(int(integer) * SCALE + int((fraction or "").ljust(AMOUNT_DECIMALS, "0")))
+    if not amount:
+        raise ValidationError("сумма должна быть больше нуля")
+    return amount
+
+
+def required(value: str) -> str:
+    """Обязательное текстовое поле."""
+
+    if not value.strip():
+        raise ValidationError("не указано")
+    return value.strip()
+
+
+def optional(value: str) -> str:
+    return value.strip()
+
+
+Rules = Mapping[str, Callable[[str], Any]]
+
+INVOICE_ROW_RULES: Rules = {
+    "order_id": optional,
+    "client_id": required,
+    "amount": validate_amount,
+}
+
+PAYOUT_ROW_RULES: Rules = {
+    "order_id": optional,
+    "client_id": required,
+    "iban": validate_iban,
+    "inn": validate_inn,
+    "surname": required,
+    "name": required,
+    "middlename": optional,
+    "purpose": required,
+    "amount": validate_amount,
+}
+
+
+def validate_row(row: Mapping[str, str], rules: Rules) -> Tuple[Dict[str, Any], List[str]]:
+    """Нормализованные значения строки и список ошибок по всем полям."""
+
+    values: Dict[str, Any] = {}
+    errors: List[str] = []
+    for field, rule in rules.items():
+        try:
+            values[field] = rule(row.get(field) or "")
+        except ValidationError as exc:
+            errors.append(f"{field}: {exc}")
+    return values, errors
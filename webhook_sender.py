@@ -2,20 +2,53 @@
 Модуль для отправки webhook уведомлений
 """
 import aiohttp
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime
-from config import WEBHOOK_URL
+from config import WEBHOOK_URL, WEBHOOK_TIMEOUT
+from deadline import DeadlineExceeded, client_timeout
+from metrics import Counter, Histogram
+from shutdown import coordinator
+from tracing import inject_headers, span
 
 logger = logging.getLogger(__name__)
 
+WEBHOOK_DELIVERY_LATENCY = Histogram(
+    "webhook_delivery_duration_seconds",
+    "Длительность отправки webhook уведомлений",
+    ("outcome",),
+)
+WEBHOOK_DELIVERIES = Counter(
+    "webhook_deliveries_total",
+    "Результаты отправки webhook уведомлений по типам событий",
+    ("event_type", "outcome"),
+)
+
 class WebhookSender:
     """Класс для отправки webhook уведомлений"""
+
+    _session = None
+
+    @classmethod
+    def get_session(cls):
+        """Общая сессия с пулом соединений к получателю webhook"""
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession()
+        return cls._session
+
+    @classmethod
+    async def close(cls):
+        """Закрыть общую сессию"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
     
     @staticmethod
-    async def send_invoice_webhook(invoice_data, result, user_info):
-        """Отправка webhook для создания инвойса"""
-        webhook_data = {
+    def build_invoice_payload(invoice_data, result, user_info):
+        """Данные webhook о создании инвойса"""
+        return {
             "event_type": "invoice_created",
             "timestamp": datetime.now().isoformat(),
             "user_info": {
@@ -27,13 +60,11 @@ class WebhookSender:
             "api_result": result,
             "status": "success" if result.get('Success') else "error"
         }
-        
-        return await WebhookSender._send_webhook(webhook_data)
     
     @staticmethod
-    async def send_payout_webhook(payout_data, result, user_info):
-        """Отправка webhook для создания выплаты"""
-        webhook_data = {
+    def build_payout_payload(payout_data, result, user_info):
+        """Данные webhook о создании выплаты"""
+        return {
             "event_type": "payout_created",
             "timestamp": datetime.now().isoformat(),
             "user_info": {
@@ -45,13 +76,11 @@ class WebhookSender:
             "api_result": result,
             "status": "success" if result.get('Success') else "error"
         }
-        
-        return await WebhookSender._send_webhook(webhook_data)
     
     @staticmethod
-    async def send_user_action_webhook(action_type, user_info, additional_data=None):
-        """Отправка webhook для действий пользователя"""
-        webhook_data = {
+    def build_user_action_payload(action_type, user_info, additional_data=None):
+        """Данные webhook о действии пользователя"""
+        return {
             "event_type": f"user_{action_type}",
             "timestamp": datetime.now().isoformat(),
             "user_info": {
@@ -61,26 +90,62 @@ class WebhookSender:
             },
             "action_data": additional_data or {}
         }
-        
+    
+    @staticmethod
+    async def send_invoice_webhook(invoice_data, result, user_info):
+        """Отправка webhook для создания инвойса"""
+        webhook_data = WebhookSender.build_invoice_payload(invoice_data, result, user_info)
+        return await WebhookSender._send_webhook(webhook_data)
+    
+    @staticmethod
+    async def send_payout_webhook(payout_data, result, user_info):
+        """Отправка webhook для создания выплаты"""
+        webhook_data = WebhookSender.build_payout_payload(payout_data, result, user_info)
+        return await WebhookSender._send_webhook(webhook_data)
+    
+    @staticmethod
+    async def send_user_action_webhook(action_type, user_info, additional_data=None):
+        """Отправка webhook для действий пользователя"""
+        webhook_data = WebhookSender.build_user_action_payload(action_type, user_info, additional_data)
         return await WebhookSender._send_webhook(webhook_data)
     
     @staticmethod
     async def _send_webhook(data):
         """Отправка webhook данных"""
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    WEBHOOK_URL,
-                    json=data,
-                    headers={'Content-Type': 'application/json'},
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        logger.info(f"Webhook отправлен успешно: {data.get('event_type')}")
-                        return True
-                    else:
-                        logger.warning(f"Webhook вернул статус {response.status}: {data.get('event_type')}")
-                        return False
-        except Exception as e:
-            logger.error(f"Ошибка отправки webhook: {e}")
-            return False
+        event_type = data.get('event_type', 'unknown')
+        order_id = (data.get('invoice_data') or data.get('payout_data') or {}).get('order_id')
+        with span(f"webhook {event_type}", event_type=event_type) as current:
+            # Остановка бота дождётся доставки или запишет прерванную отправку
+            async with coordinator.track("webhook", event_type=event_type, order_id=order_id):
+                started = time.monotonic()
+                outcome = "error"
+                try:
+                    async with WebhookSender.get_session().post(
+                        WEBHOOK_URL,
+                        json=data,
+                        headers=inject_headers({'Content-Type': 'application/json'}),
+                        timeout=client_timeout(WEBHOOK_TIMEOUT)
+                    ) as response:
+                        if response.status == 200:
+                            outcome = "delivered"
+                            logger.info("Webhook отправлен успешно: %s", event_type)
+                            return True
+                        else:
+                            outcome = "rejected"
+                            logger.warning("Webhook вернул статус %s: %s", response.status, event_type)
+                            return False
+                except DeadlineExceeded:
+                    outcome = "deadline"
+                    logger.error("Webhook не отправлен: бюджет времени обработки исчерпан (%s)", event_type)
+                    return False
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                    logger.error("Таймаут отправки webhook: %s", event_type)
+                    return False
+                except Exception as e:
+                    logger.error("Ошибка отправки webhook: %s", e)
+                    return False
+                finally:
+                    WEBHOOK_DELIVERY_LATENCY.observe(time.monotonic() - started, outcome)
+                    WEBHOOK_DELIVERIES.inc(event_type, outcome)
+                    current.set_attribute("outcome", outcome)